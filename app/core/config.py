@@ -1,20 +1,23 @@
 import os
 import json
-import boto3
-from botocore.exceptions import ClientError
+from typing import Dict, Optional
+from pydantic import PrivateAttr
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
+from app.core.secrets import refresh_if_stale, resolve_secrets
 
-def _get_secret(arn: str) -> str:
-    """Secrets ManagerからARNを指定してシークレット値を取得する"""
-    region = os.getenv("AWS_REGION", "ap-northeast-1")
-    client = boto3.client("secretsmanager", region_name=region)
-    try:
-        response = client.get_secret_value(SecretId=arn)
-        return response["SecretString"]
-    except ClientError as e:
-        raise RuntimeError(f"Failed to retrieve secret {arn}: {e}") from e
+# Lambda 上で動いているか（Lambda ランタイムが設定する環境変数で判定する）。
+# 呼び出しが返るとプロセスが凍結されるので、リクエストをまたいでメモリに溜める処理は既定で無効にする
+RUNNING_ON_LAMBDA = bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+# Secrets Manager から取得する項目と、ARNを渡す環境変数
+SECRET_ARN_ENV = {
+    "SUPABASE_SERVICE_ROLE_KEY": "SUPABASE_SERVICE_ROLE_KEY_ARN",
+    "NOTION_TOKEN": "NOTION_TOKEN_ARN",
+    "CRON_SECRET": "CRON_SECRET_ARN",
+    "NOTION_WEBHOOK_SECRET": "NOTION_WEBHOOK_SECRET_ARN",
+}
 
 
 class Settings(BaseSettings):
@@ -22,23 +25,68 @@ class Settings(BaseSettings):
     SUPABASE_SERVICE_ROLE_KEY: str = ""
     NOTION_TOKEN: str = ""
     NOTION_DB_ID: str = ""
+    # Notion API のベースURL（ローカルの scripts/notion_replay.py に向けるときに変更する）
+    NOTION_API_BASE_URL: str = "https://api.notion.com/v1"
+    # Notion webhook の verification_token（X-Notion-Signature の検証に使う。空なら webhook を受け付けない）
+    NOTION_WEBHOOK_SECRET: str = ""
+    # 同じページへの webhook をまとめる時間窓（秒。0 ならまとめずにすぐ反映する）。
+    # 未設定なら Lambda 上では 0（Mangum はレスポンスを返す前にバックグラウンドタスクを実行するので、
+    # 窓の分だけ webhook の応答が遅れ、呼び出しをまたいでまとめることもできないため）、それ以外は 2.0
+    NOTION_WEBHOOK_COALESCE_SECONDS: Optional[float] = None
+    # 受け取った webhook の生ボディを1行ずつ追記するファイル（リプレイ用の記録。空なら記録しない）
+    NOTION_WEBHOOK_RECORD_PATH: str = ""
     CRON_SECRET: str = ""
     ALLOWED_ORIGINS: str = "http://localhost:3000,https://hostage-app.vercel.app"
+    # CRON 1回の呼び出しで使う時間予算（秒）。Lambdaの30秒タイムアウトより短くする
+    CRON_TIME_BUDGET_SECONDS: float = 25.0
+    # 日次ダメージの計算エンジン: "python"（バルクエンジン） / "rpc"（DB関数 apply_daily_damage）
+    DAMAGE_ENGINE: str = "python"
+    # GET /pets/{user_id} 用のペット状態キャッシュ
+    PET_CACHE_MAX_ENTRIES: int = 2048
+    PET_CACHE_TTL_SECONDS: float = 30.0
+    # 上流API（Supabase / Notion）への共有接続プール
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    # HTTP/2 で接続する上流（カンマ区切り: "supabase,notion"）。StreamReset 時は自動でHTTP/1.1に戻す
+    HTTP2_UPSTREAMS: str = ""
+    # Notion API のレート制限（インテグレーションごとに平均 約3リクエスト/秒）
+    NOTION_REQUESTS_PER_SECOND: float = 3.0
+    NOTION_BURST: int = 3
+    # 429・5xx・接続エラーの再送回数とバックオフ（秒）
+    NOTION_MAX_RETRIES: int = 5
+    NOTION_BACKOFF_BASE_SECONDS: float = 0.5
+    NOTION_BACKOFF_MAX_SECONDS: float = 30.0
+    # pets の compare-and-swap が競合したときに読み直して再計算する回数の上限
+    PET_CAS_MAX_RETRIES: int = 5
+    # 同じペットへのタスク完了・習慣完了の書き込みをまとめる時間窓（秒）。既定の 0 ではまとめずに書き込む。
+    # まとめる場合、タスクの完了は先に確定し、回復は窓が閉じるまでプロセスのメモリにしかないので、
+    # その間にプロセスが落ちる（デプロイ・Lambda の凍結と破棄）と回復が失われる。失ってよい環境でだけ設定すること
+    PET_WRITE_COALESCE_SECONDS: float = 0.0
+    PET_WRITE_MAX_PENDING: int = 500
+
+    # 項目名 -> Secrets Manager の ARN（*_ARN が設定されている項目のみ）
+    _secret_arns: Dict[str, str] = PrivateAttr(default_factory=dict)
 
     def model_post_init(self, __context) -> None:
         """
         環境変数に *_ARN suffix がある場合はSecrets Managerから値を取得する。
         ない場合は従来通り環境変数の値をそのまま使う（ローカル開発・Railway互換）。
+
+        複数のARNは1回の一括取得で解決し、/tmp のキャッシュがあればネットワークに出ない
+        （app.core.secrets を参照）。
         """
-        mappings = {
-            "SUPABASE_SERVICE_ROLE_KEY": "SUPABASE_SERVICE_ROLE_KEY_ARN",
-            "NOTION_TOKEN": "NOTION_TOKEN_ARN",
-            "CRON_SECRET": "CRON_SECRET_ARN",
+        if self.NOTION_WEBHOOK_COALESCE_SECONDS is None:
+            self.NOTION_WEBHOOK_COALESCE_SECONDS = 0.0 if RUNNING_ON_LAMBDA else 2.0
+
+        self._secret_arns = {
+            field: os.environ[arn_env]
+            for field, arn_env in SECRET_ARN_ENV.items()
+            if os.getenv(arn_env)
         }
-        for field, arn_env in mappings.items():
-            arn = os.getenv(arn_env)
-            if arn:
-                object.__setattr__(self, field, _get_secret(arn))
+        if self._secret_arns:
+            values = resolve_secrets(list(self._secret_arns.values()), on_refresh=self._apply_secrets)
+            self._apply_secrets(values)
 
         # fail-closed: 認証に使う値が空のままでは起動させない
         required = {
@@ -53,6 +101,22 @@ class Settings(BaseSettings):
                 "Set the value directly via environment variable, or set the corresponding *_ARN variable."
             )
 
+    def _apply_secrets(self, values: Dict[str, str]) -> None:
+        for field, arn in self._secret_arns.items():
+            if arn in values:
+                object.__setattr__(self, field, values[arn])
+
+    def refresh_secrets_if_stale(self) -> bool:
+        """
+        キャッシュのTTLを過ぎていればバックグラウンドでシークレットを取り直す（ローテーション対応）。
+
+        取り直した値は CRON_SECRET のように参照のたびに settings から読む箇所には即座に反映される。
+        起動時に値を取り込んだクライアント（Supabase / Notion）は次に作られるものから反映される。
+        """
+        if not self._secret_arns:
+            return False
+        return refresh_if_stale(list(self._secret_arns.values()), on_refresh=self._apply_secrets)
+
     class Config:
         env_file = ".env"
         extra = "ignore"
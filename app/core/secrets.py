@@ -0,0 +1,217 @@
+"""
+Secrets Manager からのシークレット取得（一括取得 + /tmp キャッシュ）
+
+コールドスタートでは *_ARN のシークレットを1回の BatchGetSecretValue でまとめて取得する
+（権限がない・未対応の場合は1つの共有クライアントで GetSecretValue を並行に呼ぶ）。
+
+取得した値は /tmp のファイル（パーミッション 0600）に TTL 付きで保存し（所有者・パーミッションが違うファイルは読まない）、
+同じ実行環境での再起動・後続の呼び出しではネットワークに出ない。
+TTL を過ぎたキャッシュはそのまま使いつつ、バックグラウンドで取り直す（ローテーション対応）。
+
+環境変数:
+- SECRETS_CACHE_PATH: キャッシュファイルのパス（空文字でキャッシュ無効）
+- SECRETS_CACHE_TTL_SECONDS: キャッシュの有効期間（秒）
+- SECRETS_MANAGER_ENDPOINT_URL: Secrets Manager のエンドポイント（ローカルのスタブ用）
+"""
+
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "hostage-secrets.json")
+DEFAULT_CACHE_TTL_SECONDS = 300.0
+
+# BatchGetSecretValue の SecretIdList の上限
+BATCH_LIMIT = 20
+# バックグラウンドの取り直しに失敗したとき、次に試すまでの秒数
+REFRESH_RETRY_SECONDS = 30.0
+
+_refresh_lock = threading.Lock()
+# 現在使っている値を取得した時刻（refresh_if_stale の判定用。毎回ファイルを読まない）
+_fetched_at = 0.0
+
+
+def _cache_path() -> str:
+    return os.getenv("SECRETS_CACHE_PATH", DEFAULT_CACHE_PATH)
+
+
+def _cache_ttl() -> float:
+    return float(os.getenv("SECRETS_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS))
+
+
+@lru_cache(maxsize=1)
+def secrets_client():
+    """
+    Secrets Managerクライアント（初回呼び出し時に作成し、以降は共有する）
+
+    boto3 の import とクライアント生成は重いので、*_ARN を使わない環境では読み込まない。
+    boto3 のクライアントはスレッドセーフなので並行取得でも1つを使い回す。
+    """
+    import boto3
+    region = os.getenv("AWS_REGION", "ap-northeast-1")
+    endpoint_url = os.getenv("SECRETS_MANAGER_ENDPOINT_URL") or None
+    return boto3.client("secretsmanager", region_name=region, endpoint_url=endpoint_url)
+
+
+def _get_secret(arn: str) -> str:
+    """Secrets ManagerからARNを指定してシークレット値を取得する"""
+    from botocore.exceptions import ClientError
+    try:
+        response = secrets_client().get_secret_value(SecretId=arn)
+        return response["SecretString"]
+    except ClientError as e:
+        raise RuntimeError(f"Failed to retrieve secret {arn}: {e}") from e
+
+
+def _batch_get(arns: List[str]) -> Dict[str, str]:
+    """BatchGetSecretValue でまとめて取得する（取得できなかったものは結果に含まれない）"""
+    values: Dict[str, str] = {}
+    for i in range(0, len(arns), BATCH_LIMIT):
+        chunk = arns[i:i + BATCH_LIMIT]
+        response = secrets_client().batch_get_secret_value(SecretIdList=chunk)
+        for secret in response.get("SecretValues", []):
+            # ARN・名前のどちらで指定されていても対応付けられるようにする
+            for arn in chunk:
+                if arn in (secret.get("ARN"), secret.get("Name")) and "SecretString" in secret:
+                    values[arn] = secret["SecretString"]
+    return values
+
+
+def fetch_secrets(arns: List[str]) -> Dict[str, str]:
+    """
+    ARNのリストからシークレット値を取得する（キャッシュは見ない）
+
+    BatchGetSecretValue が使えない（権限なし等）か一部が取得できなかった場合は、
+    残りを GetSecretValue で並行に取得する。失敗したものは RuntimeError になる。
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    arns = sorted(set(arns))
+    if not arns:
+        return {}
+
+    try:
+        values = _batch_get(arns)
+    except (BotoCoreError, ClientError):
+        values = {}
+
+    missing = [arn for arn in arns if arn not in values]
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            values.update(zip(missing, pool.map(_get_secret, missing)))
+    return values
+
+
+def _read_cache(path: str) -> Optional[dict]:
+    """
+    キャッシュファイルを読む（自分が所有し、パーミッションが 0600 の通常ファイルのときだけ）
+
+    /tmp は他のユーザーからも書けるので、他人が置いたファイル・シンボリックリンクの値は使わない。
+    判定は開いたファイルに対して行う（stat と open の間に差し替えられないように）。
+    O_NONBLOCK は FIFO が置かれていても open で止まらないようにするため。
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK | getattr(os, "O_NOFOLLOW", 0))
+    except OSError:
+        return None
+    try:
+        with os.fdopen(fd, "r", encoding="utf-8") as f:
+            st = os.fstat(f.fileno())
+            if not stat.S_ISREG(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o600:
+                return None
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("values"), dict):
+        return None
+    return data
+
+
+def _write_cache(path: str, values: Dict[str, str]) -> None:
+    """所有者のみ読み書きできるファイルに書き込む（一時ファイル + rename でアトミックに置き換え）"""
+    directory = os.path.dirname(path) or "."
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=".secrets-", dir=directory)
+        try:
+            os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": time.time(), "values": values}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        # キャッシュは最適化なので、書けなくても起動は続ける
+        pass
+
+
+def _refresh(arns: List[str], path: str, on_refresh: Optional[Callable[[Dict[str, str]], None]]) -> None:
+    global _fetched_at
+    if not _refresh_lock.acquire(blocking=False):
+        return  # 別スレッドが取り直し中
+    try:
+        values = fetch_secrets(arns)
+        _fetched_at = time.time()
+        if path:
+            _write_cache(path, values)
+        if on_refresh is not None:
+            on_refresh(values)
+    except Exception as e:
+        # 古い値のまま動かし続け、REFRESH_RETRY_SECONDS 後に再試行する
+        print(f"⚠ Secrets refresh failed: {e}")
+        _fetched_at = max(_fetched_at, time.time() - _cache_ttl() + REFRESH_RETRY_SECONDS)
+    finally:
+        _refresh_lock.release()
+
+
+def resolve_secrets(
+    arns: List[str],
+    on_refresh: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> Dict[str, str]:
+    """
+    ARN -> 値 の辞書を返す。
+
+    - キャッシュが TTL 内で全ARNを含む: キャッシュの値を返す（ネットワークなし）
+    - キャッシュが TTL 切れ: キャッシュの値を返し、バックグラウンドで取り直して on_refresh を呼ぶ
+    - キャッシュなし・ARNが足りない: その場で取得してキャッシュに書く
+    """
+    global _fetched_at
+    arns = sorted(set(arns))
+    if not arns:
+        return {}
+
+    path = _cache_path()
+    cached = _read_cache(path) if path else None
+    if cached is not None and all(arn in cached["values"] for arn in arns):
+        _fetched_at = float(cached.get("fetched_at", 0))
+        refresh_if_stale(arns, on_refresh)
+        return {arn: cached["values"][arn] for arn in arns}
+
+    values = fetch_secrets(arns)
+    _fetched_at = time.time()
+    if path:
+        _write_cache(path, values)
+    return values
+
+
+def refresh_if_stale(
+    arns: List[str],
+    on_refresh: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> bool:
+    """
+    使っている値が TTL を過ぎていればバックグラウンドで取り直す（取り直しを始めたら True）
+
+    時刻の比較だけなので、リクエストごとに呼んでもよい。
+    """
+    if not arns or time.time() - _fetched_at <= _cache_ttl() or _refresh_lock.locked():
+        return False
+    threading.Thread(
+        target=_refresh, args=(sorted(set(arns)), _cache_path(), on_refresh), daemon=True
+    ).start()
+    return True
@@ -1,9 +1,31 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import pets, habits, sync, tasks, daily_habits
+from app.routers import pets, habits, sync, tasks, daily_habits, webhooks
 from app.core.config import settings
+from app.services.supabase import get_async_client, close_async_client
+from app.services.write_behind import flush_all, evolution_buffer, pet_event_buffer
+from app.services.pet_cache import pet_cache
+from app.services.pet_writes import pet_write_stats
+from app.services.transport import close_transports, transport_stats
+from app.services.notion_scheduler import notion_scheduler
+from app.services.notion import get_notion_service
+from app.services.notion_webhook import webhook_queue
 
-app = FastAPI(title="HOSTAGE MVP")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 終了時に遅延書き込みバッファを出し切る
+    await flush_all(get_async_client())
+    if webhook_queue.pending():
+        await webhook_queue.flush(get_async_client(), get_notion_service(), force=True)
+    await close_async_client()
+    close_transports()
+
+
+app = FastAPI(title="HOSTAGE MVP", lifespan=lifespan)
 
 # CORS設定（環境変数で本番/開発を切り替え）
 allowed_origins = settings.ALLOWED_ORIGINS.split(",")
@@ -20,11 +42,46 @@ app.add_middleware(
 def read_root():
     return {"message": "HOSTAGE System Online", "status": "ALIVE"}
 
+@app.get("/metrics")
+def read_metrics():
+    """プロセス内のキャッシュ・バッファの統計（インスタンスごとの値）"""
+    return {
+        "pet_cache": pet_cache.stats(),
+        "pet_writes": pet_write_stats.stats(),
+        "evolution_buffer": {
+            "pending": evolution_buffer.pending(),
+            "flushes": evolution_buffer.flushes,
+            "flushed_rows": evolution_buffer.flushed_rows,
+        },
+        "pet_event_buffer": pet_event_buffer.stats(),
+        "transport": transport_stats(),
+        "notion_scheduler": notion_scheduler.stats(),
+        "notion_webhooks": webhook_queue.stats(),
+    }
+
 app.include_router(pets.router)
 app.include_router(habits.router)
 app.include_router(sync.router)
 app.include_router(tasks.router)
 app.include_router(daily_habits.router)
+app.include_router(webhooks.router)
 
 from mangum import Mangum
-handler = Mangum(app, lifespan="off")
+_mangum_handler = Mangum(app, lifespan="off")
+
+
+async def _flush_write_buffers() -> None:
+    await flush_all(get_async_client())
+
+
+def handler(event, context):
+    """Lambdaエントリポイント（シークレットのキャッシュが古ければバックグラウンドで取り直す）"""
+    settings.refresh_secrets_if_stale()
+    response = _mangum_handler(event, context)
+    # 返した後はプロセスが凍結される（次の呼び出しが来ないまま破棄されることもある）ので、
+    # 溜めた書き込みは Mangum と同じイベントループでここで出し切る。
+    # ペットへのイベントは既定でまとめない（PET_WRITE_COALESCE_SECONDS=0）ので、
+    # ここで書き出すのは進化と、明示的にまとめる設定にした場合のイベントだけ
+    if pet_event_buffer.pending() or evolution_buffer.pending():
+        asyncio.get_event_loop().run_until_complete(_flush_write_buffers())
+    return response
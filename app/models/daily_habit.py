@@ -5,8 +5,8 @@
 """
 
 from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 from uuid import UUID
 
 
@@ -35,10 +35,21 @@ class DailyHabitResponse(DailyHabitBase):
         from_attributes = True  # Pydantic V2 compatibility
 
 
+class DailyHabitListItem(BaseModel):
+    """日次習慣一覧の1行（fields で射影した場合は指定した列だけを返す）"""
+    id: UUID
+    user_id: Optional[UUID] = None
+    title: Optional[str] = None
+    streak: Optional[int] = None
+    last_completed_at: Optional[datetime] = None
+    created_at: datetime
+
+
 class DailyHabitListResponse(BaseModel):
     """日次習慣一覧レスポンス"""
-    habits: list[DailyHabitResponse]
-    total: int
+    habits: list[DailyHabitListItem]
+    total: Optional[int] = Field(..., description="合計件数（count=none の場合は None）")
+    next_cursor: Optional[str] = Field(default=None, description="次のページのカーソル（最後のページなら None）")
 
 
 class DailyHabitCheckResponse(BaseModel):
@@ -47,3 +58,14 @@ class DailyHabitCheckResponse(BaseModel):
     action: str = Field(..., description="'checked' または 'unchecked'")
     new_streak: int
     message: str
+
+
+class DailyHabitCalendarResponse(BaseModel):
+    """習慣の完了カレンダー・ストリーク・達成率（completion_bits から計算）"""
+    habit_id: UUID
+    start_date: date
+    end_date: date = Field(..., description="今日（JST）")
+    completed: List[bool] = Field(..., description="start_date から end_date まで1日ずつの完了")
+    streak: int = Field(..., description="今日（今日がまだなら昨日）から遡った連続達成日数")
+    completed_today: bool
+    completion_rates: Dict[str, float] = Field(..., description="直近7/30/365日の達成率（'7d' など）")
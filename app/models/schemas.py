@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from uuid import UUID
 
 # --- ペットモデル ---
@@ -10,6 +10,8 @@ class PetBase(BaseModel):
 
 class PetCreate(PetBase):
     user_id: UUID
+    # 日次習慣の日の区切り（UTCオフセット、分）。省略時はプロフィールの値（デフォルト: JST = +540）のまま
+    utc_offset_minutes: Optional[int] = Field(None, ge=-720, le=840)
 
 class PetResponse(PetBase):
     id: UUID
@@ -25,8 +27,54 @@ class PetResponse(PetBase):
     status: Literal['ALIVE', 'DEAD']
     last_checked_at: datetime
     born_at: datetime
+    predicted_death_at: Optional[datetime] = None  # 放置した場合にHPが0になる時刻（DEADはNone）
     character_type: str
 
+class DyingPetResponse(BaseModel):
+    """GET /pets/dying（CRON・運用向け）。ペットの識別と死亡予測に必要な列だけを返す"""
+    id: UUID
+    user_id: UUID
+    hp: float
+    predicted_death_at: datetime
+
+class PetForecastCurve(BaseModel):
+    """放置した場合の推移（列指向: offset_hours[i] 時間後の値が hp[i] など）"""
+    offset_hours: List[float]
+    hp: List[float]
+    hunger: List[float]
+    mood: List[float]
+    status: List[str]
+
+class PetForecastResponse(BaseModel):
+    pet: PetResponse
+    generated_at: datetime
+    step_minutes: int
+    curve: PetForecastCurve
+    predicted_death_at: Optional[datetime] = None
+    next_evolution_stage: Optional[int] = None
+    next_evolution_at: Optional[datetime] = None
+
+class PetState(BaseModel):
+    """イベントログから再構築した状態（pets に保存される列のうちイベントで変わるもの）"""
+    hp: float
+    max_hp: float
+    hunger: float = 0.0
+    mood: float = 50.0
+    care_score: float = 50.0
+    infection_level: int
+    status: Literal['ALIVE', 'DEAD', 'CRITICAL']
+    last_checked_at: datetime
+    last_damage_run_id: Optional[str] = None
+
+class PetHistoryResponse(BaseModel):
+    pet_id: UUID
+    at: Optional[datetime] = None  # None = 現在
+    as_of: datetime                # 最後に適用したイベント（なければスナップショット）が記録された時刻
+    state: PetState
+    snapshot_event_id: int
+    last_event_id: int
+    events_applied: int            # スナップショットの後に適用したイベント数
+
 # --- 習慣モデル ---
 class HabitCreate(BaseModel):
     user_id: UUID
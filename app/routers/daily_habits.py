@@ -5,98 +5,89 @@
 チェックボタンで今日の完了/未完了をトグルする特殊ロジックを実装。
 """
 
-from fastapi import APIRouter, HTTPException
-from datetime import datetime, timezone, timedelta
+from fastapi import APIRouter, HTTPException, Query
+from datetime import datetime, timezone
+from typing import Literal, Optional
 from app.models.daily_habit import (
     DailyHabitCreate,
     DailyHabitResponse,
     DailyHabitListResponse,
-    DailyHabitCheckResponse
+    DailyHabitCheckResponse,
+    DailyHabitCalendarResponse,
 )
-from app.services.supabase import client
-from app.services.game_logic import calculate_time_decay, update_care_score
+from app.services.supabase import get_async_client
+from app.services.habit_bitmap import (
+    HISTORY_DAYS,
+    calendar,
+    clear_day,
+    completion_rates,
+    current_streak,
+    day_start,
+    day_to_date,
+    decode_bits,
+    encode_bits,
+    is_completed,
+    last_completed_day,
+    local_day,
+    set_day,
+)
+from app.services.game_logic import HABIT_HEAL_AMOUNT, pet_event
+from app.services.habit_sweep import fetch_utc_offset_minutes
+from app.services.pet_writes import PetWriteConflict
+from app.services.write_behind import pet_event_buffer
+from app.services.pagination import MAX_PAGE_SIZE, decode_cursor, fetch_keyset_page, projection
 
 router = APIRouter(prefix="/daily-habits", tags=["daily-habits"])
 
 
-def is_same_day(dt1: datetime, dt2: datetime, tz_offset_hours: int = 9) -> bool:
+@router.get("/{user_id}", response_model=DailyHabitListResponse, response_model_exclude_unset=True)
+async def get_user_habits(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="返す列（カンマ区切り）。例: id,title,streak"),
+    count: Literal['exact', 'estimated', 'none'] = 'estimated',
+):
     """
-    2つの日時が同じ日（JST基準）かどうかを判定する。
-    
-    Args:
-        dt1: 比較対象の日時1
-        dt2: 比較対象の日時2
-        tz_offset_hours: タイムゾーンオフセット（デフォルト: JST = +9）
-    
-    Returns:
-        同じ日であればTrue
-    """
-    tz = timezone(timedelta(hours=tz_offset_hours))
-    
-    # UTCからJSTに変換して日付を比較
-    if dt1.tzinfo is None:
-        dt1 = dt1.replace(tzinfo=timezone.utc)
-    if dt2.tzinfo is None:
-        dt2 = dt2.replace(tzinfo=timezone.utc)
-    
-    d1 = dt1.astimezone(tz).date()
-    d2 = dt2.astimezone(tz).date()
-    
-    return d1 == d2
-
-
-def is_yesterday(dt: datetime, tz_offset_hours: int = 9) -> bool:
-    """
-    指定日時が昨日かどうかを判定する（JST基準）。
-    
-    ストリーク継続判定に使用: 昨日完了していれば今日チェックでストリーク+1
-    """
-    tz = timezone(timedelta(hours=tz_offset_hours))
-    now = datetime.now(timezone.utc).astimezone(tz)
-    
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    
-    dt_local = dt.astimezone(tz)
-    yesterday = now.date() - timedelta(days=1)
-    
-    return dt_local.date() == yesterday
-
-
-@router.get("/{user_id}", response_model=DailyHabitListResponse)
-def get_user_habits(user_id: str, limit: int = 50):
-    """
-    ユーザーの日次習慣一覧を取得する。
+    ユーザーの日次習慣一覧を取得する（新しい順、キーセットページング）。
     
     Args:
         user_id: ユーザーID
-        limit: 取得件数上限
+        limit: 1ページの件数
+        cursor: 前のページの next_cursor（省略時は先頭ページ）
+        fields: 返す列（省略時は全列。created_at, id は常に含む）
+        count: total の求め方（exact / estimated / none）
     
     Returns:
-        習慣一覧とトータル件数
+        習慣一覧・合計件数・次のページのカーソル
     """
-    response = client.table("daily_habits")\
-        .select("*")\
-        .eq("user_id", user_id)\
-        .order("created_at", desc=True)\
-        .limit(limit)\
-        .execute()
-    
-    habits = response.data or []
-    
+    try:
+        columns = projection(fields, DailyHabitResponse.model_fields)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page = await fetch_keyset_page(
+        get_async_client(), "daily_habits", lambda query: query.eq("user_id", user_id),
+        columns=columns, limit=limit, cursor=cursor, count=count,
+    )
+
     return {
-        "habits": habits,
-        "total": len(habits)
+        "habits": page["rows"],
+        "total": page["total"],
+        "next_cursor": page["next_cursor"],
     }
 
 
 @router.post("/", response_model=DailyHabitResponse)
-def create_habit(habit_in: DailyHabitCreate):
+async def create_habit(habit_in: DailyHabitCreate):
     """
     新しい日次習慣を作成する。
     
     初期状態: streak=0, last_completed_at=NULL
     """
+    client = get_async_client()
     new_habit = {
         "user_id": habit_in.user_id,
         "title": habit_in.title,
@@ -104,7 +95,7 @@ def create_habit(habit_in: DailyHabitCreate):
         "last_completed_at": None
     }
     
-    response = client.table("daily_habits").insert(new_habit).execute()
+    response = await client.table("daily_habits").insert(new_habit).execute()
     
     if not response.data:
         raise HTTPException(status_code=400, detail="Failed to create daily habit")
@@ -113,24 +104,26 @@ def create_habit(habit_in: DailyHabitCreate):
 
 
 @router.put("/{habit_id}/check", response_model=DailyHabitCheckResponse)
-def toggle_habit_check(habit_id: str):
+async def toggle_habit_check(habit_id: str):
     """
     習慣の「完了/未完了」をトグルする。
     
     ロジック:
     1. 今日すでに完了している場合:
-       - キャンセル処理: streak -1, last_completed_at を前日 or null に戻す
+       - キャンセル処理: 今日のビットを落とす（それ以前の履歴はそのまま）
+       - last_completed_at は前回完了した日に戻す（時刻はその日の0時）
     
     2. 今日まだの場合:
-       - 完了処理: streak +1 (昨日も完了していた場合) または streak=1 (連続途切れ)
+       - 完了処理: 今日のビットを立てる
        - last_completed_at = now
     
     Note:
-        ストリークは「連続日数」なので、昨日完了していた場合のみ継続。
-        2日以上空いた場合はストリークがリセットされる。
+        ストリークは完了履歴のビットマップ（completion_bits）で今日から遡って連続して
+        立っているビットの数。取り消すと完了前のストリークにそのまま戻る。
     """
+    client = get_async_client()
     # 習慣を取得
-    habit_res = client.table("daily_habits")\
+    habit_res = await client.table("daily_habits")\
         .select("*")\
         .eq("id", habit_id)\
         .execute()
@@ -139,51 +132,43 @@ def toggle_habit_check(habit_id: str):
         raise HTTPException(status_code=404, detail="Daily habit not found")
     
     habit = habit_res.data[0]
+    # 日の区切りはユーザーのUTCオフセット（未達成の一括処理と同じ）
+    utc_offset = await fetch_utc_offset_minutes(client, habit["user_id"])
     now = datetime.now(timezone.utc)
-    
-    last_completed_str = habit.get("last_completed_at")
-    current_streak = habit.get("streak", 0)
-    
-    # last_completed_at をパース
-    last_completed: datetime | None = None
-    if last_completed_str:
-        try:
-            last_completed = datetime.fromisoformat(
-                last_completed_str.replace('Z', '+00:00')
-            )
-        except ValueError:
-            last_completed = None
-    
+    today = local_day(now, utc_offset)
+
+    bits = decode_bits(habit.get("completion_bits"))
+    anchor = habit.get("completion_day")
+
     # --- トグルロジック ---
     healed_amount = 0.0
+    pet_to_heal = None
 
-    if last_completed and is_same_day(last_completed, now):
-        # 今日すでに完了 → キャンセル処理
-        new_streak = max(0, current_streak - 1)
-
-        # last_completed_at を戻す（前日があれば前日、なければnull）
-        # 簡略化: 今回はnullに戻す（厳密な履歴管理は別途テーブルが必要）
-        new_last_completed = None
+    if is_completed(bits, anchor, today):
+        # 今日すでに完了 → キャンセル処理（前回の完了日はビットマップから分かる）
+        bits, anchor = clear_day(bits, anchor, today)
+        new_streak = current_streak(bits, anchor, today)
+        last_day = last_completed_day(bits, anchor)
 
         update_data = {
             "streak": new_streak,
-            "last_completed_at": new_last_completed
+            "last_completed_at": day_start(last_day, utc_offset).isoformat() if last_day is not None else None,
+            "completion_bits": encode_bits(bits),
+            "completion_day": anchor,
         }
 
         action = "unchecked"
         message = f"習慣をキャンセルしました。ストリーク: {new_streak}日"
     else:
-        # 今日まだ → 完了処理
-        if last_completed and is_yesterday(last_completed):
-            # 昨日も完了していた → ストリーク継続
-            new_streak = current_streak + 1
-        else:
-            # 連続途切れ or 初完了 → ストリークリセット
-            new_streak = 1
+        # 今日まだ → 完了処理（昨日も完了していればストリーク継続）
+        bits, anchor = set_day(bits, anchor, today)
+        new_streak = current_streak(bits, anchor, today)
 
         update_data = {
             "streak": new_streak,
-            "last_completed_at": now.isoformat()
+            "last_completed_at": now.isoformat(),
+            "completion_bits": encode_bits(bits),
+            "completion_day": anchor,
         }
 
         action = "checked"
@@ -193,37 +178,13 @@ def toggle_habit_check(habit_id: str):
         user_id = habit["user_id"]
 
         # ユーザーのアクティブなペットを取得
-        pet_res = client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
+        pet_res = await client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
 
         if pet_res.data:
-            pet_data = pet_res.data[0]
-
-            # 減衰を適用
-            decayed_pet = calculate_time_decay(pet_data)
-
-            heal_amount = 10.0
-            new_mood = min(100.0, float(decayed_pet.get('mood', 50)) + 15.0)
-            new_corruption = max(0, int(decayed_pet.get('infection_level', 0)) - 10)
-            new_care_score = update_care_score(float(decayed_pet.get('care_score', 50)), 'habit_complete')
-
-            if decayed_pet['status'] == 'ALIVE':
-                new_hp = min(float(decayed_pet['max_hp']), decayed_pet['hp'] + heal_amount)
-                decayed_pet['hp'] = new_hp
-                healed_amount = heal_amount
-
-            pet_update = {
-                "hp": decayed_pet['hp'],
-                "status": decayed_pet['status'],
-                "mood": new_mood,
-                "infection_level": new_corruption,
-                "care_score": new_care_score,
-                "last_checked_at": datetime.now(timezone.utc).isoformat()
-            }
-
-            client.table("pets").update(pet_update).eq("id", pet_data['id']).execute()
+            pet_to_heal = pet_res.data[0]
 
     # DB更新
-    update_res = client.table("daily_habits")\
+    update_res = await client.table("daily_habits")\
         .update(update_data)\
         .eq("id", habit_id)\
         .execute()
@@ -231,6 +192,17 @@ def toggle_habit_check(habit_id: str):
     if not update_res.data:
         raise HTTPException(status_code=500, detail="Failed to update daily habit")
 
+    if pet_to_heal is not None:
+        # 習慣の完了を記録できてから回復させる（習慣の更新に失敗したのにペットだけ回復することがないように）
+        # 減衰 + 回復・機嫌・腐敗度・care_score（同じペットへの連続した書き込みはバッファで1回にまとめる）
+        event = pet_event("daily_habit_check", now, habit_id=habit_id)
+        try:
+            updated_pet = await pet_event_buffer.submit(client, pet_to_heal, event)
+        except PetWriteConflict:
+            raise HTTPException(status_code=409, detail="Pet was updated concurrently, please retry")
+        if updated_pet and updated_pet['status'] == 'ALIVE':
+            healed_amount = HABIT_HEAL_AMOUNT
+
     updated_habit = update_res.data[0]
 
     return {
@@ -242,13 +214,50 @@ def toggle_habit_check(habit_id: str):
     }
 
 
+@router.get("/{habit_id}/calendar", response_model=DailyHabitCalendarResponse)
+async def get_habit_calendar(
+    habit_id: str,
+    days: int = Query(365, ge=1, le=HISTORY_DAYS, description="返す日数（今日を含む）"),
+):
+    """
+    習慣の完了カレンダー（ヒートマップ用）・ストリーク・達成率を返す。
+
+    すべて completion_bits のビット演算で求めるので、習慣1行を読むだけでよい。
+    """
+    client = get_async_client()
+    habit_res = await client.table("daily_habits")\
+        .select("id, user_id, completion_bits, completion_day")\
+        .eq("id", habit_id)\
+        .execute()
+
+    if not habit_res.data:
+        raise HTTPException(status_code=404, detail="Daily habit not found")
+
+    habit = habit_res.data[0]
+    bits = decode_bits(habit.get("completion_bits"))
+    anchor = habit.get("completion_day")
+    utc_offset = await fetch_utc_offset_minutes(client, habit["user_id"])
+    today = local_day(datetime.now(timezone.utc), utc_offset)
+
+    return {
+        "habit_id": habit["id"],
+        "start_date": day_to_date(today - days + 1),
+        "end_date": day_to_date(today),
+        "completed": calendar(bits, anchor, today, days),
+        "streak": current_streak(bits, anchor, today),
+        "completed_today": is_completed(bits, anchor, today),
+        "completion_rates": completion_rates(bits, anchor, today),
+    }
+
+
 @router.delete("/{habit_id}")
-def delete_habit(habit_id: str):
+async def delete_habit(habit_id: str):
     """
     日次習慣を削除する。
     """
+    client = get_async_client()
     # 存在確認
-    habit_res = client.table("daily_habits")\
+    habit_res = await client.table("daily_habits")\
         .select("id")\
         .eq("id", habit_id)\
         .execute()
@@ -257,7 +266,7 @@ def delete_habit(habit_id: str):
         raise HTTPException(status_code=404, detail="Daily habit not found")
     
     # 削除実行
-    delete_res = client.table("daily_habits")\
+    delete_res = await client.table("daily_habits")\
         .delete()\
         .eq("id", habit_id)\
         .execute()
@@ -1,49 +1,40 @@
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import HabitComplete, PetResponse
-from app.services.supabase import client
-from app.services.game_logic import calculate_time_decay
+from app.services.supabase import get_async_client
+from app.services.game_logic import pet_event
+from app.services.pet_writes import PetWriteConflict
+from app.services.write_behind import pet_event_buffer
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/habits", tags=["habits"])
 
 @router.post("/complete", response_model=PetResponse)
-def complete_habit(payload: HabitComplete):
+async def complete_habit(payload: HabitComplete):
+    client = get_async_client()
     # 1. 習慣の取得と所有権の確認 (MVPのため省略、有効なIDと仮定)
     
     # 2. ユーザーのアクティブなペットを取得
     # ペイロードには habit_id しかないため、まず習慣を取得して所有者を特定
-    habit_res = client.table("habits").select("user_id").eq("id", str(payload.habit_id)).execute()
+    habit_res = await client.table("habits").select("user_id").eq("id", str(payload.habit_id)).execute()
     if not habit_res.data:
         raise HTTPException(status_code=404, detail="Habit not found")
         
     user_id = habit_res.data[0]['user_id']
     
-    pet_res = client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
+    pet_res = await client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
     if not pet_res.data:
          raise HTTPException(status_code=404, detail="Active pet not found")
          
     pet_data = pet_res.data[0]
     
-    # 3. まず累積した減衰を適用
-    decayed_pet = calculate_time_decay(pet_data)
-    
-    # 4. 回復の適用
-    HEAL_AMOUNT = 10.0
-    
-    if decayed_pet['status'] == 'ALIVE':
-        new_hp = min(float(decayed_pet['max_hp']), decayed_pet['hp'] + HEAL_AMOUNT)
-        decayed_pet['hp'] = new_hp
-        
-    # 5. 更新のコミット (減衰 + 回復) + last_checked_at の更新
-    update_data = {
-        "hp": decayed_pet['hp'],
-        "status": decayed_pet['status'],
-        "last_checked_at": datetime.now(timezone.utc).isoformat()
-    }
-    
-    update_res = client.table("pets").update(update_data).eq("id", pet_data['id']).execute()
-    
-    if not update_res.data:
+    # 3. 減衰 + 回復（同じペットへの連続した書き込みは書き込みバッファで1回にまとめる）
+    event = pet_event("habit_complete", datetime.now(timezone.utc), habit_id=str(payload.habit_id))
+    try:
+        updated_pet = await pet_event_buffer.submit(client, pet_data, event)
+    except PetWriteConflict:
+        raise HTTPException(status_code=409, detail="Pet was updated concurrently, please retry")
+
+    if not updated_pet:
         raise HTTPException(status_code=500, detail="Failed to update pet")
         
-    return update_res.data[0]
+    return updated_pet
@@ -1,12 +1,26 @@
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import PetCreate, PetResponse
-from app.services.supabase import client
-from app.services.game_logic import calculate_time_decay, calculate_evolution
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Query
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+from app.core.config import settings
+from app.models.schemas import DyingPetResponse, PetCreate, PetResponse, PetForecastResponse, PetHistoryResponse
+from app.services.supabase import get_async_client
+from app.services.game_logic import (
+    calculate_time_decay,
+    calculate_evolution,
+    forecast_decay,
+    next_evolution_at,
+    pet_event,
+    predict_death_at,
+)
+from app.services.write_behind import evolution_buffer, pet_event_buffer
+from app.services.pet_cache import pet_cache
+from app.services.pet_history import load_pet_state
+from app.services.pet_writes import PetWriteConflict, update_pet_cas
 
 router = APIRouter(prefix="/pets", tags=["pets"])
 
 @router.post("/", response_model=PetResponse)
-def create_pet(pet_in: PetCreate):
+async def create_pet(pet_in: PetCreate):
     new_pet = {
         "user_id": str(pet_in.user_id),
         "name": pet_in.name,
@@ -23,80 +37,187 @@ def create_pet(pet_in: PetCreate):
         "character_type": pet_in.character_type
     }
 
-    user_check = client.table("profiles").select("id").eq("id", pet_in.user_id).execute()
+    client = get_async_client()
+    user_check = await client.table("profiles").select("id").eq("id", pet_in.user_id).execute()
+    profile = {"id": str(pet_in.user_id)}
+    if pet_in.utc_offset_minutes is not None:
+        profile["utc_offset_minutes"] = pet_in.utc_offset_minutes
     if not user_check.data:
-        client.table("profiles").insert({"id": str(pet_in.user_id)}).execute()
+        await client.table("profiles").insert(profile).execute()
+    elif pet_in.utc_offset_minutes is not None:
+        await client.table("profiles").update(profile).eq("id", str(pet_in.user_id)).execute()
 
-    response = client.table("pets").insert(new_pet).execute()
+    response = await client.table("pets").insert(new_pet).execute()
+    pet_cache.invalidate(str(pet_in.user_id))
     if not response.data:
         raise HTTPException(status_code=400, detail="Failed to create pet")
 
     return response.data[0]
 
 
+@router.get("/dying", response_model=List[DyingPetResponse])
+async def get_dying_pets(
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    within_hours: float = Query(24.0, gt=0, le=24 * 30),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    【CRON・運用向け】指定時間以内にHPが0になる生存ペットを、死亡予測時刻の早い順に返す。
+
+    全ユーザーのペットを返すので、CRON用エンドポイントと同じく X-API-KEY ヘッダーで認証し、
+    id / user_id / hp / predicted_death_at だけを返す。
+
+    predicted_death_at はpetsへの書き込み時にトリガーで再計算されるため、
+    減衰計算をせずにインデックスの範囲スキャンだけで取得できる。
+    """
+    if x_api_key != settings.CRON_SECRET:
+        raise HTTPException(status_code=403, detail="Unauthorized: Invalid API Key")
+
+    now = datetime.now(timezone.utc)
+    response = await (
+        get_async_client().table("pets")
+        .select("id, user_id, hp, predicted_death_at")
+        .lte("predicted_death_at", (now + timedelta(hours=within_hours)).isoformat())
+        .order("predicted_death_at")
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
+
+
+async def _find_pet_for_user(user_id: str):
+    """
+    生存中のペット、いなければ最後に死亡したペットを1回のクエリで返す。
+
+    'ALIVE' < 'DEAD' なので status 昇順で生存ペットが先頭に来る。
+    結果は pet_cache に保持し、書き込みで無効化されるまでSupabaseに問い合わせない。
+    キャッシュには DB の行をそのまま持ち、書き込みバッファに溜まっている未書き込みのイベント
+    （タスク完了・習慣完了の回復など）は返すときに重ねる。
+    """
+    cached = pet_cache.get(user_id)
+    if cached is not None:
+        return pet_event_buffer.preview(cached)
+
+    response = await (
+        get_async_client().table("pets")
+        .select("*")
+        .eq("user_id", user_id)
+        .in_("status", ["ALIVE", "DEAD"])
+        .order("status")
+        .order("last_checked_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+    if not response.data:
+        raise HTTPException(status_code=404, detail="Active pet not found")
+
+    pet_cache.put(user_id, response.data[0])
+    return pet_event_buffer.preview(response.data[0])
+
+
 @router.get("/{user_id}", response_model=PetResponse)
-def get_pet_status(user_id: str):
-    response = client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
-
-    pet_data = None
-    if response.data:
-        pet_data = response.data[0]
-    else:
-        dead_res = (
-            client.table("pets")
-            .select("*")
-            .eq("user_id", user_id)
-            .eq("status", "DEAD")
-            .order("last_checked_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-        if dead_res.data:
-            pet_data = dead_res.data[0]
-        else:
-            raise HTTPException(status_code=404, detail="Active pet not found")
+async def get_pet_status(user_id: str, background_tasks: BackgroundTasks):
+    pet_data = await _find_pet_for_user(user_id)
 
     # 経過時間による各パラメータ更新（非永続）
     current_state = calculate_time_decay(pet_data)
 
-    # 進化ステージ計算（変化があればDB更新）
+    # 進化ステージ計算（変化があれば遅延書き込みバッファへ。レスポンス後にまとめてDB更新）
     evolved_state = calculate_evolution(current_state)
     if (evolved_state['evolution_stage'] != pet_data.get('evolution_stage')
             or evolved_state['evolution_path'] != pet_data.get('evolution_path')):
-        client.table("pets").update({
+        evolution_buffer.add(
+            pet_data['id'], evolved_state['evolution_stage'], evolved_state['evolution_path']
+        )
+        # キャッシュ済みの行にも反映し、次の読み取りで同じ変更を積み直さないようにする
+        pet_cache.patch(user_id, {
             "evolution_stage": evolved_state['evolution_stage'],
             "evolution_path": evolved_state['evolution_path'],
-        }).eq("id", pet_data['id']).execute()
+        })
+        background_tasks.add_task(evolution_buffer.flush_if_due, get_async_client())
 
     return evolved_state
 
 
+@router.get("/{user_id}/forecast", response_model=PetForecastResponse)
+async def get_pet_forecast(
+    user_id: str,
+    hours: int = Query(48, ge=1, le=72, description="予測する時間幅"),
+    step_minutes: int = Query(60, ge=5, le=360, description="サンプル間隔（分）"),
+):
+    """
+    現在の状態と、このまま放置した場合のHP・飢餓度・機嫌度の推移を返す。
+
+    減衰は保存された状態と経過時間だけで決まるので、クライアントはこの曲線を使って
+    ローカルで描画し、タスク完了などのアクション後にだけ再取得すればよい（DB書き込みなし）。
+    """
+    pet_data = await _find_pet_for_user(user_id)
+    now = datetime.now(timezone.utc)
+
+    current_state = calculate_evolution(calculate_time_decay(pet_data, now=now), now=now)
+
+    offsets = [i * step_minutes / 60.0 for i in range(hours * 60 // step_minutes + 1)]
+    curve = forecast_decay(pet_data, offsets, now=now)
+    evolution = next_evolution_at(pet_data, now=now)
+
+    return {
+        "pet": current_state,
+        "generated_at": now,
+        "step_minutes": step_minutes,
+        "curve": {
+            "offset_hours": offsets,
+            "hp": curve["hp"].tolist(),
+            "hunger": curve["hunger"].tolist(),
+            "mood": curve["mood"].tolist(),
+            "status": curve["status"],
+        },
+        "predicted_death_at": predict_death_at(pet_data),
+        "next_evolution_stage": evolution["stage"] if evolution else None,
+        "next_evolution_at": evolution["at"] if evolution else None,
+    }
+
+
 @router.post("/{pet_id}/revive", response_model=PetResponse)
-def revive_pet(pet_id: str):
-    current_pet = client.table("pets").select("*").eq("id", pet_id).execute()
+async def revive_pet(pet_id: str):
+    client = get_async_client()
+    current_pet = await client.table("pets").select("*").eq("id", pet_id).execute()
     if not current_pet.data:
         raise HTTPException(status_code=404, detail="Pet not found")
 
-    revive_data = {
-        "status": "ALIVE",
-        "hp": 100.0,
-        "infection_level": 0,
-        "hunger": 0.0,
-        "mood": 50.0,
-        "care_score": 50.0,
-        "evolution_stage": 0,
-        "evolution_path": None,
-        "last_checked_at": "now()"
-    }
-
-    response = client.table("pets").update(revive_data).eq("id", pet_id).execute()
-    if not response.data:
+    # 蘇生もイベントとして追記する（状態は game_logic.REVIVE_STATE）
+    event = pet_event("revive", datetime.now(timezone.utc))
+    try:
+        revived = await update_pet_cas(client, current_pet.data[0], lambda pet: [event], writer="revive")
+    except PetWriteConflict:
+        raise HTTPException(status_code=409, detail="Pet was updated concurrently, please retry")
+    pet_cache.invalidate(current_pet.data[0]['user_id'])
+    if not revived:
         raise HTTPException(status_code=500, detail="Failed to revive pet")
 
-    return response.data[0]
+    return revived
+
+
+@router.get("/{pet_id}/history", response_model=PetHistoryResponse)
+async def get_pet_history(
+    pet_id: str,
+    at: Optional[datetime] = Query(None, description="この時刻に保存されていた状態を返す（省略時は現在）"),
+):
+    """
+    イベントログ（pet_events）から、ある時点のペットの状態を再構築して返す。
+
+    at 以前の最新のスナップショットに、それ以降に記録されたイベントを game_logic の reducer で
+    順に適用する（読むイベントはスナップショット以降の分だけ）。減衰は適用しない（保存されていた値）。
+    """
+    if at is not None and at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    history = await load_pet_state(get_async_client(), pet_id, at)
+    if history is None:
+        raise HTTPException(status_code=404, detail="No history for this pet at the given time")
+    return dict(history, at=at)
 
 
 @router.delete("/me", status_code=204)
-def purge_mypet(user_id: str):
-    client.table("pets").delete().eq("user_id", user_id).execute()
+async def purge_mypet(user_id: str):
+    await get_async_client().table("pets").delete().eq("user_id", user_id).execute()
+    pet_cache.invalidate(user_id)
     return None
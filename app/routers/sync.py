@@ -1,19 +1,43 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.services.supabase import client
+import asyncio
+from fastapi import APIRouter, Header, HTTPException, Query
+from typing import Optional
+from app.services.supabase import get_async_client
+from app.services.checkpoints import MAX_SHARDS, RUN_ID_PATTERN, default_run_id, run_sharded
+from app.services.pet_cache import pet_cache
+from app.services.damage import DAILY_DAMAGE_JOB
+from app.services.game_logic import pet_event
+from app.services.pet_writes import PetWriteConflict, update_pet_cas, update_pets_cas
+from app.services.notion import NotionAPIError, get_notion_service
+from app.services.notion_sync import sync_notion_incremental
+from app.services.habit_sweep import run_habit_sweep
 from datetime import datetime, timezone
 from app.core.config import settings
 
 router = APIRouter(prefix="/cron", tags=["cron"])
 
 @router.post("/sync")
-def sync_and_punish(user_id: str = Query(..., description="User ID to apply sync")):
+async def sync_and_punish(user_id: str = Query(..., description="User ID to apply sync")):
     """
     [The Executioner Protocol]
     1. Time Decay: 0.5 HP / hour (Linear)
     2. Task Penalty: 5.0 HP / overdue task
     """
-    # 1. 現在のペット情報を取得
-    pet_res = client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
+    client = get_async_client()
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+
+    # 1. 現在のペット情報と 2. 期限切れタスクの数は互いに独立しているので並行に取得する
+    # Supabase filtering: status != 'DONE' AND due_date < NOW
+    # count='exact', head=True を使いたいが、python clientの仕様上 select(count='exact') する
+    pet_res, tasks_res = await asyncio.gather(
+        client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute(),
+        client.table("tasks")
+        .select("id", count="exact")
+        .eq("user_id", user_id)
+        .neq("completed", True)
+        .lt("due_date", now_iso)
+        .execute(),
+    )
     if not pet_res.data:
         # 生きてるペットがいなければ、死んだペットも含めて検索（ステータス更新のため）
         # ただし今回はMVPなので「Active Pet Only」とする
@@ -25,102 +49,205 @@ def sync_and_punish(user_id: str = Query(..., description="User ID to apply sync
     if pet['status'] == 'DEAD':
         return {"status": "Pet is already dead", "pet_name": pet['name']}
 
-    # 2. 期限切れタスクの数を数える
-    now_iso = datetime.now(timezone.utc).isoformat()
-    
-    # Supabase filtering: status != 'DONE' AND due_date < NOW
-    # count='exact', head=True を使いたいが、python clientの仕様上 select(count='exact') する
-    tasks_res = client.table("tasks") \
-        .select("id", count="exact") \
-        .eq("user_id", user_id) \
-        .neq("completed", True) \
-        .lt("due_date", now_iso) \
-        .execute()
-    
     overdue_count = tasks_res.count if tasks_res.count is not None else 0
-
-    # 3. ダメージ計算
-    # -------------------------------------------------
-    # A. 基礎代謝（時間経過）: Linear Decay
-    # -------------------------------------------------
-    damage_time = 0.0
-    if pet.get('last_checked_at'):
-        # Parse ISO string
-        try:
-            last_checked = datetime.fromisoformat(pet['last_checked_at'].replace('Z', '+00:00'))
-            diff = datetime.now(timezone.utc) - last_checked
-            hours_passed = diff.total_seconds() / 3600.0
-            
-            if hours_passed > 0:
-                damage_time = hours_passed * 0.5
-        except ValueError:
-            pass # 日付フォーマットエラー時は時間ダメージなし
-
-    # -------------------------------------------------
-    # B. 懲罰（タスク滞留）
-    # -------------------------------------------------
     DAMAGE_PER_TASK = 5.0 # タスク1個につき 5ダメージ
-    damage_penalty = overdue_count * DAMAGE_PER_TASK
+    DECAY_PER_HOUR = 0.5 # 1時間につき 0.5ダメージ
+    result = {}
 
-    # 4. 合計ダメージ適用
-    total_damage = damage_time + damage_penalty
-    
-    current_hp = float(pet.get('hp', 100))
-    new_hp = max(0.0, current_hp - total_damage)
-    
-    # ステータス更新
-    new_status = "ALIVE"
-    if new_hp <= 0:
-        new_status = "DEAD"
-
-    # 5. DBに保存（更新）
-    # Time Decayを行ったので last_checked_at も更新する
-    update_data = {
-        "hp": new_hp,
-        "status": new_status,
-        "last_checked_at": now_iso
-    }
-    client.table("pets").update(update_data).eq("id", pet['id']).execute()
+    def punish(pet):
+        """3. ダメージ計算（競合して読み直した場合は新しい行で計算し直す）"""
+        if pet['status'] == 'DEAD':
+            return None
+
+        # -------------------------------------------------
+        # A. 基礎代謝（時間経過）: Linear Decay
+        # -------------------------------------------------
+        damage_time = 0.0
+        if pet.get('last_checked_at'):
+            # Parse ISO string
+            try:
+                last_checked = datetime.fromisoformat(pet['last_checked_at'].replace('Z', '+00:00'))
+                diff = now - last_checked
+                hours_passed = diff.total_seconds() / 3600.0
+                
+                if hours_passed > 0:
+                    damage_time = hours_passed * DECAY_PER_HOUR
+            except ValueError:
+                pass # 日付フォーマットエラー時は時間ダメージなし
+
+        # -------------------------------------------------
+        # B. 懲罰（タスク滞留）
+        # -------------------------------------------------
+        damage_penalty = overdue_count * DAMAGE_PER_TASK
+
+        # 4. 合計ダメージ
+        total_damage = damage_time + damage_penalty
+        result.update(damage_time=damage_time, damage_penalty=damage_penalty, total_damage=total_damage)
+
+        # 5. DBに保存（イベントとして追記し、HP・ステータスは reducer で計算する）
+        # Time Decayを行ったので last_checked_at も更新する
+        events = [pet_event("decay_tick", now, hp_per_hour=DECAY_PER_HOUR)]
+        if damage_penalty > 0:
+            events.append(pet_event("overdue_damage", now, damage=damage_penalty, overdue_tasks=overdue_count))
+        return events
+
+    try:
+        updated_pet = await update_pet_cas(client, pet, punish, writer="sync_and_punish")
+    except PetWriteConflict:
+        raise HTTPException(status_code=409, detail="Pet was updated concurrently, please retry")
+    pet_cache.invalidate(user_id)
+
+    if updated_pet is None:
+        # 読み直したら既に死んでいた
+        return {"status": "Pet is already dead", "pet_name": pet['name']}
 
     return {
         "status": "Executed",
         "pet_name": pet['name'],
         "overdue_count": overdue_count,
-        "damage_time": damage_time,
-        "damage_penalty": damage_penalty,
-        "total_damage": total_damage,
-        "new_hp": new_hp,
-        "new_status": new_status
+        **result,
+        "new_hp": updated_pet['hp'],
+        "new_status": updated_pet['status'],
     }
 
+MANUAL_DAMAGE_JOB = "manual-damage"
+MANUAL_DAMAGE_COLUMNS = "id, user_id, hp, status, version, last_damage_run_id"
+
+
 @router.get("/damage")
-def manual_damage(secret: str = Query(...)):
+async def manual_damage(
+    secret: str = Query(...),
+    shard: int = Query(0, ge=0),
+    shards: int = Query(1, ge=1, le=MAX_SHARDS),
+    run_id: Optional[str] = Query(None, pattern=RUN_ID_PATTERN),
+):
     """
     QAテスト用: 手動で全ペットにダメージを与える（検証用）
+
+    /tasks/cron/damage と同じくシャード + チェックポイントで処理する。
+    run_id を省略すると日付単位になるため、同じ日の再実行はダメージを重複させない
+    （繰り返し検証したい場合は run_id を変えて呼び出す）。
+
+    pets.last_damage_run_id は日次ダメージ（/tasks/cron/damage）と共用なので、
+    今日の日次ダメージの run_id が付いたペットには触れない。日次ダメージがページを書き込んだ後、
+    チェックポイントを保存する前に落ちた場合に、ここで印を上書きすると再実行で二重にダメージが入るため。
     """
     if secret != settings.CRON_SECRET:
         raise HTTPException(status_code=403, detail="Invalid Secret")
+    if shard >= shards:
+        raise HTTPException(status_code=400, detail="shard must be less than shards")
+
+    now = datetime.now(timezone.utc)
+    run_id = run_id or default_run_id(MANUAL_DAMAGE_JOB, now)
+    daily_run_id = default_run_id(DAILY_DAMAGE_JOB, now)
+    damage_amount = 5.0
+    client = get_async_client()
+
+    def damage(pet):
+        """読み直した行にも同じダメージを与える（既に死亡・このrunか今日の日次ダメージで処理済みなら何もしない）"""
+        if pet['status'] != 'ALIVE' or pet.get('last_damage_run_id') in (run_id, daily_run_id):
+            return None
+        new_hp = max(0.0, float(pet['hp']) - damage_amount)
+        return {
+            "id": pet['id'],
+            "version": pet['version'],
+            "hp": new_hp,
+            "status": 'DEAD' if new_hp == 0 else 'ALIVE',
+            "last_damage_run_id": run_id,
+            "events": [pet_event("overdue_damage", now, damage=damage_amount, run_id=run_id)],
+        }
+
+    async def process_page(pets):
+        # 読んだ version のままの行だけを書き込み、競合した行は読み直して再計算する
+        result = await update_pets_cas(
+            client, [u for u in map(damage, pets) if u], damage,
+            writer="manual_damage", columns=MANUAL_DAMAGE_COLUMNS,
+        )
+        written = result["written"].values()
+        pet_cache.invalidate_many(row["user_id"] for row in written)
+        return {
+            "processed_pets": len(written),
+            "total_damage_dealt": damage_amount * len(written),
+            "pets_killed": sum(1 for row in written if row["status"] == 'DEAD'),
+            "tasks_deleted": 0,
+            "details": [],
+            "exhausted_pets": result["exhausted"],
+        }
 
     # 本来は全ユーザーだが、テスト用なので「生きている全ペット」に固定ダメージを与える
     try:
-        pets_res = client.table("pets").select("*").eq("status", "ALIVE").execute()
-        if not pets_res.data:
-            return {"message": "No active pets found"}
-
-        damage_amount = 5.0
-        processed_count = 0
-        
-        for pet in pets_res.data:
-            new_hp = max(0.0, float(pet['hp']) - damage_amount)
-            status = 'DEAD' if new_hp == 0 else 'ALIVE'
-            
-            client.table("pets").update({
-                "hp": new_hp,
-                "status": status
-            }).eq("id", pet['id']).execute()
-            processed_count += 1
-            
-        return {"message": "Damage processing complete", "processed": processed_count, "damage": damage_amount}
-        
+        report = await run_sharded(
+            client,
+            job=MANUAL_DAMAGE_JOB,
+            run_id=run_id,
+            shard_index=shard,
+            shard_count=shards,
+            now=now,
+            columns=MANUAL_DAMAGE_COLUMNS,
+            statuses=["ALIVE"],
+            process_page=process_page,
+            time_budget_seconds=settings.CRON_TIME_BUDGET_SECONDS,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    if report["status"] == "completed" and report["run"]["processed_pets"] == 0:
+        return {"message": "No active pets found", "run": report["run"]}
+
+    return {
+        "message": "Damage processing complete" if report["status"] == "completed" else "Damage processing partial",
+        "status": report["status"],
+        "processed": report["processed_pets"],
+        "damage": damage_amount,
+        "exhausted_pets": report["exhausted_pets"],
+        "run": report["run"]
+    }
+
+
+@router.post("/notion-sync")
+async def notion_sync(
+    user_id: str = Query(..., description="同期先のユーザーID"),
+    database_id: Optional[str] = Query(None, description="省略時は NOTION_DB_ID"),
+    full: bool = Query(False, description="ウォーターマークを無視して全件を取り込み直す"),
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+):
+    """
+    Notion データベースの差分同期
+
+    前回の同期以降に編集されたページだけを取得し、tasks（と対応する habits）に source='notion' で upsert する。
+    初回・full=true のときはデータベース全体を一括で取り込む。
+    """
+    if x_api_key != settings.CRON_SECRET:
+        raise HTTPException(status_code=403, detail="Unauthorized: Invalid API Key")
+
+    try:
+        return await sync_notion_incremental(
+            get_async_client(), get_notion_service(), user_id, database_id=database_id, full=full
+        )
+    except NotionAPIError as e:
+        raise HTTPException(status_code=502, detail=f"Notion sync failed: {e}")
+
+
+@router.post("/habit-sweep")
+async def sweep_missed_habits(x_api_key: str = Header(..., alias="X-API-KEY")):
+    """
+    【CRON用】日次習慣の未達成の一括処理（1時間ごとに呼び出す）
+
+    Vercel Cron の GET は frontend/app/api/cron/habit-sweep が受け、POST でここを呼ぶ。
+
+    ユーザーのUTCオフセットごとに、ローカル時刻で前日が終わっていてまだ処理していなければ、
+    前日に完了しなかった日次習慣のストリークを0に戻し、持ち主のペットの腐敗度と care_score に反映する。
+
+    セキュリティ: X-API-KEY ヘッダーで認証
+
+    時間予算内に終わらなかった場合は status="partial" を返すので、再度呼び出すと
+    チェックポイントから再開する。同じ日の習慣に2回ペナルティが入ることはない。
+    """
+    if x_api_key != settings.CRON_SECRET:
+        raise HTTPException(status_code=403, detail="Unauthorized: Invalid API Key")
+
+    return await run_habit_sweep(
+        get_async_client(),
+        datetime.now(timezone.utc),
+        time_budget_seconds=settings.CRON_TIME_BUDGET_SECONDS,
+    )
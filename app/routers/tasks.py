@@ -9,57 +9,33 @@ Notionに依存せず、独自のタスク管理を提供する。
 - 7日以上経過したタスクは自動削除
 """
 
-from fastapi import APIRouter, HTTPException, Header
+import asyncio
+from fastapi import APIRouter, HTTPException, Header, Query
 from pydantic import BaseModel, Field
 from typing import Optional, List, Literal
 from datetime import datetime, timezone
 from uuid import UUID
 from app.core.config import settings
-from app.services.supabase import client
-from app.services.game_logic import calculate_time_decay, update_care_score
+from app.services.supabase import get_async_client
+from app.services.damage import (
+    OVERDUE_TASK_LIMIT,
+    fetch_overdue_summary,
+    run_daily_damage,
+    run_daily_damage_rpc,
+    preview_daily_damage,
+    compare_damage_reports,
+    DAILY_DAMAGE_JOB,
+)
+from app.services.checkpoints import MAX_SHARDS, default_run_id
+from app.services.pet_cache import pet_cache
+from app.services.pagination import MAX_PAGE_SIZE, decode_cursor, fetch_keyset_page, projection
+from app.services.task_mutations import MAX_BATCH_SIZE, claim_tasks, complete_tasks, create_tasks, delete_tasks
+from app.services.game_logic import event_heal_amount, pet_event
+from app.services.write_behind import pet_event_buffer
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 
-# --- ダメージシステム定数 ---
-# 継続ダメージ型: 期限切れ日数に応じて毎日ダメージ
-DAMAGE_RULES = {
-    1: 5,   # 1日以上経過: 5ダメージ/日
-    3: 10,  # 3日以上経過: 10ダメージ/日
-    7: 20   # 7日以上経過: 20ダメージ/日 + 自動削除
-}
-
-PRIORITY_MULTIPLIER = {
-    "low": 1.0,
-    "medium": 1.5,
-    "high": 2.0,
-    "critical": 3.0
-}
-
-
-def calculate_overdue_damage(days_overdue: int, priority: str) -> float:
-    """
-    期限切れ日数と優先度からダメージを計算する
-    
-    継続ダメージ型: 該当するダメージ帯のダメージを毎日受ける
-    """
-    base_damage = 0
-    if days_overdue >= 7:
-        base_damage = DAMAGE_RULES[7]
-    elif days_overdue >= 3:
-        base_damage = DAMAGE_RULES[3]
-    elif days_overdue >= 1:
-        base_damage = DAMAGE_RULES[1]
-    
-    # 期限切れ未満（0日など）はダメージなし
-    if base_damage == 0:
-        return 0.0
-    
-    multiplier = PRIORITY_MULTIPLIER.get(priority, 1.0)
-    return base_damage * multiplier
-
-
-
 # --- スキーマ定義 ---
 class TaskCreate(BaseModel):
     """タスク作成リクエスト"""
@@ -88,93 +64,173 @@ class TaskResponse(BaseModel):
 class TaskComplete(BaseModel):
     """タスク完了リクエスト"""
     task_id: str
+    # 指定するとそのユーザーのタスクだけを対象にする（タスクの所有者と一致しない場合は404）
+    user_id: Optional[str] = None
+
+
+class TaskBatchItem(BaseModel):
+    """バッチ作成の1件"""
+    title: str = Field(..., min_length=1, max_length=200)
+    description: Optional[str] = None
+    priority: Literal['low', 'medium', 'high', 'critical'] = 'medium'
+    due_date: Optional[datetime] = None
+
+
+class TaskBatchCreate(BaseModel):
+    """タスクのバッチ作成リクエスト"""
+    user_id: str
+    tasks: List[TaskBatchItem] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class TaskBatchIds(BaseModel):
+    """タスクのバッチ完了・削除リクエスト（user_id のタスクだけが対象）"""
+    user_id: str
+    task_ids: List[UUID] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class TaskListItem(BaseModel):
+    """タスク一覧の1行（fields で射影した場合は指定した列だけを返す）"""
+    id: UUID
+    user_id: Optional[UUID] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    completed: Optional[bool] = None
+    priority: Optional[str] = None
+    source: Optional[str] = None
+    due_date: Optional[datetime] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
 
 
 class TaskListResponse(BaseModel):
     """タスク一覧レスポンス"""
-    tasks: List[TaskResponse]
-    total: int
+    tasks: List[TaskListItem]
+    # count=none の場合は None
+    total: Optional[int]
+    # 次のページのカーソル（最後のページなら None）
+    next_cursor: Optional[str] = None
 
 
 # --- エンドポイント ---
 @router.post("/", response_model=TaskResponse)
-def create_task(task_in: TaskCreate):
+async def create_task(task_in: TaskCreate):
     """
     新しいタスクを作成する。
     
     タスクを作成すると、対応するhabitsエントリも自動生成され、
     タスク完了時にペットを回復できるようになる。
     """
-    # タスクデータの準備
-    new_task = {
-        "user_id": task_in.user_id,
-        "title": task_in.title,
-        "description": task_in.description,
-        "priority": task_in.priority,
-        "source": "native",
-        "completed": False,
-    }
-    
-    if task_in.due_date:
-        new_task["due_date"] = task_in.due_date.isoformat()
-    
-    # タスクを挿入
-    response = client.table("tasks").insert(new_task).execute()
-    
-    if not response.data:
+    # タスクと habit の作成は DB関数 create_tasks() の1トランザクションで行う
+    # （habit の作成に失敗すればタスクもロールバックされる）
+    created = await create_tasks(get_async_client(), task_in.user_id, [task_in.model_dump(exclude={"user_id"})])
+
+    if not created:
         raise HTTPException(status_code=400, detail="Failed to create task")
-    
-    created_task = response.data[0]
-    
-    # 対応するhabitエントリを作成（タスク完了でHP回復するため）
-    habit_data = {
-        "user_id": task_in.user_id,
-        "title": task_in.title,
-        "frequency": "ONCE",  # 一回限りのタスク
-        "source": "native",
-        "task_id": created_task["id"],
+
+    return created[0]
+
+
+@router.post("/batch")
+async def create_tasks_batch(payload: TaskBatchCreate):
+    """
+    タスクをまとめて作成する（最大 MAX_BATCH_SIZE 件）。
+
+    タスクと habit は複数行 INSERT で1トランザクションで作成される（全件成功か全件失敗）。
+    results は入力順。
+    """
+    created = await create_tasks(
+        get_async_client(), payload.user_id, [t.model_dump() for t in payload.tasks]
+    )
+
+    if len(created) != len(payload.tasks):
+        raise HTTPException(status_code=400, detail="Failed to create tasks")
+
+    return {
+        "created": len(created),
+        "results": [{"status": "created", "task": task} for task in created],
+    }
+
+
+@router.post("/batch/complete")
+async def complete_tasks_batch(payload: TaskBatchIds):
+    """
+    タスクをまとめて完了し、ペットに1回で反映する（最大 MAX_BATCH_SIZE 件）。
+
+    回復量・飢餓度の減少・care_score の更新は完了したタスク分を合計して1回で書き込む。
+    results は入力順で、status は
+    completed / not_found / already_completed / duplicate / pet_not_found のいずれか。
+    """
+    result = await complete_tasks(get_async_client(), [str(t) for t in payload.task_ids], payload.user_id)
+    completed = sum(1 for r in result["results"] if r["status"] == "completed")
+    if completed:
+        pet_cache.invalidate(payload.user_id)
+
+    return {
+        "completed": completed,
+        "healed": result["healed"],
+        "results": result["results"],
+        "pet": result["pet"],
     }
-    
-    habit_response = client.table("habits").insert(habit_data).execute()
-    
-    if not habit_response.data:
-        # ロールバック: タスクを削除
-        client.table("tasks").delete().eq("id", created_task["id"]).execute()
-        raise HTTPException(status_code=400, detail="Failed to create associated habit")
-    
-    return created_task
 
 
-@router.get("/{user_id}", response_model=TaskListResponse)
-def get_user_tasks(
+@router.post("/batch/delete")
+async def delete_tasks_batch(payload: TaskBatchIds):
+    """
+    タスクをまとめて削除する（関連するhabitも削除される）。
+
+    results は入力順で、status は deleted / not_found のいずれか。
+    """
+    results = await delete_tasks(get_async_client(), payload.user_id, [str(t) for t in payload.task_ids])
+    return {
+        "deleted": sum(1 for r in results if r["status"] == "deleted"),
+        "results": results,
+    }
+
+
+@router.get("/{user_id}", response_model=TaskListResponse, response_model_exclude_unset=True)
+async def get_user_tasks(
     user_id: str,
     completed: Optional[bool] = None,
-    limit: int = 50
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="返す列（カンマ区切り）。例: id,title,due_date"),
+    count: Literal['exact', 'estimated', 'none'] = 'estimated',
 ):
     """
-    ユーザーのタスク一覧を取得する。
+    ユーザーのタスク一覧を取得する（新しい順、キーセットページング）。
     
     Args:
         user_id: ユーザーID
         completed: 完了状態でフィルタ（Noneの場合は全件）
-        limit: 取得件数上限
+        limit: 1ページの件数
+        cursor: 前のページの next_cursor（省略時は先頭ページ）
+        fields: 返す列（省略時は全列。created_at, id は常に含む）
+        count: total の求め方（exact / estimated / none）
     """
-    query = client.table("tasks").select("*").eq("user_id", user_id)
-    
-    if completed is not None:
-        query = query.eq("completed", completed)
-    
-    query = query.order("created_at", desc=True).limit(limit)
-    response = query.execute()
-    
-    if not response.data:
-        return {"tasks": [], "total": 0}
-    
-    return {"tasks": response.data, "total": len(response.data)}
+    try:
+        columns = projection(fields, TaskResponse.model_fields)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def apply_filters(query):
+        query = query.eq("user_id", user_id)
+        if completed is not None:
+            query = query.eq("completed", completed)
+        return query
+
+    page = await fetch_keyset_page(
+        get_async_client(), "tasks", apply_filters,
+        columns=columns, limit=limit, cursor=cursor, count=count,
+    )
+
+    return {"tasks": page["rows"], "total": page["total"], "next_cursor": page["next_cursor"]}
 
 
 @router.post("/complete", response_model=dict)
-def complete_task(payload: TaskComplete):
+async def complete_task(payload: TaskComplete):
     """
     タスクを完了し、ペットのHPを回復する。
     
@@ -183,94 +239,63 @@ def complete_task(payload: TaskComplete):
     - medium: +5 HP
     - high: +8 HP
     - critical: +12 HP
+
+    既定では complete_tasks() でタスクとペットを同じトランザクションで更新する（タスクをロックしてから
+    判定するので、同じタスクを続けて完了しても回復は1回だけ）。
+    PET_WRITE_COALESCE_SECONDS > 0 を設定した場合だけ、DB関数 claim_tasks() でタスクの完了を確定し、
+    ペットへの反映は書き込みバッファに積んで同じペットへの連続した完了を1回の UPDATE にまとめる
+    （返す pet は反映後の予測値。窓が閉じる前にプロセスが落ちると回復が失われる）。
     """
-    # タスクを取得
-    task_res = client.table("tasks").select("*").eq("id", payload.task_id).execute()
-    
-    if not task_res.data:
+    client = get_async_client()
+    now = datetime.now(timezone.utc)
+    if pet_event_buffer.enabled:
+        # タスクの完了だけを確定し、ペットへの反映は同じペットへの連続した完了とまとめて書き込む
+        result = await claim_tasks(client, [payload.task_id], payload.user_id, now)
+    else:
+        result = await complete_tasks(client, [payload.task_id], payload.user_id, now)
+    item = result["results"][0]
+    status = item["status"]
+
+    if status == "not_found":
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    task = task_res.data[0]
-    
-    if task["completed"]:
+
+    if status == "already_completed":
         raise HTTPException(status_code=400, detail="Task already completed")
-    
-    user_id = task["user_id"]
-    
-    # ユーザーのアクティブなペットを取得
-    pet_res = client.table("pets").select("*").eq("user_id", user_id).eq("status", "ALIVE").execute()
-    
-    if not pet_res.data:
+
+    if status == "pet_not_found":
         raise HTTPException(status_code=404, detail="Active pet not found")
-    
-    pet_data = pet_res.data[0]
-    
-    # 減衰を適用
-    decayed_pet = calculate_time_decay(pet_data)
-    
-    # 優先度に応じた回復量を決定
-    heal_amounts = {
-        "low": 3.0,
-        "medium": 5.0,
-        "high": 8.0,
-        "critical": 12.0,
-    }
-    heal_amount = heal_amounts.get(task["priority"], 5.0)
-    
-    # 回復・パラメータ更新
-    hunger_reduction = {"low": 8.0, "medium": 12.0, "high": 16.0, "critical": 20.0}
-    new_hunger = max(0.0, float(decayed_pet.get('hunger', 0)) - hunger_reduction.get(task["priority"], 10.0))
-    new_care_score = update_care_score(float(decayed_pet.get('care_score', 50)), 'task_complete')
-
-    if decayed_pet['status'] == 'ALIVE':
-        new_hp = min(float(decayed_pet['max_hp']), decayed_pet['hp'] + heal_amount)
-        decayed_pet['hp'] = new_hp
-
-    # ペットを更新
-    pet_update = {
-        "hp": decayed_pet['hp'],
-        "status": decayed_pet['status'],
-        "hunger": new_hunger,
-        "care_score": new_care_score,
-        "last_checked_at": datetime.now(timezone.utc).isoformat()
-    }
-    
-    pet_update_res = client.table("pets").update(pet_update).eq("id", pet_data['id']).execute()
-    
-    if not pet_update_res.data:
-        raise HTTPException(status_code=500, detail="Failed to update pet")
-    
-    # タスクを完了状態に更新
-    task_update = {
-        "completed": True,
-        "completed_at": datetime.now(timezone.utc).isoformat()
-    }
-    
-    task_update_res = client.table("tasks").update(task_update).eq("id", payload.task_id).execute()
-    
-    if not task_update_res.data:
-        raise HTTPException(status_code=500, detail="Failed to update task")
-    
+
+    if pet_event_buffer.enabled:
+        event = pet_event("task_complete", now, priority=item["priority"], task_id=str(item["task_id"]))
+        pet = await pet_event_buffer.submit(client, result["pet"], event)
+        heal_amount = event_heal_amount(event)
+    else:
+        pet_cache.invalidate(result["user_id"])
+        pet = result["pet"]
+        heal_amount = float(item["healed"])
+
     return {
         "status": "completed",
-        "task": task_update_res.data[0],
-        "pet": pet_update_res.data[0],
+        "task": next(iter(result["tasks"].values())),
+        "pet": pet,
         "healed": heal_amount,
         "message": f"Task completed! Healed {heal_amount} HP"
     }
 
 
 @router.delete("/{task_id}")
-def delete_task(task_id: str):
+async def delete_task(task_id: str):
     """タスクを削除する（関連するhabitも削除される）"""
+    client = get_async_client()
+
     # まずタスクの存在を確認
-    task_res = client.table("tasks").select("id").eq("id", task_id).execute()
+    task_res = await client.table("tasks").select("id").eq("id", task_id).execute()
     
     if not task_res.data:
         raise HTTPException(status_code=404, detail="Task not found")
     
     # タスクを削除（habitはCASCADEで自動削除）
-    delete_res = client.table("tasks").delete().eq("id", task_id).execute()
+    delete_res = await client.table("tasks").delete().eq("id", task_id).execute()
     
     if not delete_res.data:
         raise HTTPException(status_code=500, detail="Failed to delete task")
@@ -281,64 +306,40 @@ def delete_task(task_id: str):
 # ========== ダメージシステム エンドポイント ==========
 
 @router.get("/{user_id}/overdue")
-def get_overdue_tasks(user_id: str):
+async def get_overdue_tasks(
+    user_id: str,
+    limit: int = Query(OVERDUE_TASK_LIMIT, ge=0, le=1000, description="返すタスク数の上限（ダメージの大きい順）"),
+):
     """
     指定ユーザーの期限切れタスクと、予測されるダメージ量を取得する。
     
     継続ダメージ型: タスクを片付けるまで毎日ダメージを受け続ける。
+
+    期限切れの判定とダメージの集計はDB関数 overdue_summary() で行う
+    （未完了タスクを全件取得してPythonで判定しない）。
+    total_potential_damage / damage_by_bucket は全件の集計、overdue_tasks は上位 limit 件。
     """
-    now = datetime.now(timezone.utc)
-    
-    # 未完了 かつ 期限設定ありのタスクを取得
-    response = client.table("tasks").select("*")\
-        .eq("user_id", user_id)\
-        .eq("completed", False)\
-        .not_.is_("due_date", "null")\
-        .execute()
-    
-    tasks = response.data or []
-    overdue_list = []
-    total_damage = 0.0
-
-    for task in tasks:
-        due_date_str = task.get("due_date")
-        if not due_date_str:
-            continue
-            
-        # ISO形式の日付をパース
-        try:
-            due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-        except ValueError:
-            continue
-            
-        if due_date < now:
-            delta = now - due_date
-            days_overdue = delta.days
-            
-            # ダメージ計算
-            dmg = calculate_overdue_damage(days_overdue, task.get("priority", "medium"))
-            
-            if dmg > 0:
-                overdue_list.append({
-                    "id": task["id"],
-                    "title": task["title"],
-                    "due_date": task["due_date"],
-                    "days_overdue": days_overdue,
-                    "priority": task.get("priority", "medium"),
-                    "potential_damage": dmg
-                })
-                total_damage += dmg
+    summary = await fetch_overdue_summary(
+        get_async_client(), user_id, datetime.now(timezone.utc), task_limit=limit
+    )
+    overdue_count = summary["overdue_count"]
 
     return {
-        "overdue_tasks": overdue_list,
-        "total_potential_damage": total_damage,
-        "warning_message": f"⚠ {len(overdue_list)} OVERDUE TASKS DETECTED" if overdue_list else None
+        "overdue_tasks": summary["overdue_tasks"],
+        "overdue_count": overdue_count,
+        "total_potential_damage": summary["total_potential_damage"],
+        "damage_by_bucket": summary["damage_by_bucket"],
+        "warning_message": f"⚠ {overdue_count} OVERDUE TASKS DETECTED" if overdue_count else None
     }
 
 
 @router.get("/cron/damage")
-def apply_daily_damage(
-    x_api_key: str = Header(..., alias="X-API-KEY")
+async def apply_daily_damage(
+    x_api_key: str = Header(..., alias="X-API-KEY"),
+    shard: int = Query(0, ge=0, description="処理するシャード番号 (0始まり)"),
+    shards: int = Query(1, ge=1, le=MAX_SHARDS, description="シャード総数"),
+    engine: Optional[Literal['python', 'rpc', 'parity']] = Query(None, description="省略時は設定値 DAMAGE_ENGINE"),
+    dry_run: bool = Query(False, description="書き込まずにレポートだけ返す"),
 ):
     """
     【CRON用】全ユーザーのダメージ計算＆適用
@@ -349,100 +350,59 @@ def apply_daily_damage(
     セキュリティ: X-API-KEY ヘッダーで認証
     
     注意: Vercel CronはGETリクエストを送信するため、GETで実装。
+
+    シャード実行: shards=N として shard=0..N-1 を別々のワーカーで並列に呼び出せる。
+    時間予算内に終わらなかった場合は status="partial" を返すので、同じ引数で再度呼び出すと
+    チェックポイントから再開する。run_id は常に日付から "daily-damage-YYYYMMDD" を作る
+    （呼び出し側からは指定できない。別の run_id を渡せると、同じ日に全ペットへ2回ダメージが入るため）ので、
+    同じ日に何度呼び出しても1匹に2回ダメージが入ることはない。
+
+    engine:
+    - python: バルクエンジン（シャード・チェックポイント対応）
+    - rpc: DB関数 apply_daily_damage() を1回呼び出して全件を1ステートメントで処理
+    - parity: 両方をドライランで実行し、結果の食い違いを返す（書き込みなし）
     """
     # セキュリティチェック
     expected_key = settings.CRON_SECRET
     if x_api_key != expected_key:
         raise HTTPException(status_code=403, detail="Unauthorized: Invalid API Key")
 
-    now = datetime.now(timezone.utc)
-    
-    # 1. 全てのALIVE/CRITICALなペットを取得
-    pets_res = client.table("pets").select("*").in_("status", ["ALIVE", "CRITICAL"]).execute()
-    pets = pets_res.data or []
-    
-    report = {
-        "status": "completed",
-        "processed_pets": 0,
-        "total_damage_dealt": 0.0,
-        "pets_killed": 0,
-        "tasks_deleted": 0,
-        "details": []
-    }
-
-    for pet in pets:
-        user_id = pet["user_id"]
-        
-        # 2. そのユーザーの期限切れタスクを取得
-        tasks_res = client.table("tasks").select("*")\
-            .eq("user_id", user_id)\
-            .eq("completed", False)\
-            .not_.is_("due_date", "null")\
-            .execute()
-            
-        tasks = tasks_res.data or []
-        if not tasks:
-            continue
-
-        total_pet_damage = 0.0
-        overdue_count = 0
-        
-        # 3. ダメージ計算
-        for task in tasks:
-            due_date_str = task.get("due_date")
-            if not due_date_str:
-                continue
-                
-            try:
-                due_date = datetime.fromisoformat(due_date_str.replace('Z', '+00:00'))
-            except ValueError:
-                continue
-                
-            if due_date >= now:
-                continue  # 期限切れではない
-                
-            days_overdue = (now - due_date).days
-            dmg = calculate_overdue_damage(days_overdue, task.get("priority", "medium"))
-            
-            # 7日以上経過したタスクの自動削除
-            if days_overdue >= 7:
-                client.table("tasks").delete().eq("id", task["id"]).execute()
-                report["tasks_deleted"] += 1
-            
-            total_pet_damage += dmg
-            if dmg > 0:
-                overdue_count += 1
-
-        if total_pet_damage > 0:
-            # 4. HP更新
-            new_hp = max(0, pet["hp"] - total_pet_damage)
-            new_status = pet["status"]
-            
-            # 死亡判定（DB制約: ALIVE/DEADのみ。CRITICALはフロントで判定）
-            if new_hp <= 0:
-                new_status = "DEAD"
-                report["pets_killed"] += 1
-            # new_hp <= 30 でも status は ALIVE のまま（フロントでHP値から判定）
-                
-            # DB更新
-            client.table("pets").update({
-                "hp": new_hp,
-                "status": new_status,
-                "last_checked_at": now.isoformat()
-            }).eq("id", pet["id"]).execute()
-
-            # レポートに追加
-            report["details"].append({
-                "user_id": user_id,
-                "pet_name": pet["name"],
-                "damage": total_pet_damage,
-                "new_hp": new_hp,
-                "status": new_status,
-                "overdue_tasks": overdue_count
-            })
-            
-            report["total_damage_dealt"] += total_pet_damage
-            report["processed_pets"] += 1
-
-    return report
+    if shard >= shards:
+        raise HTTPException(status_code=400, detail="shard must be less than shards")
 
+    client = get_async_client()
+    now = datetime.now(timezone.utc)
+    engine = engine or settings.DAMAGE_ENGINE
+    run_id = default_run_id(DAILY_DAMAGE_JOB, now)
+
+    if engine == 'parity':
+        python_report, rpc_report = await asyncio.gather(
+            preview_daily_damage(client, now),
+            run_daily_damage_rpc(client, now, dry_run=True),
+        )
+        mismatches = compare_damage_reports(python_report, rpc_report)
+        return {
+            "status": "match" if not mismatches else "mismatch",
+            "processed_pets": python_report["processed_pets"],
+            "mismatches": mismatches,
+        }
+
+    if engine == 'rpc':
+        report = await run_daily_damage_rpc(client, now, run_id=run_id, dry_run=dry_run)
+        if not dry_run:
+            # 更新されたペットは details にすべて含まれる
+            pet_cache.invalidate_many(d["user_id"] for d in report.get("details", []))
+        return report
+
+    if dry_run:
+        return await preview_daily_damage(client, now)
+
+    # ペット単位のループではなく、ページング取得 + メモリ集計 + バルク書き込みで処理する
+    return await run_daily_damage(
+        client,
+        now,
+        run_id=run_id,
+        shard_index=shard,
+        shard_count=shards,
+        time_budget_seconds=settings.CRON_TIME_BUDGET_SECONDS,
+    )
@@ -0,0 +1,61 @@
+import json
+import logging
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request
+from typing import Optional
+from app.core.config import settings
+from app.services.supabase import get_async_client
+from app.services.notion import get_notion_service
+from app.services.notion_webhook import SIGNATURE_HEADER, verify_signature, webhook_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+
+def _record(body: bytes) -> None:
+    """NOTION_WEBHOOK_RECORD_PATH に生ボディを1行で追記する（scripts/notion_replay.py で再生できる形式）"""
+    try:
+        with open(settings.NOTION_WEBHOOK_RECORD_PATH, "ab") as f:
+            f.write(json.dumps(json.loads(body), ensure_ascii=False).encode() + b"\n")
+    except (OSError, ValueError):
+        logger.exception("Failed to record Notion webhook")
+
+
+@router.post("/notion", status_code=202)
+async def receive_notion_webhook(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    signature: Optional[str] = Header(None, alias=SIGNATURE_HEADER),
+):
+    """
+    Notion webhook の受信
+
+    署名（X-Notion-Signature）を検証してキューに積むだけで、すぐに 202 を返す。
+    反映はレスポンス後に、ページごとにまとめてから行う（app.services.notion_webhook を参照）。
+    Lambda 上では既定でまとめずにすぐ反映する（Mangum はバックグラウンドタスクの完了を待ってから返すため）。
+    """
+    body = await request.body()
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    # サブスクリプション作成時の確認リクエスト（署名なし）。トークンを NOTION_WEBHOOK_SECRET に設定する
+    # 設定後はトークンをログに出さない
+    if isinstance(payload, dict) and "verification_token" in payload and "type" not in payload:
+        if not settings.NOTION_WEBHOOK_SECRET:
+            logger.warning(
+                "Notion webhook verification_token: %s (set it as NOTION_WEBHOOK_SECRET)", payload["verification_token"]
+            )
+        return {"status": "verification_received"}
+
+    if not verify_signature(body, signature, settings.NOTION_WEBHOOK_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    if settings.NOTION_WEBHOOK_RECORD_PATH:
+        _record(body)
+
+    queued = webhook_queue.add(payload)
+    if queued:
+        background_tasks.add_task(webhook_queue.flush_when_due, get_async_client(), get_notion_service())
+    return {"status": "queued" if queued else "ignored", "pending": webhook_queue.pending()}
@@ -0,0 +1,212 @@
+"""
+CRONジョブのシャード分割・チェックポイント管理
+
+pets.id（UUID）の空間をshard_count等分し、各シャードをid順のキーセットページングで処理する。
+1ユーザーのペットは別々のシャード・ページに入りうるので、ユーザー単位のルール（日次ダメージの
+「7日以上のタスクは最初のペットだけ」など）はページの外で決める（app.services.damage.fetch_first_pets）。
+ページを1つ書き込むたびに cron_checkpoints に (run_id, shard) ごとのカーソルを保存するので、
+タイムアウトで途中終了しても同じrun_idで再実行すれば続きから再開できる。
+
+同じページを二重に適用しないよう、ダメージを書き込んだペットには
+pets.last_damage_run_id = run_id を記録し、取得時に除外する
+（ページ書き込み後・チェックポイント保存前に落ちた場合の保険）。
+compare-and-swap のリトライを使い切ったペットがあった場合は、カーソルをそのペットの手前で止めて
+status="partial" で返す（次の呼び出しでそのペットから読み直す。書き込み済みのペットは上の除外で飛ばされる）。
+last_damage_run_id は daily-damage と manual-damage で共用するので、manual-damage は
+今日の daily-damage の run_id が付いたペットを書き換えない（app.routers.sync.manual_damage）。
+"""
+
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+CHECKPOINT_TABLE = "cron_checkpoints"
+SHARD_PAGE_SIZE = 500
+MAX_SHARDS = 64
+
+# PostgRESTのフィルタ構文と衝突しない文字だけを許可する
+RUN_ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
+_UUID_SPACE = 1 << 128
+
+logger = logging.getLogger(__name__)
+
+
+def _int_to_uuid(value: int) -> str:
+    h = f"{value:032x}"
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def shard_bounds(shard_index: int, shard_count: int) -> Tuple[str, Optional[str]]:
+    """
+    シャードが担当するidの範囲 [lo, hi) を返す（最後のシャードは hi=None）。
+
+    gen_random_uuid() のidは一様分布なので、UUID空間の等分でほぼ均等に分かれる。
+    PostgreSQLのuuid比較はバイト順＝16進文字列の辞書順と一致する。
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard_index must be in [0, {shard_count})")
+    lo = _int_to_uuid(_UUID_SPACE * shard_index // shard_count)
+    hi = None
+    if shard_index + 1 < shard_count:
+        hi = _int_to_uuid(_UUID_SPACE * (shard_index + 1) // shard_count)
+    return lo, hi
+
+
+def default_run_id(job: str, now: datetime) -> str:
+    """1日1回のジョブ用run_id（同じ日の再実行は同じrun_idになる）"""
+    return f"{job}-{now:%Y%m%d}"
+
+
+def validate_run_id(run_id: str) -> str:
+    if not re.match(RUN_ID_PATTERN, run_id):
+        raise ValueError("run_id may only contain letters, digits, '-' and '_' (max 64 chars)")
+    return run_id
+
+
+async def load_checkpoint(client, job: str, run_id: str, shard_index: int, shard_count: int) -> Dict[str, Any]:
+    res = await client.table(CHECKPOINT_TABLE)\
+        .select("*")\
+        .eq("run_id", run_id)\
+        .eq("shard_index", shard_index)\
+        .eq("shard_count", shard_count)\
+        .execute()
+    if res.data:
+        return res.data[0]
+    return {
+        "job": job,
+        "run_id": run_id,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "cursor": None,
+        "status": "running",
+        "processed_pets": 0,
+        "total_damage": 0.0,
+        "pets_killed": 0,
+        "tasks_deleted": 0,
+    }
+
+
+async def save_checkpoint(client, checkpoint: Dict[str, Any], now: datetime) -> None:
+    row = dict(checkpoint)
+    row["updated_at"] = now.isoformat()
+    await client.table(CHECKPOINT_TABLE)\
+        .upsert(row, on_conflict="run_id,shard_index,shard_count")\
+        .execute()
+
+
+async def fetch_shard_page(
+    client,
+    columns: str,
+    statuses: List[str],
+    run_id: str,
+    shard_index: int,
+    shard_count: int,
+    cursor: Optional[str],
+) -> List[Dict[str, Any]]:
+    """シャード内で cursor より後ろのペットを id 順に1ページ取得する（このrun_idで処理済みは除外）"""
+    lo, hi = shard_bounds(shard_index, shard_count)
+    query = client.table("pets")\
+        .select(columns)\
+        .in_("status", statuses)\
+        .or_(f"last_damage_run_id.is.null,last_damage_run_id.neq.{run_id}")
+
+    if cursor:
+        query = query.gt("id", cursor)
+    else:
+        query = query.gte("id", lo)
+    if hi:
+        query = query.lt("id", hi)
+
+    res = await query.order("id").limit(SHARD_PAGE_SIZE).execute()
+    return res.data or []
+
+
+async def run_sharded(
+    client,
+    job: str,
+    run_id: str,
+    shard_index: int,
+    shard_count: int,
+    now: datetime,
+    columns: str,
+    statuses: List[str],
+    process_page: Callable[[List[Dict[str, Any]]], Awaitable[Dict[str, Any]]],
+    time_budget_seconds: float,
+) -> Dict[str, Any]:
+    """
+    1シャード分をページ単位で処理し、ページごとにチェックポイントを保存する。
+
+    process_page は（async関数で）ページ内のペットに対して書き込みまで行い、
+    processed_pets / total_damage / pets_killed / tasks_deleted / details と、
+    リトライを使い切って書き込めなかったペットの id（exhausted_pets）を返す。
+    時間予算を使い切った場合・exhausted_pets があった場合は status="partial" で返すので、
+    呼び出し側は同じ引数で再実行すればよい。
+    """
+    deadline = time.monotonic() + time_budget_seconds
+    checkpoint = await load_checkpoint(client, job, run_id, shard_index, shard_count)
+
+    report: Dict[str, Any] = {
+        "status": "completed",
+        "processed_pets": 0,
+        "total_damage_dealt": 0.0,
+        "pets_killed": 0,
+        "tasks_deleted": 0,
+        "details": [],
+        "exhausted_pets": [],
+    }
+
+    while checkpoint["status"] != "completed":
+        if time.monotonic() >= deadline:
+            report["status"] = "partial"
+            break
+
+        cursor_before = checkpoint["cursor"]
+        pets = await fetch_shard_page(
+            client, columns, statuses, run_id, shard_index, shard_count, cursor_before
+        )
+        if pets:
+            page_report = await process_page(pets)
+            report["processed_pets"] += page_report["processed_pets"]
+            report["total_damage_dealt"] += page_report["total_damage_dealt"]
+            report["pets_killed"] += page_report["pets_killed"]
+            report["tasks_deleted"] += page_report["tasks_deleted"]
+            report["details"].extend(page_report["details"])
+
+            checkpoint["cursor"] = pets[-1]["id"]
+            checkpoint["processed_pets"] += page_report["processed_pets"]
+            checkpoint["total_damage"] += page_report["total_damage_dealt"]
+            checkpoint["pets_killed"] += page_report["pets_killed"]
+            checkpoint["tasks_deleted"] += page_report["tasks_deleted"]
+
+            exhausted = set(page_report.get("exhausted_pets") or [])
+            if exhausted:
+                # 書き込めなかった最初のペットの手前でカーソルを止める（次の呼び出しで再試行する）
+                first = next(i for i, pet in enumerate(pets) if str(pet["id"]) in exhausted)
+                checkpoint["cursor"] = pets[first - 1]["id"] if first > 0 else cursor_before
+                report["exhausted_pets"].extend(sorted(exhausted))
+                report["status"] = "partial"
+                logger.warning(
+                    "%s %s shard %d/%d: compare-and-swap retries exhausted for pets %s; holding cursor at %s",
+                    job, run_id, shard_index, shard_count, sorted(exhausted), checkpoint["cursor"],
+                )
+                await save_checkpoint(client, checkpoint, now)
+                break
+
+        if len(pets) < SHARD_PAGE_SIZE:
+            checkpoint["status"] = "completed"
+        await save_checkpoint(client, checkpoint, now)
+
+    report["run"] = {
+        "run_id": run_id,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "cursor": checkpoint["cursor"],
+        "processed_pets": checkpoint["processed_pets"],
+        "total_damage": checkpoint["total_damage"],
+        "pets_killed": checkpoint["pets_killed"],
+        "tasks_deleted": checkpoint["tasks_deleted"],
+    }
+    return report
@@ -0,0 +1,513 @@
+"""
+期限切れタスクによるダメージ計算と、CRON用のバルク適用エンジン
+
+【ダメージシステム】
+- 継続ダメージ型: 期限切れタスクは毎日ダメージを与え続ける
+- 7日以上経過したタスクは自動削除
+
+バルクエンジンはペット1匹ごとにクエリを発行せず、
+1. 生存ペットをページ単位で取得
+2. そのユーザー群の期限切れタスクをまとめて取得（ページング）
+3. メモリ上でユーザーごとに集計
+4. HP更新・タスク削除をまとめて書き込む
+という流れで、PostgRESTへの往復回数をペット数に比例させない。
+
+ペットの取得は app.services.checkpoints によるシャード単位のキーセットページングで行い、
+ページごとにチェックポイントを保存する（タイムアウト後の再実行は続きから再開）。
+
+同じルールは database/migrations/005_daily_damage_function.sql の apply_daily_damage()
+にも実装されている（engine="rpc"）。Python版はドライランと一致確認（parity）用に残す。
+固定のデータセットでの一致は tests/test_damage_parity.py で確認する。
+"""
+
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.services.checkpoints import run_sharded
+from app.services.game_logic import pet_event
+from app.services.pet_cache import pet_cache
+from app.services.pet_writes import update_pets_cas
+
+# --- ダメージシステム定数 ---
+# 継続ダメージ型: 期限切れ日数に応じて毎日ダメージ
+DAMAGE_RULES = {
+    1: 5,   # 1日以上経過: 5ダメージ/日
+    3: 10,  # 3日以上経過: 10ダメージ/日
+    7: 20   # 7日以上経過: 20ダメージ/日 + 自動削除
+}
+
+PRIORITY_MULTIPLIER = {
+    "low": 1.0,
+    "medium": 1.5,
+    "high": 2.0,
+    "critical": 3.0
+}
+
+# 自動削除の閾値（日）
+AUTO_DELETE_DAYS = 7
+
+DAILY_DAMAGE_JOB = "daily-damage"
+
+# --- バルク処理のサイズ ---
+PET_PAGE_SIZE = 1000      # 1回で取得するペット数（PostgRESTのmax-rows以下）
+TASK_PAGE_SIZE = 1000     # 1回で取得するタスク数
+USER_CHUNK_SIZE = 200     # in_() に渡すuser_id数（URL長の制限対策）
+WRITE_BATCH_SIZE = 500    # 1回のupsert/deleteで扱う行数
+OVERDUE_TASK_LIMIT = 100  # GET /tasks/{user_id}/overdue で返すタスク数の既定値
+
+# バルクエンジンが読むペットの列（version は compare-and-swap 用）
+DAMAGE_PET_COLUMNS = "id, user_id, name, hp, status, version, last_damage_run_id"
+
+
+def calculate_overdue_damage(days_overdue: int, priority: str) -> float:
+    """
+    期限切れ日数と優先度からダメージを計算する
+
+    継続ダメージ型: 該当するダメージ帯のダメージを毎日受ける
+    """
+    base_damage = 0
+    if days_overdue >= 7:
+        base_damage = DAMAGE_RULES[7]
+    elif days_overdue >= 3:
+        base_damage = DAMAGE_RULES[3]
+    elif days_overdue >= 1:
+        base_damage = DAMAGE_RULES[1]
+
+    # 期限切れ未満（0日など）はダメージなし
+    if base_damage == 0:
+        return 0.0
+
+    multiplier = PRIORITY_MULTIPLIER.get(priority, 1.0)
+    return base_damage * multiplier
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """SupabaseのISO文字列をdatetimeに変換する（失敗時はNone）"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def _chunks(items: List[Any], size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def new_damage_report() -> Dict[str, Any]:
+    return {
+        "status": "completed",
+        "processed_pets": 0,
+        "total_damage_dealt": 0.0,
+        "pets_killed": 0,
+        "tasks_deleted": 0,
+        "details": []
+    }
+
+
+async def fetch_live_pets(client) -> List[Dict[str, Any]]:
+    """ALIVE/CRITICALなペットをid順にページングして全件取得する"""
+    pets: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        res = await client.table("pets")\
+            .select("id, user_id, name, hp, status")\
+            .in_("status", ["ALIVE", "CRITICAL"])\
+            .order("id")\
+            .range(start, start + PET_PAGE_SIZE - 1)\
+            .execute()
+        page = res.data or []
+        pets.extend(page)
+        if len(page) < PET_PAGE_SIZE:
+            return pets
+        start += PET_PAGE_SIZE
+
+
+async def fetch_overdue_tasks(client, user_ids: List[str], now: datetime) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    指定ユーザー群の未完了・期限切れタスクをまとめて取得し、user_idごとに分類する。
+
+    user_idはUSER_CHUNK_SIZE件ずつ in_() に渡し、各チャンク内はid順でページングする。
+    チャンク同士は独立しているので並行に取得する。
+    """
+    now_iso = now.isoformat()
+
+    async def fetch_chunk(chunk: List[str]) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            res = await client.table("tasks")\
+                .select("id, user_id, priority, due_date")\
+                .in_("user_id", chunk)\
+                .eq("completed", False)\
+                .lt("due_date", now_iso)\
+                .order("id")\
+                .range(start, start + TASK_PAGE_SIZE - 1)\
+                .execute()
+            page = res.data or []
+            rows.extend(page)
+            if len(page) < TASK_PAGE_SIZE:
+                return rows
+            start += TASK_PAGE_SIZE
+
+    chunks = list(_chunks(sorted(set(user_ids)), USER_CHUNK_SIZE))
+    tasks_by_user: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for rows in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        for task in rows:
+            tasks_by_user[task["user_id"]].append(task)
+
+    return tasks_by_user
+
+
+async def fetch_first_pets(client, user_ids: List[str], run_id: Optional[str] = None) -> Dict[str, str]:
+    """
+    ユーザーごとの「最初のペット」（生存ペットのうち id が最小のもの）を返す: user_id -> pet_id
+
+    apply_daily_damage() の pet_rank = 1 と同じ順位付け。シャードはペットの id で分かれ、
+    1ユーザーのペットが別のシャード・別のページに入りうるので、ページの中ではなくテーブル全体で順位を決める。
+    run_id を渡すと、この run で既にダメージを書き込んだペット（死亡したものを含む）も順位に含める
+    （並行する別のシャードが最初のペットを書き込んでも、2匹目が最初のペットに繰り上がらないように）。
+    """
+    async def fetch_chunk(chunk: List[str]) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = client.table("pets")\
+                .select("id, user_id")\
+                .in_("user_id", chunk)
+            if run_id:
+                query = query.or_(f"status.in.(ALIVE,CRITICAL),last_damage_run_id.eq.{run_id}")
+            else:
+                query = query.in_("status", ["ALIVE", "CRITICAL"])
+            res = await query\
+                .order("user_id")\
+                .order("id")\
+                .range(start, start + PET_PAGE_SIZE - 1)\
+                .execute()
+            page = res.data or []
+            rows.extend(page)
+            if len(page) < PET_PAGE_SIZE:
+                return rows
+            start += PET_PAGE_SIZE
+
+    chunks = list(_chunks(sorted(set(user_ids)), USER_CHUNK_SIZE))
+    first_pets: Dict[str, str] = {}
+    for rows in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        for pet in rows:
+            first_pets.setdefault(pet["user_id"], str(pet["id"]))
+    return first_pets
+
+
+def compute_damage_plan(
+    pets: List[Dict[str, Any]],
+    tasks_by_user: Dict[str, List[Dict[str, Any]]],
+    now: datetime,
+    run_id: Optional[str] = None,
+    first_pets: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    ペットとタスクからダメージ計画（書き込み内容とレポート）を組み立てる。DBには触れない。
+
+    ペット1匹ずつ処理していた従来ループと同じ結果になるよう、
+    同一ユーザーに複数の生存ペットがいる場合は、最初のペットだけが
+    7日以上経過したタスクのダメージを受けて削除する（後続のペットには効かない）。
+    最初のペットは first_pets（fetch_first_pets）で決める。省略した場合は pets の中で
+    ユーザーごとに最初に出てくるペット（pets が全件を id 順に含む場合だけ正しい）。
+
+    run_id を渡すと、更新行に last_damage_run_id を記録する（同じrunでの二重適用防止）。
+    delete_ids_by_pet は削除するタスクをダメージを受けたペットごとに分けたもの
+    （ペットを書き込めなかった場合にタスクを残すため。apply_damage_plan を参照）。
+    """
+    report = new_damage_report()
+    pet_updates: List[Dict[str, Any]] = []
+    damage_by_pet: Dict[str, float] = {}
+    delete_ids: List[str] = []
+    delete_ids_by_pet: Dict[str, List[str]] = {}
+    if first_pets is None:
+        first_pets = {}
+        for pet in pets:
+            first_pets.setdefault(pet["user_id"], str(pet["id"]))
+
+    for pet in pets:
+        user_id = pet["user_id"]
+        tasks = tasks_by_user.get(user_id, [])
+        if not tasks:
+            continue
+        is_first_pet = first_pets.get(user_id) == str(pet["id"])
+
+        total_pet_damage = 0.0
+        overdue_count = 0
+        pet_delete_ids: List[str] = []
+
+        for task in tasks:
+            due_date = parse_timestamp(task.get("due_date"))
+            if due_date is None or due_date >= now:
+                continue  # 期限切れではない
+
+            days_overdue = (now - due_date).days
+
+            # 7日以上経過したタスクは最初のペットだけがダメージを受け、自動削除する
+            if days_overdue >= AUTO_DELETE_DAYS:
+                if not is_first_pet:
+                    continue
+                delete_ids.append(task["id"])
+                pet_delete_ids.append(task["id"])
+                report["tasks_deleted"] += 1
+
+            dmg = calculate_overdue_damage(days_overdue, task.get("priority", "medium"))
+
+            total_pet_damage += dmg
+            if dmg > 0:
+                overdue_count += 1
+
+        if total_pet_damage <= 0:
+            continue
+
+        new_hp = max(0, pet["hp"] - total_pet_damage)
+        new_status = pet["status"]
+
+        # 死亡判定（DB制約: ALIVE/DEADのみ。CRITICALはフロントで判定）
+        if new_hp <= 0:
+            new_status = "DEAD"
+            report["pets_killed"] += 1
+
+        # version は compare-and-swap 用（ドライランでは読んでいないので None）
+        pet_update = {
+            "id": pet["id"],
+            "version": pet.get("version"),
+            "hp": new_hp,
+            "status": new_status,
+            "last_checked_at": now.isoformat()
+        }
+        event = {"damage": total_pet_damage, "overdue_tasks": overdue_count, "resets_decay": True}
+        if run_id:
+            pet_update["last_damage_run_id"] = run_id
+            event["run_id"] = run_id
+        # 書き込みと同じトランザクションで pet_events に追記する（競合して再計算しても同じイベント）
+        pet_update["events"] = [pet_event("overdue_damage", now, **event)]
+        pet_updates.append(pet_update)
+        damage_by_pet[str(pet["id"])] = total_pet_damage
+        if pet_delete_ids:
+            delete_ids_by_pet[str(pet["id"])] = pet_delete_ids
+
+        report["details"].append({
+            "user_id": user_id,
+            "pet_name": pet["name"],
+            "damage": total_pet_damage,
+            "new_hp": new_hp,
+            "status": new_status,
+            "overdue_tasks": overdue_count
+        })
+        report["total_damage_dealt"] += total_pet_damage
+        report["processed_pets"] += 1
+
+    return {
+        "report": report,
+        "pet_updates": pet_updates,
+        "damage_by_pet": damage_by_pet,
+        "delete_ids": delete_ids,
+        "delete_ids_by_pet": delete_ids_by_pet,
+    }
+
+
+def _reconcile_report(
+    plan: Dict[str, Any], written: Dict[str, Dict[str, Any]], exhausted: List[str], tasks_deleted: int,
+) -> None:
+    """
+    実際に書き込めた値でレポートを直す（details と pet_updates は同じ順に1件ずつ対応する）
+
+    競合して読み直したペットは new_hp / status が計画と変わり、
+    読み直したら死亡・処理済みだったペット（書き込まなかった）はレポートから外す。
+    リトライを使い切ったペットは exhausted_pets に入れる（run_sharded がカーソルをその手前で止める）。
+    """
+    report = plan["report"]
+    report["tasks_deleted"] = tasks_deleted
+    report["exhausted_pets"] = exhausted
+    details = []
+    for update, detail in zip(plan["pet_updates"], report["details"]):
+        row = written.get(str(update["id"]))
+        if row is None:
+            report["processed_pets"] -= 1
+            report["total_damage_dealt"] -= detail["damage"]
+            continue
+        details.append(dict(detail, new_hp=row["hp"], status=row["status"]))
+    report["details"] = details
+    report["pets_killed"] = sum(1 for d in details if d["status"] == "DEAD")
+
+
+async def apply_damage_plan(client, plan: Dict[str, Any]) -> None:
+    """
+    ダメージ計画をまとめて書き込む（ペットは compare-and-swap、タスクは in_() で一括削除）
+
+    読んだ後に回復などで更新されたペットは読み直し、同じダメージ量を新しいHPに適用し直す。
+    リトライを使い切ったペットの7日以上経過したタスクは削除しない（再試行したときにそのペットが
+    同じダメージを受けられるように）。そのためタスクの削除はペットの書き込みの後に行う。
+    """
+    damage_by_pet = plan["damage_by_pet"]
+    planned = {str(u["id"]): u for u in plan["pet_updates"]}
+    written: Dict[str, Dict[str, Any]] = {}
+    exhausted: List[str] = []
+
+    def recompute(pet: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        update = planned[str(pet["id"])]
+        if pet["status"] not in ("ALIVE", "CRITICAL"):
+            return None
+        if update.get("last_damage_run_id") and pet.get("last_damage_run_id") == update["last_damage_run_id"]:
+            return None
+        new_hp = max(0, pet["hp"] - damage_by_pet[str(pet["id"])])
+        return dict(
+            update,
+            version=pet["version"],
+            hp=new_hp,
+            status="DEAD" if new_hp <= 0 else pet["status"],
+        )
+
+    async def write_pets(batch: List[Dict[str, Any]]) -> None:
+        result = await update_pets_cas(
+            client, batch, recompute, writer="daily_damage", columns=DAMAGE_PET_COLUMNS,
+        )
+        written.update(result["written"])
+        exhausted.extend(result["exhausted"])
+        pet_cache.invalidate_many(row["user_id"] for row in result["written"].values())
+
+    async def delete_tasks(batch: List[str]) -> None:
+        await client.table("tasks").delete().in_("id", batch).execute()
+
+    await asyncio.gather(*(write_pets(batch) for batch in _chunks(plan["pet_updates"], WRITE_BATCH_SIZE)))
+    withheld = {
+        task_id for pet_id in exhausted for task_id in plan["delete_ids_by_pet"].get(pet_id, [])
+    }
+    delete_ids = [task_id for task_id in plan["delete_ids"] if task_id not in withheld]
+    await asyncio.gather(*(delete_tasks(batch) for batch in _chunks(delete_ids, WRITE_BATCH_SIZE)))
+    _reconcile_report(plan, written, exhausted, len(delete_ids))
+
+
+async def run_daily_damage(
+    client,
+    now: datetime,
+    run_id: str,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    time_budget_seconds: float = 25.0,
+) -> Dict[str, Any]:
+    """
+    全ユーザーのダメージ計算＆適用（バルク版・シャード対応）
+
+    ペットはシャードのページ（checkpoints.SHARD_PAGE_SIZE = 500匹）ごとに読み、1ページごとに:
+    タスク取得 ceil(U/USER_CHUNK_SIZE)〜 + 最初のペットの取得 ceil(U/USER_CHUNK_SIZE)〜（並行。
+    それぞれ TASK_PAGE_SIZE / PET_PAGE_SIZE = 1000行ずつ）+ 書き込み ceil(N/WRITE_BATCH_SIZE) + チェックポイント1回
+    """
+    async def process_page(pets: List[Dict[str, Any]]) -> Dict[str, Any]:
+        user_ids = [p["user_id"] for p in pets]
+        tasks_by_user, first_pets = await asyncio.gather(
+            fetch_overdue_tasks(client, user_ids, now),
+            fetch_first_pets(client, user_ids, run_id),
+        )
+        plan = compute_damage_plan(pets, tasks_by_user, now, run_id=run_id, first_pets=first_pets)
+        await apply_damage_plan(client, plan)
+        return plan["report"]
+
+    return await run_sharded(
+        client,
+        job=DAILY_DAMAGE_JOB,
+        run_id=run_id,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        now=now,
+        columns=DAMAGE_PET_COLUMNS,
+        statuses=["ALIVE", "CRITICAL"],
+        process_page=process_page,
+        time_budget_seconds=time_budget_seconds,
+    )
+
+
+async def preview_daily_damage(client, now: datetime) -> Dict[str, Any]:
+    """Python版のドライラン: 書き込みもチェックポイント保存も行わずにレポートだけ返す"""
+    pets = await fetch_live_pets(client)
+    tasks_by_user = await fetch_overdue_tasks(client, [p["user_id"] for p in pets], now)
+    report = compute_damage_plan(pets, tasks_by_user, now)["report"]
+    report["engine"] = "python"
+    report["dry_run"] = True
+    return report
+
+
+async def run_daily_damage_rpc(
+    client,
+    now: datetime,
+    run_id: Optional[str] = None,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """DB関数 apply_daily_damage() を1回呼び出して全ユーザー分を計算・適用する"""
+    res = await client.rpc("apply_daily_damage", {
+        "p_run_id": run_id,
+        "p_now": now.isoformat(),
+        "p_dry_run": dry_run,
+    }).execute()
+    return res.data
+
+
+async def fetch_overdue_summary(
+    client,
+    user_id: str,
+    now: datetime,
+    task_limit: int = OVERDUE_TASK_LIMIT,
+) -> Dict[str, Any]:
+    """
+    DB関数 overdue_summary() で1ユーザーの期限切れタスクを集計する
+
+    期限切れの判定・列の絞り込み・経過日数帯 x 優先度ごとのダメージ集計はDB内で行い、
+    返ってくるのは集計値とダメージの大きい上位 task_limit 件だけ。
+    """
+    res = await client.rpc("overdue_summary", {
+        "p_user_id": user_id,
+        "p_now": now.isoformat(),
+        "p_task_limit": task_limit,
+    }).execute()
+    return res.data
+
+
+def compare_damage_reports(
+    python_report: Dict[str, Any],
+    rpc_report: Dict[str, Any],
+    tolerance: float = 1e-9,
+) -> List[Dict[str, Any]]:
+    """
+    Python版とRPC版のレポートを突き合わせ、食い違いのリストを返す（空なら一致）。
+
+    details は (user_id, pet_name) の出現順で対応付け、damage / new_hp / status / overdue_tasks を比較する。
+    """
+    mismatches: List[Dict[str, Any]] = []
+
+    for key in ("processed_pets", "pets_killed", "tasks_deleted"):
+        if python_report[key] != rpc_report[key]:
+            mismatches.append({"field": key, "python": python_report[key], "rpc": rpc_report[key]})
+    if abs(python_report["total_damage_dealt"] - rpc_report["total_damage_dealt"]) > tolerance:
+        mismatches.append({
+            "field": "total_damage_dealt",
+            "python": python_report["total_damage_dealt"],
+            "rpc": rpc_report["total_damage_dealt"],
+        })
+
+    py_details = python_report["details"]
+    rpc_details = rpc_report["details"]
+    if len(py_details) != len(rpc_details):
+        mismatches.append({"field": "details", "python": len(py_details), "rpc": len(rpc_details)})
+
+    for py, sql in zip(py_details, rpc_details):
+        diff = {}
+        if (py["user_id"], py["pet_name"]) != (sql["user_id"], sql["pet_name"]):
+            diff["pet"] = ((py["user_id"], py["pet_name"]), (sql["user_id"], sql["pet_name"]))
+        for key in ("damage", "new_hp"):
+            if abs(float(py[key]) - float(sql[key])) > tolerance:
+                diff[key] = (py[key], sql[key])
+        for key in ("status", "overdue_tasks"):
+            if py[key] != sql[key]:
+                diff[key] = (py[key], sql[key])
+        if diff:
+            mismatches.append({"field": "details", "user_id": py["user_id"], "diff": diff})
+
+    return mismatches
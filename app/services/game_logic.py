@@ -1,5 +1,7 @@
-from datetime import datetime, timezone
-from typing import Dict, Any
+import math
+from array import array
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional, Sequence, Tuple, Union
 
 DECAY_COEFFICIENT = 0.5
 
@@ -7,12 +9,54 @@ DECAY_COEFFICIENT = 0.5
 HUNGER_RATE_PER_HOUR = 2.0
 # 機嫌度: 1時間で -1 (100時間でMIN)
 MOOD_DECAY_PER_HOUR = 1.0
-# 腐敗度: 毎日cronで習慣未達成ごとに加算（routers側で処理）
+# 腐敗度: 毎日ローカル時刻の0時過ぎにCRONで習慣未達成ごとに加算（app.services.habit_sweep）
 # care_score更新レート
 CARE_SCORE_ALPHA = 0.1  # 指数移動平均のスムージング係数
 
+CARE_EVENT_VALUES = {
+    'task_complete': 70,
+    'habit_complete': 80,
+    'task_overdue': 20,
+    'habit_missed': 30,
+}
 
-def calculate_time_decay(pet: Dict[str, Any]) -> Dict[str, Any]:
+# 進化ステージの閾値（生存日数）: この日数未満ならそのステージ
+EVOLUTION_STAGE_DAYS = (1, 3, 7, 14)
+
+# 列指向APIで「タイムスタンプなし / パース不能」を表す値
+MISSING_TIMESTAMP = -(1 << 63)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def _decay_values(hp: float, hunger: float, mood: float, max_hp: float, hours_passed: float) -> Tuple[float, float, float]:
+    """経過時間 hours_passed (> 0) 後の (hp, hunger, mood) を返す。スカラー版・列指向版共通の式"""
+    # 飢餓度: 時間で上昇（上限100）
+    new_hunger = min(100.0, hunger + HUNGER_RATE_PER_HOUR * hours_passed)
+
+    # 機嫌度: 時間で低下（下限0）
+    new_mood = max(0.0, mood - MOOD_DECAY_PER_HOUR * hours_passed)
+
+    # HP減衰: 飢餓が高いほど加速
+    hunger_multiplier = 1.0 + (new_hunger / 100.0)
+    damage = (hours_passed ** 2) * DECAY_COEFFICIENT * hunger_multiplier
+
+    # 機嫌が高いと微回復ボーナス
+    regen = (new_mood / 200.0) * hours_passed
+
+    new_hp = max(0.0, min(max_hp, hp - damage + regen))
+    return new_hp, new_hunger, new_mood
+
+
+def _evolution_stage_for(days_alive: float) -> int:
+    for stage, limit in enumerate(EVOLUTION_STAGE_DAYS):
+        if days_alive < limit:
+            return stage
+    return len(EVOLUTION_STAGE_DAYS)
+
+
+def calculate_time_decay(pet: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
     """
     経過時間に基づいてHP・飢餓度・機嫌度を計算する。
     DBには保存しない（表示用計算のみ）。
@@ -29,7 +73,7 @@ def calculate_time_decay(pet: Dict[str, Any]) -> Dict[str, Any]:
     except ValueError:
         return pet
 
-    now = datetime.now(timezone.utc)
+    now = now or datetime.now(timezone.utc)
     hours_passed = (now - last_checked).total_seconds() / 3600.0
 
     if hours_passed <= 0:
@@ -37,25 +81,15 @@ def calculate_time_decay(pet: Dict[str, Any]) -> Dict[str, Any]:
 
     updated_pet = pet.copy()
 
-    # 飢餓度: 時間で上昇（上限100）
-    current_hunger = float(pet.get('hunger', 0))
-    new_hunger = min(100.0, current_hunger + HUNGER_RATE_PER_HOUR * hours_passed)
+    new_hp, new_hunger, new_mood = _decay_values(
+        float(pet.get('hp', 100)),
+        float(pet.get('hunger', 0)),
+        float(pet.get('mood', 50)),
+        float(pet.get('max_hp', 100)),
+        hours_passed,
+    )
     updated_pet['hunger'] = new_hunger
-
-    # 機嫌度: 時間で低下（下限0）
-    current_mood = float(pet.get('mood', 50))
-    new_mood = max(0.0, current_mood - MOOD_DECAY_PER_HOUR * hours_passed)
     updated_pet['mood'] = new_mood
-
-    # HP減衰: 飢餓が高いほど加速
-    hunger_multiplier = 1.0 + (new_hunger / 100.0)
-    damage = (hours_passed ** 2) * DECAY_COEFFICIENT * hunger_multiplier
-
-    # 機嫌が高いと微回復ボーナス
-    regen = (new_mood / 200.0) * hours_passed
-
-    current_hp = float(pet.get('hp', 100))
-    new_hp = max(0.0, min(float(pet.get('max_hp', 100)), current_hp - damage + regen))
     updated_pet['hp'] = new_hp
 
     if new_hp <= 0:
@@ -64,7 +98,7 @@ def calculate_time_decay(pet: Dict[str, Any]) -> Dict[str, Any]:
     return updated_pet
 
 
-def calculate_evolution(pet: Dict[str, Any]) -> Dict[str, Any]:
+def calculate_evolution(pet: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
     """
     生存日数とcare_scoreから進化ステージとパスを決定する。
     """
@@ -77,24 +111,14 @@ def calculate_evolution(pet: Dict[str, Any]) -> Dict[str, Any]:
     except ValueError:
         return pet
 
-    days_alive = (datetime.now(timezone.utc) - born_at).total_seconds() / 86400.0
+    now = now or datetime.now(timezone.utc)
+    days_alive = (now - born_at).total_seconds() / 86400.0
     care_score = float(pet.get('care_score', 50))
     current_stage = int(pet.get('evolution_stage', 0))
     current_path = pet.get('evolution_path')
 
     # ステージ決定（後退なし）
-    if days_alive < 1:
-        new_stage = 0
-    elif days_alive < 3:
-        new_stage = 1
-    elif days_alive < 7:
-        new_stage = 2
-    elif days_alive < 14:
-        new_stage = 3
-    else:
-        new_stage = 4
-
-    new_stage = max(current_stage, new_stage)
+    new_stage = max(current_stage, _evolution_stage_for(days_alive))
 
     # パス確定（stage >= 3 で一度決まったら変わらない）
     new_path = current_path
@@ -112,11 +136,470 @@ def update_care_score(current_score: float, event: str) -> float:
     イベントに応じてcare_scoreを指数移動平均で更新する。
     event: 'task_complete' | 'habit_complete' | 'task_overdue' | 'habit_missed'
     """
-    event_values = {
-        'task_complete': 70,
-        'habit_complete': 80,
-        'task_overdue': 20,
-        'habit_missed': 30,
-    }
-    target = event_values.get(event, 50)
+    target = CARE_EVENT_VALUES.get(event, 50)
     return current_score * (1 - CARE_SCORE_ALPHA) + target * CARE_SCORE_ALPHA
+
+
+# ==========================================
+# 🎯 ペットへのイベント（イベントログの reducer）
+# ==========================================
+# ペットの状態を変えるすべての書き込みはイベント（dict）として pet_events に追記され、
+# pets の行はイベントを順に適用した結果（database/migrations/014_pet_events.sql）。
+# apply_pet_event が1件分の reducer で、書き込み時の計算（app.services.pet_writes）と
+# ログからの再構築（app.services.pet_history）の両方で使う。
+# 同じペットへの複数のイベントを apply_pet_events で順に適用すると、1件ずつ書き込んだ場合と同じ行になる。
+
+# タスク完了: 優先度ごとの回復量・飢餓度の減少量（DB関数 complete_tasks() と同じ値）
+TASK_HEAL_AMOUNTS = {"low": 3.0, "medium": 5.0, "high": 8.0, "critical": 12.0}
+TASK_HUNGER_REDUCTION = {"low": 8.0, "medium": 12.0, "high": 16.0, "critical": 20.0}
+# 習慣完了（POST /habits/complete・日次習慣のチェック）
+HABIT_HEAL_AMOUNT = 10.0
+DAILY_HABIT_MOOD_BONUS = 15.0
+DAILY_HABIT_CORRUPTION_RELIEF = 10
+# 日次習慣の未達成（1件あたり。DB関数 sweep_missed_habits() と同じ値）
+DAILY_HABIT_MISSED_CORRUPTION = 10
+
+# 蘇生後の状態（POST /pets/{pet_id}/revive）
+REVIVE_STATE = {
+    "status": "ALIVE",
+    "hp": 100.0,
+    "infection_level": 0,
+    "hunger": 0.0,
+    "mood": 50.0,
+    "care_score": 50.0,
+    "evolution_stage": 0,
+    "evolution_path": None,
+}
+
+PET_EVENT_TYPES = (
+    'task_complete', 'habit_complete', 'daily_habit_check', 'overdue_damage', 'decay_tick', 'revive',
+    'habit_missed',
+)
+
+# イベントで変わる列（スナップショットに保存する列。進化は born_at と care_score から毎回再計算する派生値なので含めない）
+PET_STATE_COLUMNS = (
+    'hp', 'max_hp', 'hunger', 'mood', 'care_score', 'infection_level',
+    'status', 'last_checked_at', 'last_damage_run_id',
+)
+
+
+def pet_event(event_type: str, at: datetime, **data: Any) -> Dict[str, Any]:
+    """
+    イベントを作る。event_type は PET_EVENT_TYPES のいずれか。
+
+    - task_complete    : priority（回復量・飢餓度の減少量）, task_id
+    - habit_complete / daily_habit_check: habit_id
+    - overdue_damage   : damage, run_id（任意）, resets_decay（True なら last_checked_at を at にする）
+    - decay_tick       : hp_per_hour（任意。指定すると線形減衰、省略すると calculate_time_decay）
+    - revive           : なし
+    - habit_missed     : missed（未達成の日次習慣の数）, day（ローカル日番号）, habit_ids
+    """
+    if event_type not in PET_EVENT_TYPES:
+        raise ValueError(f"unknown pet event: {event_type}")
+    return {"type": event_type, "at": at.isoformat(), **data}
+
+
+def _parse_time(value: Union[str, datetime, None]) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def event_heal_amount(event: Dict[str, Any]) -> float:
+    """タスク完了・習慣完了イベントの回復量（ペットが生存している場合に適用される）"""
+    if event["type"] == 'task_complete':
+        return TASK_HEAL_AMOUNTS.get(event.get("priority"), 5.0)
+    return HABIT_HEAL_AMOUNT
+
+
+def _reduce_care(pet: Dict[str, Any], event: Dict[str, Any], at: datetime) -> Dict[str, Any]:
+    """
+    task_complete / habit_complete / daily_habit_check
+
+    イベント時刻までの減衰を適用してから回復などを加える。書き込む列はイベントごとに
+    従来のエンドポイントと同じ（task_complete は mood を、habit_complete は hunger / mood を書かない）。
+    last_checked_at は後退させない（後から書かれた行に古いイベントを適用する場合）。
+    """
+    decayed = calculate_time_decay(pet, at)
+    updates: Dict[str, Any] = {}
+
+    if event["type"] == 'task_complete':
+        priority = event.get("priority")
+        updates['hunger'] = max(0.0, float(decayed.get('hunger', 0)) - TASK_HUNGER_REDUCTION.get(priority, 10.0))
+        updates['care_score'] = update_care_score(float(decayed.get('care_score', 50)), 'task_complete')
+    elif event["type"] == 'daily_habit_check':
+        updates['mood'] = min(100.0, float(decayed.get('mood', 50)) + DAILY_HABIT_MOOD_BONUS)
+        updates['infection_level'] = max(0, int(decayed.get('infection_level', 0)) - DAILY_HABIT_CORRUPTION_RELIEF)
+        updates['care_score'] = update_care_score(float(decayed.get('care_score', 50)), 'habit_complete')
+
+    hp = decayed['hp']
+    if decayed['status'] == 'ALIVE':
+        hp = min(float(decayed['max_hp']), hp + event_heal_amount(event))
+    updates['hp'] = hp
+    updates['status'] = decayed['status']
+
+    last_checked = _parse_time(pet.get('last_checked_at'))
+    updates['last_checked_at'] = (last_checked if last_checked and last_checked > at else at).isoformat()
+    return updates
+
+
+def _reduce_overdue_damage(pet: Dict[str, Any], event: Dict[str, Any], at: datetime) -> Dict[str, Any]:
+    """期限切れタスクのダメージ（CRON・/cron/sync。DB関数 apply_daily_damage() と同じ式）"""
+    if pet.get('status') == 'DEAD':
+        return {}
+    hp = max(0.0, float(pet.get('hp', 100)) - float(event["damage"]))
+    updates: Dict[str, Any] = {'hp': hp, 'status': 'DEAD' if hp <= 0 else pet['status']}
+    if event.get("run_id"):
+        updates['last_damage_run_id'] = event["run_id"]
+    if event.get("resets_decay"):
+        updates['last_checked_at'] = at.isoformat()
+    return updates
+
+
+def _reduce_decay_tick(pet: Dict[str, Any], event: Dict[str, Any], at: datetime) -> Dict[str, Any]:
+    """減衰を保存する（hp_per_hour を指定すると /cron/sync の線形減衰）"""
+    if pet.get('status') == 'DEAD':
+        return {}
+    rate = event.get("hp_per_hour")
+    if rate is None:
+        decayed = calculate_time_decay(pet, at)
+        updates = {k: decayed[k] for k in ('hp', 'hunger', 'mood', 'status') if k in decayed}
+    else:
+        last_checked = _parse_time(pet.get('last_checked_at'))
+        hours = (at - last_checked).total_seconds() / 3600.0 if last_checked else 0.0
+        hp = float(pet.get('hp', 100))
+        if hours > 0:
+            hp = max(0.0, hp - hours * float(rate))
+        updates = {'hp': hp, 'status': 'DEAD' if hp <= 0 else pet['status']}
+    updates['last_checked_at'] = at.isoformat()
+    return updates
+
+
+def _reduce_habit_missed(pet: Dict[str, Any], event: Dict[str, Any], at: datetime) -> Dict[str, Any]:
+    """
+    日次習慣の未達成（CRON。DB関数 sweep_missed_habits() と同じ式）
+
+    未達成1件ごとに腐敗度を加算し、care_score に habit_missed を missed 回適用する。
+    減衰は適用しない（last_checked_at も変えない）。
+    """
+    if pet.get('status') == 'DEAD':
+        return {}
+    missed = int(event["missed"])
+    target = CARE_EVENT_VALUES['habit_missed']
+    care_score = float(pet.get('care_score', 50))
+    return {
+        'infection_level': min(100, int(pet.get('infection_level', 0)) + missed * DAILY_HABIT_MISSED_CORRUPTION),
+        # update_care_score を missed 回適用したのと同じ（閉じた式なので DB と同じ値になる）
+        'care_score': target + (care_score - target) * (1 - CARE_SCORE_ALPHA) ** missed,
+    }
+
+
+def _reduce_revive(pet: Dict[str, Any], event: Dict[str, Any], at: datetime) -> Dict[str, Any]:
+    return dict(REVIVE_STATE, last_checked_at=at.isoformat())
+
+
+_PET_EVENT_REDUCERS = {
+    'task_complete': _reduce_care,
+    'habit_complete': _reduce_care,
+    'daily_habit_check': _reduce_care,
+    'overdue_damage': _reduce_overdue_damage,
+    'decay_tick': _reduce_decay_tick,
+    'revive': _reduce_revive,
+    'habit_missed': _reduce_habit_missed,
+}
+
+
+def apply_pet_event(pet: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """保存されたペットの行にイベント1件を適用したときに書き込む列を返す（変化がなければ空）"""
+    reducer = _PET_EVENT_REDUCERS.get(event["type"])
+    if reducer is None:
+        raise ValueError(f"unknown pet event: {event['type']}")
+    return reducer(pet, event, _parse_time(event["at"]))
+
+
+def apply_pet_events(pet: Dict[str, Any], events: Sequence[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """イベントを順に適用し、(適用後の行, 書き込む列) を返す"""
+    row = dict(pet)
+    changes: Dict[str, Any] = {}
+    for event in events:
+        updates = apply_pet_event(row, event)
+        row.update(updates)
+        changes.update(updates)
+    return row, changes
+
+
+def hours_until_death(hp: float, hunger: float, mood: float) -> float:
+    """
+    保存された状態 (hp, hunger, mood) から、HPが0になるまでの経過時間（時間）を求める。
+
+    減衰ダメージは常に t^2 以下（飢餓倍率 <= 2.0）で回復は0以上なので、
+    HP(t) >= hp - t^2 となり、死亡時刻は必ず sqrt(hp) 以降になる。
+    - 飢餓が上限・機嫌が0に達した後は HP(t) = hp - t^2 なので、
+      sqrt(hp) がその時点以降なら sqrt(hp) がそのまま答え（閉形式）
+    - それ以外は [sqrt(hp), 上界] を二分法で解く（t > 0.5 でHPは単調減少なので根は1つ）
+    DB側のトリガー（predict_death_at）も同じ手順で計算する。
+    """
+    if hp <= 0:
+        return 0.0
+
+    def is_dead(hours: float) -> bool:
+        return _decay_values(hp, hunger, mood, float('inf'), hours)[0] <= 0
+
+    lo = hp ** 0.5
+    hunger_cap_at = max(0.0, (100.0 - hunger) / HUNGER_RATE_PER_HOUR)
+    mood_zero_at = max(0.0, mood / MOOD_DECAY_PER_HOUR)
+    if lo >= max(hunger_cap_at, mood_zero_at) and is_dead(lo):
+        return lo
+
+    # 上界: HP(t) <= hp - 0.5 t^2 + (mood/200) t が0になる t（丸め誤差の分だけ広げる）
+    c = max(mood, 0.0) / 200.0
+    hi = c + (c * c + 2.0 * hp) ** 0.5
+    while not is_dead(hi):
+        hi *= 1.000001
+
+    for _ in range(64):
+        if hi - lo < 1e-7:
+            break
+        mid = (lo + hi) / 2.0
+        if is_dead(mid):
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def predict_death_at(pet: Dict[str, Any]) -> Optional[datetime]:
+    """
+    保存されたペットの状態から、calculate_time_decay でHPが0になる時刻を返す。
+    DEAD・last_checked_at なしの場合は None。
+    """
+    if pet.get('status') == 'DEAD':
+        return None
+
+    last_checked_str = pet.get('last_checked_at')
+    if not last_checked_str:
+        return None
+    try:
+        last_checked = datetime.fromisoformat(last_checked_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    hours = hours_until_death(
+        float(pet.get('hp', 100)),
+        float(pet.get('hunger', 0)),
+        float(pet.get('mood', 50)),
+    )
+    # マイクロ秒単位に切り上げ（この時刻の calculate_time_decay で必ず DEAD になる）
+    return last_checked + timedelta(microseconds=math.ceil(hours * 3_600_000_000))
+
+
+# ==========================================
+# 📊 列指向API
+# ==========================================
+# 数千匹分のペットを、dictのコピーやISO文字列のパースなしに計算する。
+# 入力・出力は列ごとの配列（array.array / list）。計算は行ごとの Python ループで、
+# ベクトル化はしていない（NumPy は Lambda のコールドスタート予算に収まらないので使わない）。
+# 速くなるのは1匹ごとの dict のコピーとタイムスタンプのパースを省いた分だけ。
+# タイムスタンプは UNIX エポックからのマイクロ秒（整数）で受け取るため、
+# timedelta.total_seconds() と同じ丸めになり、結果はスカラー版と完全に一致する
+# （tests/test_game_logic_columns.py で確認する）。
+
+def to_epoch_us(value: Union[str, datetime, None]) -> int:
+    """ISO文字列 / datetime をエポックマイクロ秒に変換する（なし・パース不能は MISSING_TIMESTAMP）"""
+    if value is None or value == '':
+        return MISSING_TIMESTAMP
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return MISSING_TIMESTAMP
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _ONE_MICROSECOND
+
+
+def from_epoch_us(value: int) -> Optional[datetime]:
+    if value == MISSING_TIMESTAMP:
+        return None
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def pets_to_columns(pets: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """pets の行リストを列指向に変換する（デフォルト値はスカラー版と同じ）"""
+    return {
+        'status': [pet['status'] for pet in pets],
+        'hp': array('d', (float(pet.get('hp', 100)) for pet in pets)),
+        'max_hp': array('d', (float(pet.get('max_hp', 100)) for pet in pets)),
+        'hunger': array('d', (float(pet.get('hunger', 0)) for pet in pets)),
+        'mood': array('d', (float(pet.get('mood', 50)) for pet in pets)),
+        'care_score': array('d', (float(pet.get('care_score', 50)) for pet in pets)),
+        'evolution_stage': array('q', (int(pet.get('evolution_stage', 0)) for pet in pets)),
+        'evolution_path': [pet.get('evolution_path') for pet in pets],
+        'last_checked_at': array('q', (to_epoch_us(pet.get('last_checked_at')) for pet in pets)),
+        'born_at': array('q', (to_epoch_us(pet.get('born_at')) for pet in pets)),
+    }
+
+
+def calculate_time_decay_columns(
+    status: Sequence[str],
+    hp: Sequence[float],
+    max_hp: Sequence[float],
+    hunger: Sequence[float],
+    mood: Sequence[float],
+    last_checked_at: Sequence[int],
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    calculate_time_decay の列指向版。
+
+    last_checked_at はエポックマイクロ秒（to_epoch_us）。
+    DEAD・タイムスタンプなし・経過時間0以下の行は入力値をそのまま返す。
+    戻り値: {'status': list, 'hp': array, 'hunger': array, 'mood': array}
+    """
+    now_us = to_epoch_us(now or datetime.now(timezone.utc))
+    n = len(status)
+
+    out_status = list(status)
+    out_hp = array('d', hp)
+    out_hunger = array('d', hunger)
+    out_mood = array('d', mood)
+
+    for i in range(n):
+        ts = last_checked_at[i]
+        if out_status[i] == 'DEAD' or ts == MISSING_TIMESTAMP:
+            continue
+        hours_passed = (now_us - ts) / 1_000_000 / 3600.0
+        if hours_passed <= 0:
+            continue
+
+        new_hp, new_hunger, new_mood = _decay_values(
+            out_hp[i], out_hunger[i], out_mood[i], max_hp[i], hours_passed
+        )
+        out_hp[i] = new_hp
+        out_hunger[i] = new_hunger
+        out_mood[i] = new_mood
+        if new_hp <= 0:
+            out_status[i] = 'DEAD'
+
+    return {'status': out_status, 'hp': out_hp, 'hunger': out_hunger, 'mood': out_mood}
+
+
+def calculate_evolution_columns(
+    born_at: Sequence[int],
+    care_score: Sequence[float],
+    evolution_stage: Sequence[int],
+    evolution_path: Sequence[Optional[str]],
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    calculate_evolution の列指向版。
+
+    born_at はエポックマイクロ秒（to_epoch_us）。born_at なしの行は入力値をそのまま返す。
+    戻り値: {'evolution_stage': array, 'evolution_path': list}
+    """
+    now_us = to_epoch_us(now or datetime.now(timezone.utc))
+
+    out_stage = array('q', evolution_stage)
+    out_path = list(evolution_path)
+
+    for i in range(len(out_stage)):
+        ts = born_at[i]
+        if ts == MISSING_TIMESTAMP:
+            continue
+        days_alive = (now_us - ts) / 1_000_000 / 86400.0
+
+        # ステージ決定（後退なし）
+        new_stage = max(out_stage[i], _evolution_stage_for(days_alive))
+        out_stage[i] = new_stage
+
+        # パス確定（stage >= 3 で一度決まったら変わらない）
+        if new_stage >= 3 and out_path[i] is None:
+            out_path[i] = 'light' if float(care_score[i]) >= 50 else 'dark'
+
+    return {'evolution_stage': out_stage, 'evolution_path': out_path}
+
+
+def update_care_score_columns(scores: Sequence[float], events: Union[str, Sequence[str]]) -> array:
+    """
+    update_care_score の列指向版。events は全行共通のイベント名、または行ごとのイベント名の列。
+    """
+    if isinstance(events, str):
+        events = [events] * len(scores)
+    keep = 1 - CARE_SCORE_ALPHA
+    return array('d', (
+        score * keep + CARE_EVENT_VALUES.get(event, 50) * CARE_SCORE_ALPHA
+        for score, event in zip(scores, events)
+    ))
+
+
+def score_population(pets: Sequence[Dict[str, Any]], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    ペット全体の減衰と進化を一括で計算する（CRON・分析用）。
+
+    行ごとに calculate_time_decay → calculate_evolution を適用したのと同じ結果を列で返す。
+    """
+    now = now or datetime.now(timezone.utc)
+    cols = pets_to_columns(pets)
+    decayed = calculate_time_decay_columns(
+        cols['status'], cols['hp'], cols['max_hp'], cols['hunger'], cols['mood'],
+        cols['last_checked_at'], now=now,
+    )
+    evolved = calculate_evolution_columns(
+        cols['born_at'], cols['care_score'], cols['evolution_stage'], cols['evolution_path'], now=now,
+    )
+    return {**decayed, **evolved}
+
+
+def forecast_decay(
+    pet: Dict[str, Any],
+    offsets_hours: Sequence[float],
+    now: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    now + offset の各時刻で calculate_time_decay した値を、列指向APIの1回の呼び出しで求める。
+
+    「now + offset で評価」は「last_checked_at を offset だけ過去にずらして now で評価」と同じなので、
+    保存状態を複製した列を calculate_time_decay_columns に渡す（経過時間の丸めもスカラー版と一致）。
+    戻り値: {'status': list, 'hp': array, 'hunger': array, 'mood': array}
+    """
+    n = len(offsets_hours)
+    last_checked_us = to_epoch_us(pet.get('last_checked_at'))
+    shifted = array('q', (
+        last_checked_us if last_checked_us == MISSING_TIMESTAMP
+        else last_checked_us - round(offset * 3_600_000_000)
+        for offset in offsets_hours
+    ))
+    return calculate_time_decay_columns(
+        [pet['status']] * n,
+        array('d', [float(pet.get('hp', 100))]) * n,
+        array('d', [float(pet.get('max_hp', 100))]) * n,
+        array('d', [float(pet.get('hunger', 0))]) * n,
+        array('d', [float(pet.get('mood', 50))]) * n,
+        shifted,
+        now=now,
+    )
+
+
+def next_evolution_at(pet: Dict[str, Any], now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    次に進化ステージが上がる時刻とステージを返す（最終形・born_at なしは None）。
+    """
+    born_at_str = pet.get('born_at')
+    if not born_at_str:
+        return None
+    try:
+        born_at = datetime.fromisoformat(born_at_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    stage = calculate_evolution(pet, now=now).get('evolution_stage', 0)
+    if stage >= len(EVOLUTION_STAGE_DAYS):
+        return None
+    # stage の上限日数に達すると stage + 1 になる
+    return {
+        'stage': stage + 1,
+        'at': born_at + timedelta(days=EVOLUTION_STAGE_DAYS[stage]),
+    }
@@ -0,0 +1,124 @@
+"""
+日次習慣の完了履歴（日ごとのビットマップ）
+
+daily_habits.completion_bits に、ローカル日番号（1970-01-01 からの日数）ごとの完了を1ビットで持つ。
+ビット i は completion_day - i 日目の完了（ビット0 = 最後に記録した日）で、
+HISTORY_DAYS 日より古い日は捨てる（1年分で 46 バイト）。
+DB には bytea（リトルエンディアン）で保存し、Python では int のビット列として扱う。
+
+ストリーク・チェックの取り消し・達成率・カレンダーはすべてこのビット列の演算で求まるので、
+習慣1行を読むだけでよい（database/migrations/015_daily_habit_bitmap.sql）。
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, Union
+
+# 保持する日数（46 バイト）
+HISTORY_DAYS = 46 * 8
+HISTORY_MASK = (1 << HISTORY_DAYS) - 1
+
+# 日の区切り: ユーザーの UTC オフセット（分。profiles.utc_offset_minutes）。未設定なら JST
+DEFAULT_UTC_OFFSET_MINUTES = 9 * 60
+
+# 達成率を返す期間（日）
+COMPLETION_RATE_WINDOWS = (7, 30, 365)
+
+_EPOCH_DATE = date(1970, 1, 1)
+
+
+def local_day(dt: datetime, utc_offset_minutes: int = DEFAULT_UTC_OFFSET_MINUTES) -> int:
+    """日時をローカル日番号（1970-01-01 からの日数）にする"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    local = dt.astimezone(timezone(timedelta(minutes=utc_offset_minutes)))
+    return (local.date() - _EPOCH_DATE).days
+
+
+def day_to_date(day: int) -> date:
+    return _EPOCH_DATE + timedelta(days=day)
+
+
+def day_start(day: int, utc_offset_minutes: int = DEFAULT_UTC_OFFSET_MINUTES) -> datetime:
+    """ローカル日番号の日の0時（UTC の datetime）"""
+    tz = timezone(timedelta(minutes=utc_offset_minutes))
+    return datetime.combine(day_to_date(day), datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+
+
+def decode_bits(value: Union[str, bytes, None]) -> int:
+    """bytea（PostgREST は "\\x..." の16進文字列で返す）をビット列にする"""
+    if not value:
+        return 0
+    if isinstance(value, str):
+        value = bytes.fromhex(value[2:] if value.startswith("\\x") else value)
+    return int.from_bytes(value, "little")
+
+
+def encode_bits(bits: int) -> str:
+    """ビット列を bytea の16進表記にする（末尾のゼロバイトは書かない）"""
+    bits &= HISTORY_MASK
+    return "\\x" + bits.to_bytes((bits.bit_length() + 7) // 8, "little").hex()
+
+
+def align(bits: int, anchor: Optional[int], day: int) -> int:
+    """ビット0が day になるようにずらしたビット列（day より後の記録は捨てる）"""
+    if anchor is None or not bits:
+        return 0
+    if day >= anchor:
+        return (bits << (day - anchor)) & HISTORY_MASK
+    return bits >> (anchor - day)
+
+
+def is_completed(bits: int, anchor: Optional[int], day: int) -> bool:
+    return bool(align(bits, anchor, day) & 1)
+
+
+def set_day(bits: int, anchor: Optional[int], day: int) -> Tuple[int, int]:
+    """day の完了を記録した (bits, anchor) を返す。anchor より後の日なら anchor を day に進める"""
+    if anchor is None or day >= anchor:
+        return align(bits, anchor, day) | 1, day
+    offset = anchor - day
+    if offset >= HISTORY_DAYS:
+        return bits, anchor
+    return bits | (1 << offset), anchor
+
+
+def clear_day(bits: int, anchor: Optional[int], day: int) -> Tuple[int, Optional[int]]:
+    """day の完了を取り消した (bits, anchor) を返す（他の日の記録はそのまま）"""
+    if anchor is None or day > anchor or anchor - day >= HISTORY_DAYS:
+        return bits, anchor
+    return bits & ~(1 << (anchor - day)), anchor
+
+
+def last_completed_day(bits: int, anchor: Optional[int]) -> Optional[int]:
+    """最後に完了した日（最下位の立っているビット）"""
+    if anchor is None or not bits:
+        return None
+    return anchor - ((bits & -bits).bit_length() - 1)
+
+
+def current_streak(bits: int, anchor: Optional[int], today: int) -> int:
+    """
+    今日から遡って連続して完了した日数（ビット0から連続して立っているビットの数）
+
+    今日がまだなら昨日からの連続日数（今日チェックすれば続く）。
+    """
+    aligned = align(bits, anchor, today)
+    if not aligned & 1:
+        aligned >>= 1
+    return (~aligned & (aligned + 1)).bit_length() - 1
+
+
+def completion_rate(bits: int, anchor: Optional[int], today: int, days: int) -> float:
+    """今日を含む直近 days 日の達成率"""
+    window = align(bits, anchor, today) & ((1 << days) - 1)
+    return round(window.bit_count() / days, 4)
+
+
+def completion_rates(bits: int, anchor: Optional[int], today: int) -> Dict[str, float]:
+    return {f"{days}d": completion_rate(bits, anchor, today, days) for days in COMPLETION_RATE_WINDOWS}
+
+
+def calendar(bits: int, anchor: Optional[int], today: int, days: int) -> List[bool]:
+    """直近 days 日の完了（古い日が先頭、最後が今日）"""
+    aligned = align(bits, anchor, today)
+    return [bool(aligned >> offset & 1) for offset in range(days - 1, -1, -1)]
@@ -0,0 +1,127 @@
+"""
+日次習慣の未達成の一括処理（UTCオフセットごと）
+
+ユーザーの日の区切りは profiles.utc_offset_minutes（未設定なら JST）。
+CRON（POST /cron/habit-sweep）は1時間ごとに呼ばれ、オフセットごとに
+「ローカル時刻で直前に終わった日」をまだ処理していなければ、DB関数 sweep_missed_habits()
+（database/migrations/016_habit_sweep.sql）で習慣を1ページずつ処理する:
+ストリークのリセット・持ち主のペットへの腐敗度と care_score の反映・habit_missed イベントの追記が
+ページごとに1ステートメントで行われる。
+
+オフセットと日ごとに run_id（"habit-sweep-YYYYMMDD-p540" など）を決め、ページごとのカーソルを
+cron_checkpoints に保存するので、時間予算切れ（status="partial"）やタイムアウトの後に呼び直すと続きから再開する。
+CRON が丸1日以上止まっていた場合、処理するのは各オフセットの直前の1日だけ。
+"""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from app.services.checkpoints import load_checkpoint, save_checkpoint
+from app.services.habit_bitmap import DEFAULT_UTC_OFFSET_MINUTES, day_to_date, local_day
+from app.services.pet_cache import pet_cache
+
+HABIT_SWEEP_JOB = "habit-sweep"
+# 1回の sweep_missed_habits() で見る習慣の数
+SWEEP_PAGE_SIZE = 1000
+
+
+async def fetch_utc_offset_minutes(client, user_id: str) -> int:
+    """ユーザーの日の区切り（UTCオフセット、分）。プロフィールがなければ JST"""
+    res = await client.table("profiles")\
+        .select("utc_offset_minutes")\
+        .eq("id", user_id)\
+        .execute()
+    if res.data and res.data[0].get("utc_offset_minutes") is not None:
+        return res.data[0]["utc_offset_minutes"]
+    return DEFAULT_UTC_OFFSET_MINUTES
+
+
+def sweep_day(now: datetime, utc_offset_minutes: int) -> int:
+    """オフセットのローカル時刻で直前に終わった日（昨日）のローカル日番号"""
+    return local_day(now, utc_offset_minutes) - 1
+
+
+def sweep_run_id(day: int, utc_offset_minutes: int) -> str:
+    """オフセットと日ごとの run_id（checkpoints.RUN_ID_PATTERN に合うよう符号は p/m で表す）"""
+    sign = "p" if utc_offset_minutes >= 0 else "m"
+    return f"{HABIT_SWEEP_JOB}-{day_to_date(day):%Y%m%d}-{sign}{abs(utc_offset_minutes)}"
+
+
+async def sweep_bucket(
+    client, utc_offset_minutes: int, day: int, now: datetime, deadline: float,
+) -> Dict[str, Any]:
+    """
+    1つのオフセットの1日分をページ単位で処理し、ページごとにチェックポイントを保存する。
+
+    deadline（time.monotonic()）を過ぎたら status="partial" で返す。
+    """
+    run_id = sweep_run_id(day, utc_offset_minutes)
+    checkpoint = await load_checkpoint(client, HABIT_SWEEP_JOB, run_id, 0, 1)
+    checkpoint.setdefault("processed_habits", 0)
+
+    report: Dict[str, Any] = {
+        "run_id": run_id,
+        "utc_offset_minutes": utc_offset_minutes,
+        "date": day_to_date(day).isoformat(),
+        "status": "completed",
+        "missed_habits": 0,
+        "pets_updated": 0,
+    }
+
+    while checkpoint["status"] != "completed":
+        if time.monotonic() >= deadline:
+            report["status"] = "partial"
+            break
+
+        res = await client.rpc("sweep_missed_habits", {
+            "p_offset_minutes": utc_offset_minutes,
+            "p_day": day,
+            "p_after": checkpoint["cursor"],
+            "p_limit": SWEEP_PAGE_SIZE,
+            "p_now": now.isoformat(),
+        }).execute()
+        page = res.data
+        pet_cache.invalidate_many(page["user_ids"])
+
+        report["missed_habits"] += page["missed_habits"]
+        report["pets_updated"] += page["pets_updated"]
+        if page["cursor"]:
+            checkpoint["cursor"] = page["cursor"]
+        checkpoint["processed_habits"] += page["missed_habits"]
+        checkpoint["processed_pets"] += page["pets_updated"]
+
+        if page["scanned"] < SWEEP_PAGE_SIZE:
+            checkpoint["status"] = "completed"
+        await save_checkpoint(client, checkpoint, now)
+
+    return report
+
+
+async def run_habit_sweep(client, now: datetime, time_budget_seconds: float) -> Dict[str, Any]:
+    """
+    ローカル日付が変わったオフセットについて、まだ処理していない前日分を処理する。
+
+    戻り値: status（completed / partial）, missed_habits, pets_updated, buckets（今回処理したオフセットごとの結果）
+    """
+    deadline = time.monotonic() + time_budget_seconds
+    res = await client.rpc("utc_offset_buckets", {}).execute()
+    offsets: List[int] = res.data or [DEFAULT_UTC_OFFSET_MINUTES]
+
+    report: Dict[str, Any] = {
+        "status": "completed",
+        "missed_habits": 0,
+        "pets_updated": 0,
+        "buckets": [],
+    }
+    for offset in offsets:
+        bucket = await sweep_bucket(client, offset, sweep_day(now, offset), now, deadline)
+        if bucket["status"] == "partial":
+            report["status"] = "partial"
+        if bucket["missed_habits"] or bucket["status"] == "partial":
+            report["buckets"].append(bucket)
+        report["missed_habits"] += bucket["missed_habits"]
+        report["pets_updated"] += bucket["pets_updated"]
+        if report["status"] == "partial":
+            break
+    return report
@@ -1,7 +1,26 @@
 # from notion_client import Client # Library issue, switching to raw HTTP
+import asyncio
+import weakref
 import httpx
 from app.core.config import settings
+from app.services.notion_scheduler import DEFAULT_KEY, notion_scheduler
+from app.services.transport import create_async_client, create_client, register_upstream
 from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# databases/{id}/query の1ページあたりの最大件数（Notion APIの上限）
+NOTION_PAGE_SIZE = 100
+
+
+class NotionAPIError(Exception):
+    """Notion APIがエラーを返した"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Notion API error {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
 
 class NotionService:
     def __init__(self):
@@ -12,47 +31,173 @@ class NotionService:
             "Notion-Version": "2022-06-28", # Stable version
             "Content-Type": "application/json"
         }
-        self.base_url = "https://api.notion.com/v1"
+        self.base_url = settings.NOTION_API_BASE_URL.rstrip("/")
+        register_upstream("notion", self.base_url)
+        # 同期クライアントは同期メソッド（iter_query / get_page など）の初回呼び出し時に作る。
+        # アプリ（async ルーター・webhook）は非同期メソッドだけを使うので、Supabase と同じ非同期プールに乗る
+        self._http: Optional[httpx.Client] = None
+        # 非同期クライアントはイベントループごとに1つ
+        self._async_http: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        # すべてのリクエストはレート制限スケジューラを通す（429・5xx はここで再送される）
+        self.scheduler = notion_scheduler
+
+    @property
+    def http(self) -> httpx.Client:
+        """共有の同期トランスポート上のクライアント（呼び出しごとにTLSハンドシェイクしない）"""
+        if self._http is None:
+            self._http = create_client(headers=self.headers, timeout=30.0)
+        return self._http
+
+    def _get_async_http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_http.get(loop)
+        if client is None:
+            client = create_async_client(headers=self.headers, timeout=30.0)
+            self._async_http[loop] = client
+        return client
 
-    def get_overdue_tasks(self):
+    def _query_request(
+        self,
+        database_id: Optional[str],
+        filter: Optional[Dict[str, Any]],
+        sorts: Optional[List[Dict[str, Any]]],
+        filter_properties: Optional[List[str]],
+        page_size: int,
+    ):
+        """databases/{id}/query の URL・クエリパラメータ・ボディ（カーソル以外）を組み立てる"""
+        url = f"{self.base_url}/databases/{database_id or self.db_id}/query"
+        # filter_properties を指定すると、そのプロパティだけが返る（レスポンスが小さくなる）
+        params = [("filter_properties", prop) for prop in filter_properties or []]
+        body: Dict[str, Any] = {"page_size": min(page_size, NOTION_PAGE_SIZE)}
+        if filter:
+            body["filter"] = filter
+        if sorts:
+            body["sorts"] = sorts
+        return url, params, body
+
+    @staticmethod
+    def _parse_page(response: httpx.Response) -> Dict[str, Any]:
+        if response.status_code != 200:
+            raise NotionAPIError(response.status_code, response.text)
+        return response.json()
+
+    def iter_query_pages(
+        self,
+        database_id: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        sorts: Optional[List[Dict[str, Any]]] = None,
+        filter_properties: Optional[List[str]] = None,
+        page_size: int = NOTION_PAGE_SIZE,
+        user_id: Optional[str] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
         """
-        期限切れかつ未完了のタスクを取得します。 (Raw HTTP)
+        データベースのクエリ結果を、レスポンスのページ単位（最大100件）で順に返す。
+
+        has_more / next_cursor をたどって全件を返すが、メモリに持つのは常に1ページ分だけ。
+        user_id はスケジューラの公平キューのキー（複数ユーザーの同期を交互に進める）。
+        リトライを使い切ったエラーは NotionAPIError を送出する。
         """
-        now_iso = datetime.now(timezone.utc).isoformat()
-        
-        url = f"{self.base_url}/databases/{self.db_id}/query"
-        
-        payload = {
-            "filter": {
-                "and": [
-                    {
-                        "property": "Status", 
-                        "status": {
-                            "does_not_equal": "Done"
-                        }
-                    },
-                    {
-                        "property": "Due Date",
-                        "date": {
-                            "before": now_iso
-                        }
+        url, params, body = self._query_request(database_id, filter, sorts, filter_properties, page_size)
+        key = user_id or DEFAULT_KEY
+        while True:
+            response = self.scheduler.send(lambda: self.http.post(url, params=params, json=body), key=key)
+            data = self._parse_page(response)
+            yield data.get("results", [])
+            if not data.get("has_more") or not data.get("next_cursor"):
+                return
+            body["start_cursor"] = data["next_cursor"]
+
+    def iter_query(self, *args, **kwargs) -> Iterator[Dict[str, Any]]:
+        """iter_query_pages と同じ引数で、ページ（Notionのページ＝1行）を1件ずつ返す"""
+        for results in self.iter_query_pages(*args, **kwargs):
+            yield from results
+
+    async def aiter_query_pages(
+        self,
+        database_id: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        sorts: Optional[List[Dict[str, Any]]] = None,
+        filter_properties: Optional[List[str]] = None,
+        page_size: int = NOTION_PAGE_SIZE,
+        user_id: Optional[str] = None,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """iter_query_pages の非同期版（async ルーターから使う）"""
+        url, params, body = self._query_request(database_id, filter, sorts, filter_properties, page_size)
+        http = self._get_async_http()
+        key = user_id or DEFAULT_KEY
+        while True:
+            response = await self.scheduler.asend(lambda: http.post(url, params=params, json=body), key=key)
+            data = self._parse_page(response)
+            yield data.get("results", [])
+            if not data.get("has_more") or not data.get("next_cursor"):
+                return
+            body["start_cursor"] = data["next_cursor"]
+
+    async def aiter_query(self, *args, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """aiter_query_pages と同じ引数で、ページを1件ずつ返す"""
+        async for results in self.aiter_query_pages(*args, **kwargs):
+            for page in results:
+                yield page
+
+    def get_page(self, page_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """ページを1件取得する（存在しない・アクセスできない場合は None）"""
+        response = self.scheduler.send(lambda: self.http.get(f"{self.base_url}/pages/{page_id}"), key=user_id or DEFAULT_KEY)
+        if response.status_code == 404:
+            return None
+        return self._parse_page(response)
+
+    async def aget_page(self, page_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """get_page の非同期版"""
+        http = self._get_async_http()
+        response = await self.scheduler.asend(lambda: http.get(f"{self.base_url}/pages/{page_id}"), key=user_id or DEFAULT_KEY)
+        if response.status_code == 404:
+            return None
+        return self._parse_page(response)
+
+    @staticmethod
+    def overdue_filter(now: Optional[datetime] = None) -> Dict[str, Any]:
+        """期限切れかつ未完了のタスクを表すフィルタ"""
+        now_iso = (now or datetime.now(timezone.utc)).isoformat()
+        return {
+            "and": [
+                {
+                    "property": "Status", 
+                    "status": {
+                        "does_not_equal": "Done"
+                    }
+                },
+                {
+                    "property": "Due Date",
+                    "date": {
+                        "before": now_iso
                     }
-                ]
-            }
+                }
+            ]
         }
 
-        # Supabase includes httpx, so we can use it synchronously for now
-        with httpx.Client() as client:
-            response = client.post(url, headers=self.headers, json=payload)
-            
-            if response.status_code != 200:
-                print(f"Notion API Error: {response.text}")
-                # エラーでも落とさないようにする（空リストを返す）
-                # あるいは例外を投げる
-                # MVPなのでログ出して空リスト
-                return []
-            
-            data = response.json()
-            return data.get("results", [])
-
-notion_service = NotionService()
+    def get_overdue_tasks(self, filter_properties: Optional[List[str]] = None, user_id: Optional[str] = None):
+        """
+        期限切れかつ未完了のタスクを取得します。 (Raw HTTP)
+
+        next_cursor をたどって全ページを取得する（以前は最初の100件で打ち切られていた）。
+        件数が多い場合は iter_query(filter=self.overdue_filter()) で1件ずつ処理すること。
+
+        429 などはスケジューラが再送し、それでも失敗した場合は NotionAPIError を送出する
+        （以前は空リストを返していたため、レート制限中のユーザーが「期限切れ0件」として懲罰を免れていた）。
+        """
+        return list(self.iter_query(
+            filter=self.overdue_filter(), filter_properties=filter_properties, user_id=user_id
+        ))
+
+
+@lru_cache(maxsize=1)
+def get_notion_service() -> NotionService:
+    """NotionService を返す（初回呼び出し時に作成。import時には接続の準備をしない）"""
+    return NotionService()
+
+
+def __getattr__(name: str):
+    # 互換性: 以前のモジュール変数 `from app.services.notion import notion_service`
+    if name == "notion_service":
+        return get_notion_service()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,300 @@
+"""
+Notion API のレート制限スケジューラ（トークンバケット + ユーザーごとの公平なキュー）
+
+Notion はインテグレーションごとに平均 約3リクエスト/秒 を上限とし、超えると 429 と Retry-After を返す。
+NotionService の呼び出しはすべてこのスケジューラを通し、
+- トークンバケット（NOTION_REQUESTS_PER_SECOND / NOTION_BURST）で送信間隔を揃える
+- 待っているリクエストにはユーザー（キー）ごとのラウンドロビンでトークンを渡す
+  （1人の大量同期が他のユーザーの同期を待たせ続けない）
+- 429 を受けたら Retry-After の間はバケット全体を止めてから再送する
+- 5xx・接続エラーはジッター付き指数バックオフで再送する
+リトライを使い切った場合はレスポンス（またはエラー）を呼び出し側に返し、NotionAPIError にさせる。
+
+同期（スレッド）・非同期（asyncio）のどちらの呼び出しも同じバケットを共有する。
+バケットはプロセス（Lambdaインスタンス）ごとなので、並行するインスタンス数に合わせて
+NOTION_REQUESTS_PER_SECOND を下げること。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+# 再送するステータスコード（429 は Retry-After に従い、それ以外はバックオフ）
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+DEFAULT_KEY = "default"
+
+
+class _Ticket:
+    """キューで順番を待つ1リクエスト"""
+
+    __slots__ = ("key", "enqueued_at", "granted", "event", "loop", "future")
+
+    def __init__(self, key: str, enqueued_at: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.key = key
+        self.enqueued_at = enqueued_at
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Retry-After（秒数 または HTTP-date）を秒数に変換する"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class NotionScheduler:
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        max_retries: int,
+        backoff_base_seconds: float,
+        backoff_max_seconds: float,
+    ):
+        self.rate_per_second = rate_per_second
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        # キー -> 待機中のリクエスト。先頭のキーから1件ずつ渡し、まだ残っていれば末尾に回す
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._queued = 0
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.exhausted = 0
+        self.max_queue_depth = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    # ------------------------------------------------------------
+    # トークンの割り当て（すべて self._lock を持った状態で呼ぶ）
+    # ------------------------------------------------------------
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._refilled_at
+        if elapsed > 0:
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate_per_second)
+        self._refilled_at = now
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """
+        トークンのある分だけ、キーのラウンドロビンで待機中のリクエストに渡す。
+        まだ待っているリクエストがあれば、次にトークンが用意できるまでの秒数を返す。
+        """
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now if self._queues else None
+        while self._queues and self._tokens >= 1.0:
+            key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._queued -= 1
+            self._tokens -= 1.0
+            waited = now - ticket.enqueued_at
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            ticket.grant()
+        if not self._queues:
+            return None
+        return (1.0 - self._tokens) / self.rate_per_second
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        self._queues.setdefault(ticket.key, deque()).append(ticket)
+        self._queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queued)
+
+    def _abandon(self, ticket: _Ticket) -> None:
+        """キャンセルされた待機を取り除く（トークンを受け取っていたら返す）"""
+        with self._lock:
+            if ticket.granted:
+                self._tokens = min(float(self.burst), self._tokens + 1.0)
+                return
+            queue = self._queues.get(ticket.key)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.key]
+
+    # ------------------------------------------------------------
+    # トークンの取得
+    # ------------------------------------------------------------
+    def acquire(self, key: str = DEFAULT_KEY) -> None:
+        """送信してよい順番が来るまで待つ（スレッド用）"""
+        ticket = _Ticket(key, time.monotonic())
+        with self._lock:
+            self._enqueue(ticket)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch(time.monotonic())
+                if ticket.granted:
+                    return
+                # 他の待機者がトークンを渡してくれたら event で起きる
+                ticket.event.wait(delay)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    async def aacquire(self, key: str = DEFAULT_KEY) -> None:
+        """acquire の非同期版"""
+        ticket = _Ticket(key, time.monotonic(), loop=asyncio.get_running_loop())
+        with self._lock:
+            self._enqueue(ticket)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._dispatch(time.monotonic())
+                if ticket.granted:
+                    return
+                await asyncio.wait({ticket.future}, timeout=delay)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    # ------------------------------------------------------------
+    # 429 / バックオフ
+    # ------------------------------------------------------------
+    def backoff_seconds(self, attempt: int) -> float:
+        """指数バックオフ（上限あり）に、その半分までのジッターを加えた待ち時間"""
+        delay = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _throttle(self, response: httpx.Response, attempt: int) -> None:
+        """429: Retry-After（なければバックオフ）の間、バケット全体の払い出しを止める"""
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None:
+            retry_after = self.backoff_seconds(attempt)
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0.0
+
+    def _retry_delay(self, response: Optional[httpx.Response], attempt: int) -> float:
+        """再送までにこのリクエストだけが待つ秒数（429 はバケット側で待つので0）"""
+        self.retries += 1
+        if response is not None and response.status_code == 429:
+            self._throttle(response, attempt)
+            return 0.0
+        return self.backoff_seconds(attempt)
+
+    def send(self, send: Callable[[], httpx.Response], key: str = DEFAULT_KEY) -> httpx.Response:
+        """
+        順番を待ってから send() を呼ぶ。429・5xx・接続エラーは max_retries 回まで再送する。
+
+        リトライを使い切ったときは最後のレスポンスを返す（接続エラーはそのまま送出する）。
+        """
+        attempt = 0
+        while True:
+            self.acquire(key)
+            self.requests += 1
+            try:
+                response = send()
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self.exhausted += 1
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                if attempt >= self.max_retries:
+                    self.exhausted += 1
+                    return response
+            time.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+    async def asend(self, send: Callable[[], Awaitable[httpx.Response]], key: str = DEFAULT_KEY) -> httpx.Response:
+        """send の非同期版"""
+        attempt = 0
+        while True:
+            await self.aacquire(key)
+            self.requests += 1
+            try:
+                response = await send()
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    self.exhausted += 1
+                    raise
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                if attempt >= self.max_retries:
+                    self.exhausted += 1
+                    return response
+            await asyncio.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            granted = self.requests
+            return {
+                "rate_per_second": self.rate_per_second,
+                "burst": self.burst,
+                "tokens": round(self._tokens, 3),
+                "queue_depth": self._queued,
+                "queued_by_key": {key: len(queue) for key, queue in self._queues.items()},
+                "max_queue_depth": self.max_queue_depth,
+                "paused_seconds": round(max(0.0, self._paused_until - now), 3),
+                "requests": granted,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+                "wait_seconds_avg": round(self.wait_seconds_total / granted, 4) if granted else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 4),
+            }
+
+
+notion_scheduler = NotionScheduler(
+    rate_per_second=settings.NOTION_REQUESTS_PER_SECOND,
+    burst=settings.NOTION_BURST,
+    max_retries=settings.NOTION_MAX_RETRIES,
+    backoff_base_seconds=settings.NOTION_BACKOFF_BASE_SECONDS,
+    backoff_max_seconds=settings.NOTION_BACKOFF_MAX_SECONDS,
+)
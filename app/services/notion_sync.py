@@ -0,0 +1,242 @@
+"""
+Notion → tasks の差分同期（last_edited_time ウォーターマーク）
+
+ユーザーごとに取り込み済みの最新 last_edited_time を notion_sync_state に保存し、
+次回はそれ以降に編集されたページだけを Notion に問い合わせる。
+ページは last_edited_time の昇順で受け取り、NOTION_IMPORT_BATCH_SIZE 件ごとに
+tasks と対応する habits へまとめて upsert（(user_id, notion_page_id) で重複排除）してからウォーターマークを進めるので、
+途中で失敗しても次回は続きから取り込める。
+
+Notion の last_edited_time は分単位に丸められるため、条件は on_or_after（同じ分のページは再取得される）。
+upsert は冪等なので、再取得しても結果は変わらない。
+アーカイブ（削除）されたページはクエリ結果に含まれないため、この同期では tasks から消えない。
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.services.damage import parse_timestamp
+
+NOTION_SYNC_STATE_TABLE = "notion_sync_state"
+
+# Notion データベースのプロパティ名（NotionService.overdue_filter と同じ）
+STATUS_PROPERTY = "Status"
+DUE_DATE_PROPERTY = "Due Date"
+PRIORITY_PROPERTY = "Priority"
+DONE_STATUS = "Done"
+
+PRIORITY_MAP = {
+    "low": "low",
+    "medium": "medium",
+    "high": "high",
+    "critical": "critical",
+    "urgent": "critical",
+}
+
+# tasks.title の上限（TaskCreate と同じ）
+TITLE_MAX_LENGTH = 200
+
+# 1回の upsert で書き込む行数（PostgREST のリクエストサイズに収まる範囲でまとめる）
+NOTION_IMPORT_BATCH_SIZE = 500
+
+
+def _plain_text(rich_text: List[Dict[str, Any]]) -> str:
+    return "".join(part.get("plain_text", "") for part in rich_text or []).strip()
+
+
+def _option_name(prop: Optional[Dict[str, Any]]) -> Optional[str]:
+    """status / select プロパティの選択肢名"""
+    if not prop:
+        return None
+    option = prop.get(prop.get("type", ""))
+    if isinstance(option, dict):
+        return option.get("name")
+    return None
+
+
+def page_to_task(page: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Notion のページを tasks の行に変換する（upsert 用に全行で同じキーを持つ）"""
+    props = page.get("properties", {})
+
+    title = ""
+    for prop in props.values():
+        if prop.get("type") == "title":
+            title = _plain_text(prop.get("title"))
+            break
+
+    due = (props.get(DUE_DATE_PROPERTY) or {}).get("date") or {}
+    priority = (_option_name(props.get(PRIORITY_PROPERTY)) or "").lower()
+    completed = _option_name(props.get(STATUS_PROPERTY)) == DONE_STATUS
+
+    return {
+        "user_id": user_id,
+        "notion_page_id": page["id"],
+        "title": (title or "Untitled")[:TITLE_MAX_LENGTH],
+        "due_date": due.get("start"),
+        "priority": PRIORITY_MAP.get(priority, "medium"),
+        "source": "notion",
+        "completed": completed,
+        "completed_at": page.get("last_edited_time") if completed else None,
+    }
+
+
+def edited_since_filter(watermark: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not watermark:
+        return None  # 初回は全件
+    return {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": watermark}}
+
+
+async def load_sync_state(client, user_id: str, database_id: str) -> Dict[str, Any]:
+    res = await client.table(NOTION_SYNC_STATE_TABLE)\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .eq("database_id", database_id)\
+        .execute()
+    if res.data:
+        return res.data[0]
+    return {
+        "user_id": user_id,
+        "database_id": database_id,
+        "last_edited_watermark": None,
+        "last_synced_at": None,
+        "pages_synced": 0,
+    }
+
+
+async def save_sync_state(client, state: Dict[str, Any], now: datetime) -> None:
+    row = dict(state)
+    row["updated_at"] = now.isoformat()
+    await client.table(NOTION_SYNC_STATE_TABLE)\
+        .upsert(row, on_conflict="user_id,database_id")\
+        .execute()
+
+
+async def write_notion_tasks(client, rows: List[Dict[str, Any]]) -> int:
+    """
+    tasks と、それに対応する habits をまとめて upsert する（DB関数 upsert_notion_tasks()。migration 017）
+
+    どちらも (user_id, notion_page_id) で重複排除するので、同じページを別のユーザーが同期しても
+    互いの行は書き換えない。一度完了したタスクは、Notion 側で Done でなくても未完了に戻さない。
+    バッチの件数にかかわらず往復は1回。
+    """
+    if not rows:
+        return 0
+    await client.rpc("upsert_notion_tasks", {"p_rows": rows}).execute()
+    return len(rows)
+
+
+async def _task_batches(
+    notion,
+    user_id: str,
+    database_id: str,
+    since: Optional[str],
+    batch_size: int,
+) -> AsyncIterator[Tuple[List[Dict[str, Any]], int, Optional[datetime]]]:
+    """
+    Notion のページを last_edited_time の昇順で読み、batch_size 件ずつ tasks の行にして返す。
+
+    (行, 読んだNotionページ数, ここまでの最新 last_edited_time) を返す。
+    同じページがバッチ内で重複した場合（クエリ中に編集された等）は後に来たものを使う。
+    """
+    buffer: Dict[str, Dict[str, Any]] = {}
+    pages = 0
+    watermark = parse_timestamp(since)
+    async for results in notion.aiter_query_pages(
+        database_id=database_id,
+        filter=edited_since_filter(since),
+        sorts=[{"timestamp": "last_edited_time", "direction": "ascending"}],
+        user_id=user_id,
+    ):
+        for page in results:
+            buffer[page["id"]] = page_to_task(page, user_id)
+            edited = parse_timestamp(page.get("last_edited_time"))
+            if edited is not None and (watermark is None or edited > watermark):
+                watermark = edited
+        pages += len(results)
+        if len(buffer) >= batch_size:
+            yield list(buffer.values()), pages, watermark
+            buffer, pages = {}, 0
+    if buffer:
+        yield list(buffer.values()), pages, watermark
+
+
+async def import_notion_pages(
+    client,
+    notion,
+    user_id: str,
+    database_id: str,
+    since: Optional[str] = None,
+    batch_size: int = NOTION_IMPORT_BATCH_SIZE,
+    on_batch: Optional[Callable[[int, Optional[datetime]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Notion → tasks / habits のストリーミング取り込み
+
+    Notion からの読み込みとDBへの書き込みを重ねて実行する（バッチ N を書いている間に N+1 を読む）。
+    書き込みは常に1つだけ進行させるので、on_batch(読んだページ数, ウォーターマーク) はバッチ順に呼ばれる。
+    5,000ページなら Notion 50リクエスト + DB 10往復（batch_size=500）。
+    """
+    report: Dict[str, Any] = {"pages": 0, "tasks_upserted": 0, "batches": 0}
+
+    async def write(rows, pages, watermark):
+        written = await write_notion_tasks(client, rows)
+        if on_batch is not None:
+            await on_batch(pages, watermark)
+        report["pages"] += pages
+        report["tasks_upserted"] += written
+        report["batches"] += 1
+
+    pending: Optional[asyncio.Task] = None
+    try:
+        async for rows, pages, watermark in _task_batches(notion, user_id, database_id, since, batch_size):
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(write(rows, pages, watermark))
+        if pending is not None:
+            await pending
+    finally:
+        # Notion 側で失敗しても、書き込み中のバッチは完了させる（次回はその続きから）
+        if pending is not None and not pending.done():
+            await asyncio.gather(pending, return_exceptions=True)
+    return report
+
+
+async def sync_notion_incremental(
+    client,
+    notion,
+    user_id: str,
+    database_id: Optional[str] = None,
+    now: Optional[datetime] = None,
+    full: bool = False,
+    batch_size: int = NOTION_IMPORT_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    前回のウォーターマーク以降に編集されたページだけを取り込む（full=True なら全件を取り込み直す）。
+
+    コストは変更されたページ数に比例する（batch_size 件ごとに upsert 1回 + 状態保存1回）。
+    """
+    now = now or datetime.now(timezone.utc)
+    database_id = database_id or notion.db_id
+    state = await load_sync_state(client, user_id, database_id)
+    since = None if full else state["last_edited_watermark"]
+
+    async def save_progress(pages: int, watermark: Optional[datetime]) -> None:
+        state["last_edited_watermark"] = watermark.isoformat() if watermark else None
+        state["pages_synced"] += pages
+        state["last_synced_at"] = now.isoformat()
+        await save_sync_state(client, state, now)
+
+    report = await import_notion_pages(
+        client, notion, user_id, database_id, since=since, batch_size=batch_size, on_batch=save_progress
+    )
+    if report["batches"] == 0:
+        state["last_synced_at"] = now.isoformat()
+        await save_sync_state(client, state, now)
+
+    return {
+        "status": "completed",
+        "full_sync": since is None,
+        **report,
+        "watermark": state["last_edited_watermark"],
+    }
@@ -0,0 +1,292 @@
+"""
+Notion webhook の検証と、ページ単位でまとめて tasks に反映するキュー
+
+Notion はページの変更を webhook（page.created / page.properties_updated / page.deleted など）で通知する。
+イベントには変更後の値が含まれないため、ページを取得し直して tasks / habits に upsert する。
+
+同じページへのイベントは短時間に連続して届く（プロパティを1つずつ編集した場合など）ので、
+NOTION_WEBHOOK_COALESCE_SECONDS の間はページIDごとに1件にまとめ、窓が閉じたページだけを
+1回の取得 + まとめた upsert で反映する（N回の編集でも Notion へのリクエストは1回）。
+まとめられるのは常駐するサーバー（uvicorn）だけ。Lambda（Mangum）ではバックグラウンドタスクが
+レスポンス前に実行されるため、既定では窓を 0 にして受け取った webhook をすぐ反映する（app.core.config を参照）。
+
+ページは次のユーザー全員のタスクとして反映する（tasks は (user_id, notion_page_id) で重複排除。migration 017）:
+1. 既にそのページを取り込んでいるユーザー（tasks.notion_page_id）
+2. そのページの親データベースを同期しているユーザー（notion_sync_state）
+どちらもいないページは反映しない（次回の差分同期に任せる）。
+
+tasks から消すのは page.deleted イベントか、取得したページが archived / in_trash のときだけ。
+取得できなかったページ（404 など）は削除とみなさず、WEBHOOK_MAX_FETCH_ATTEMPTS 回まで次の flush で取得し直す。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.config import settings
+from app.services.notion_sync import NOTION_SYNC_STATE_TABLE, page_to_task, write_notion_tasks
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Notion-Signature"
+DELETE_EVENTS = {"page.deleted"}
+# キューに溜めるページ数の上限（超えたら窓を待たずに反映する）
+WEBHOOK_MAX_PENDING = 500
+# 取得できなかったページを取得し直す回数の上限（超えたらキューから外し、次回の差分同期に任せる）
+WEBHOOK_MAX_FETCH_ATTEMPTS = 3
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """X-Notion-Signature の値（"sha256=" + ボディの HMAC-SHA256）"""
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body, secret), signature)
+
+
+def _id_variants(notion_id: str) -> List[str]:
+    """Notion のIDはハイフンあり・なしの両方で保存されうるので、両方の表記を返す"""
+    compact = notion_id.replace("-", "").lower()
+    if len(compact) != 32:
+        return [notion_id]
+    dashed = f"{compact[:8]}-{compact[8:12]}-{compact[12:16]}-{compact[16:20]}-{compact[20:]}"
+    return [dashed, compact]
+
+
+def _parent_database_id(page: Optional[Dict[str, Any]], event: Dict[str, Any]) -> Optional[str]:
+    parent = (page or {}).get("parent") or {}
+    if parent.get("type") == "database_id":
+        return parent.get("database_id")
+    event_parent = event.get("parent") or {}
+    if event_parent.get("type") == "database":
+        return event_parent.get("id")
+    return None
+
+
+class NotionWebhookQueue:
+    """page_id ごとに最新のイベントだけを保持し、窓を過ぎたものからまとめて反映する"""
+
+    def __init__(self, coalesce_seconds: float, max_pending: int = WEBHOOK_MAX_PENDING):
+        self.coalesce_seconds = coalesce_seconds
+        self.max_pending = max_pending
+        # page_id -> {"type", "timestamp", "parent", "first_seen", "events", "attempts"}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._draining = False
+        self.received = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.unrouted = 0
+        self.requeued = 0
+        self.dropped = 0
+
+    def add(self, event: Dict[str, Any]) -> bool:
+        """ページのイベントをキューに積む（ページ以外のイベントは無視して False）"""
+        entity = event.get("entity") or {}
+        if entity.get("type") != "page" or not entity.get("id"):
+            return False
+        page_id = entity["id"]
+        timestamp = event.get("timestamp") or ""
+        with self._lock:
+            self.received += 1
+            entry = self._pending.get(page_id)
+            if entry is None:
+                self._pending[page_id] = {
+                    "type": event.get("type"),
+                    "timestamp": timestamp,
+                    "parent": (event.get("data") or {}).get("parent"),
+                    "first_seen": time.monotonic(),
+                    "events": 1,
+                    "attempts": 0,
+                }
+                return True
+            self.coalesced += 1
+            entry["events"] += 1
+            # 順不同で届くことがあるので、新しいイベントの種類（削除かどうか）だけを採用する
+            if timestamp >= entry["timestamp"]:
+                entry["type"] = event.get("type")
+                entry["timestamp"] = timestamp
+                entry["parent"] = (event.get("data") or {}).get("parent") or entry["parent"]
+        return True
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def seconds_until_due(self) -> Optional[float]:
+        """最も古いページの窓が閉じるまでの秒数（キューが空なら None）"""
+        with self._lock:
+            if not self._pending:
+                return None
+            if len(self._pending) >= self.max_pending:
+                return 0.0
+            oldest = min(entry["first_seen"] for entry in self._pending.values())
+        return max(0.0, oldest + self.coalesce_seconds - time.monotonic())
+
+    def _take(self, force: bool) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if force or len(self._pending) >= self.max_pending:
+                taken, self._pending = self._pending, {}
+                return taken
+            cutoff = time.monotonic() - self.coalesce_seconds
+            taken = {page_id: e for page_id, e in self._pending.items() if e["first_seen"] <= cutoff}
+            for page_id in taken:
+                del self._pending[page_id]
+            return taken
+
+    async def _owners(self, client, page_ids: List[str], database_ids: Set[str]) -> Dict[str, Any]:
+        """既存タスクの持ち主（page_id -> {user_id}）と、データベースを同期しているユーザー（db -> {user_id}）"""
+        variants = sorted({v for db in database_ids for v in _id_variants(db)})
+        queries = [client.table("tasks").select("user_id, notion_page_id").in_("notion_page_id", page_ids).execute()]
+        if variants:
+            queries.append(
+                client.table(NOTION_SYNC_STATE_TABLE).select("user_id, database_id").in_("database_id", variants).execute()
+            )
+        results = await asyncio.gather(*queries)
+        page_owner: Dict[str, Set[str]] = {}
+        for row in results[0].data or []:
+            page_owner.setdefault(row["notion_page_id"], set()).add(row["user_id"])
+        db_users: Dict[str, Set[str]] = {}
+        for row in (results[1].data if len(results) > 1 else None) or []:
+            key = row["database_id"].replace("-", "").lower()
+            db_users.setdefault(key, set()).add(row["user_id"])
+        return {"page_owner": page_owner, "db_users": db_users}
+
+    async def flush(self, client, notion, force: bool = False) -> Dict[str, int]:
+        """
+        窓を過ぎたページを反映する（force=True なら全件。シャットダウン時に使う）
+
+        削除イベントのページは tasks から消し（habits は task_id の ON DELETE CASCADE で消える）、
+        それ以外はページを並行に取得して（Notion へのレートはスケジューラが守る）まとめて upsert する。
+        取得できなかったページはキューに戻す（requeued）。
+        """
+        taken = self._take(force)
+        if not taken:
+            return {"pages": 0, "upserted": 0, "deleted": 0, "unrouted": 0, "requeued": 0, "dropped": 0}
+        try:
+            return await self._apply(client, notion, taken)
+        except Exception:
+            # 反映できなかったページはキューに戻す（次の flush で再試行）
+            self._requeue(taken)
+            raise
+
+    def _requeue(self, taken: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            for page_id, entry in taken.items():
+                newer = self._pending.get(page_id)
+                if newer is None:
+                    self._pending[page_id] = entry
+                else:
+                    newer["first_seen"] = min(newer["first_seen"], entry["first_seen"])
+                    newer["events"] += entry["events"]
+                    newer["attempts"] = max(newer["attempts"], entry["attempts"])
+
+    async def _apply(self, client, notion, taken: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        fetch_ids = [page_id for page_id, e in taken.items() if e["type"] not in DELETE_EVENTS]
+        fetched = await asyncio.gather(*(notion.aget_page(page_id, user_id="webhook") for page_id in fetch_ids))
+        pages = dict(zip(fetch_ids, fetched))
+
+        # 削除するのは削除イベントか、アーカイブ・ゴミ箱に入っていると確認できたページだけ
+        delete_ids = {
+            page_id for page_id, e in taken.items()
+            if e["type"] in DELETE_EVENTS
+            or (pages.get(page_id) is not None and (pages[page_id].get("archived") or pages[page_id].get("in_trash")))
+        }
+        # 取得できなかったページは削除とみなさず、次の flush で取得し直す
+        retry: Dict[str, Dict[str, Any]] = {}
+        dropped = 0
+        for page_id in fetch_ids:
+            if pages[page_id] is None:
+                taken[page_id]["attempts"] += 1
+                if taken[page_id]["attempts"] < WEBHOOK_MAX_FETCH_ATTEMPTS:
+                    retry[page_id] = taken[page_id]
+                else:
+                    dropped += 1
+                    logger.warning("Notion page %s could not be fetched %d times; leaving it to the next sync",
+                                   page_id, taken[page_id]["attempts"])
+        upsert_ids = [page_id for page_id in fetch_ids if pages[page_id] is not None and page_id not in delete_ids]
+
+        rows = []
+        unrouted = 0
+        if upsert_ids:
+            database_ids = {db for db in (_parent_database_id(pages[p], taken[p]) for p in upsert_ids) if db}
+            owners = await self._owners(client, upsert_ids, database_ids)
+            for page_id in upsert_ids:
+                db = _parent_database_id(pages[page_id], taken[page_id])
+                users = owners["page_owner"].get(page_id, set()) | owners["db_users"].get(
+                    (db or "").replace("-", "").lower(), set()
+                )
+                if not users:
+                    unrouted += 1
+                    continue
+                rows.extend(page_to_task(pages[page_id], user_id) for user_id in sorted(users))
+
+        writes = [write_notion_tasks(client, rows)]
+        if delete_ids:
+            writes.append(client.table("tasks").delete().in_("notion_page_id", sorted(delete_ids)).execute())
+        await asyncio.gather(*writes)
+        if retry:
+            self._requeue(retry)
+
+        with self._lock:
+            self.flushes += 1
+            self.upserted += len(rows)
+            self.deleted += len(delete_ids)
+            self.unrouted += unrouted
+            self.requeued += len(retry)
+            self.dropped += dropped
+        return {
+            "pages": len(taken), "upserted": len(rows), "deleted": len(delete_ids), "unrouted": unrouted,
+            "requeued": len(retry), "dropped": dropped,
+        }
+
+    async def flush_when_due(self, client, notion) -> None:
+        """
+        窓が閉じるのを待ってから反映する（webhook レスポンス後のバックグラウンドタスク用）
+
+        既に待っているタスクがあればそちらに任せる（キューが空になるまで反映を続ける）。
+        取得できずにキューに戻したページがあればそこで終える（次の webhook かシャットダウン時に取得し直す）。
+        """
+        if self._draining:
+            return
+        self._draining = True
+        try:
+            delay = self.seconds_until_due()
+            while delay is not None:
+                await asyncio.sleep(delay)
+                try:
+                    result = await self.flush(client, notion)
+                except Exception:
+                    # キューに残したまま終える（次の webhook かシャットダウン時に再試行）
+                    logger.exception("Notion webhook flush failed")
+                    return
+                if result["requeued"]:
+                    logger.warning("Requeued %d Notion pages that could not be fetched", result["requeued"])
+                    return
+                delay = self.seconds_until_due()
+        finally:
+            self._draining = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending(),
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "upserted": self.upserted,
+            "deleted": self.deleted,
+            "unrouted": self.unrouted,
+            "requeued": self.requeued,
+            "dropped": self.dropped,
+        }
+
+
+webhook_queue = NotionWebhookQueue(settings.NOTION_WEBHOOK_COALESCE_SECONDS)
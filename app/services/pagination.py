@@ -0,0 +1,104 @@
+"""
+一覧APIのキーセットページング（created_at, id の降順）
+
+OFFSET ではなく「最後に返した行の (created_at, id) より前」を条件にして次のページを取得するので、
+何ページ目でもインデックスの範囲走査になり、1ページあたりの時間・サイズが一定になる。
+カーソルは (created_at, id) を base64url にした不透明な文字列で、クライアントは中身を解釈しない。
+
+合計件数は同じ条件（カーソル条件を除く）の count クエリを並行に発行して求める:
+- exact: COUNT(*) の正確な値
+- estimated: 件数が少なければ正確な値、多ければ実行計画の推定値（PostgREST の estimated）
+- none: 数えない（total は None）
+"""
+
+import asyncio
+import base64
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# キーセットの並び順に使う列（射影しても必ず取得する）
+KEYSET_COLUMNS = ("created_at", "id")
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """カーソルを (created_at, id) に戻す（壊れたカーソルは ValueError）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(created_at, str) or not isinstance(row_id, str):
+        raise ValueError("invalid cursor")
+    return created_at, row_id
+
+
+def apply_keyset(query, cursor: str):
+    """
+    降順で「カーソルの行より後ろ」の条件を付ける
+
+    (created_at, id) < (c, i) を created_at <= c AND (created_at < c OR id < i) と書く。
+    created_at <= c がインデックスの範囲条件になるので、深いページでも先頭から読み飛ばさない。
+    or() の値はダブルクォートで囲む（タイムスタンプの + や : 対策）。
+    """
+    created_at, row_id = decode_cursor(cursor)
+    return query.lte("created_at", created_at)\
+        .or_(f'created_at.lt."{created_at}",id.lt."{row_id}"')
+
+
+def projection(fields: Optional[str], allowed: Iterable[str]) -> str:
+    """
+    fields（カンマ区切り）を select の列リストにする。省略時は "*"。
+
+    許可されていない列名は ValueError。ページングに必要な created_at, id は常に含める。
+    """
+    if not fields:
+        return "*"
+    allowed = set(allowed)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(requested) - allowed)
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    columns = list(dict.fromkeys([*requested, *KEYSET_COLUMNS]))
+    return ",".join(columns)
+
+
+async def fetch_keyset_page(
+    client,
+    table: str,
+    apply_filters: Callable[[Any], Any],
+    columns: str = "*",
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    count: str = "estimated",
+) -> Dict[str, Any]:
+    """
+    1ページ分の行・次のページのカーソル・合計件数を返す。
+
+    apply_filters はクエリビルダーに eq() などの条件を付けて返す関数（行の取得と count の両方に使う）。
+    limit + 1 件を取得して、次のページがあるかどうかを判定する。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = apply_filters(client.table(table).select(columns))
+    if cursor:
+        query = apply_keyset(query, cursor)
+    query = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+
+    queries = [query.execute()]
+    if count != "none":
+        queries.append(apply_filters(client.table(table).select("id", count=count, head=True)).execute())
+    results = await asyncio.gather(*queries)
+
+    rows: List[Dict[str, Any]] = results[0].data or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "rows": rows,
+        "next_cursor": encode_cursor(rows[-1]) if has_more else None,
+        "total": results[1].count if count != "none" else None,
+    }
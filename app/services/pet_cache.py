@@ -0,0 +1,93 @@
+"""
+ペット状態のインプロセスキャッシュ（LRU + TTL）
+
+保存されたペット行はタスク完了・習慣完了・復活・CRONなどの書き込みでしか変わらないので、
+user_id ごとに行のスナップショットを保持し、減衰は「キャッシュした行 + 現在時刻」から毎回計算する。
+書き込み側は必ず invalidate() を呼ぶこと。
+TTLは別プロセス（他のLambdaインスタンス等）からの書き込みに対する鮮度の上限。
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from app.core.config import settings
+
+
+class PetStateCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, row = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return copy.deepcopy(row)
+
+    def put(self, user_id: str, row: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), copy.deepcopy(row))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def patch(self, user_id: str, values: Dict[str, Any]) -> None:
+        """キャッシュ済みの行に、遅延書き込み中の値を反映する（TTLは延長しない）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry[1].update(values)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(str(user_id), None) is not None:
+                self.invalidations += 1
+
+    def invalidate_many(self, user_ids: Iterable[str]) -> None:
+        for user_id in user_ids:
+            self.invalidate(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+pet_cache = PetStateCache(
+    max_entries=settings.PET_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PET_CACHE_TTL_SECONDS,
+)
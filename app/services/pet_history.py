@@ -0,0 +1,84 @@
+"""
+イベントログ（pet_events）とスナップショット（pet_snapshots）からのペットの状態の再構築
+
+ペットの状態を変える書き込みはすべてイベントとして pet_events に追記され（追記のみ・更新しない）、
+pets の行はそれを game_logic.apply_pet_event で畳み込んだ結果になっている
+（database/migrations/014_pet_events.sql）。
+スナップショットはイベントが50件溜まるごとに DB 側で保存される（snapshot_pets()）ので、
+ある時点の状態は「その時点以前の最新のスナップショット + それ以降のイベント」だけを読めば求まる。
+
+- load_pet_state(client, pet_id)       : 現在の状態（pets の行と一致するはず）
+- load_pet_state(client, pet_id, at)   : at の時点で pets に保存されていた状態
+
+進化（evolution_stage / evolution_path）は born_at と care_score から毎回再計算する派生値なので、
+スナップショットにもイベントにも含めない。
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.services.game_logic import PET_STATE_COLUMNS, apply_pet_events
+
+# 1回で取得するイベント数
+EVENT_PAGE_SIZE = 1000
+
+
+def event_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """pet_events の行を game_logic のイベント（type, at, ...data）に戻す"""
+    return {"type": row["type"], "at": row["occurred_at"], **(row.get("data") or {})}
+
+
+async def fetch_snapshot(client, pet_id: str, at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """at 以前（省略時は最新）のスナップショット。ログより前の時点なら None"""
+    query = client.table("pet_snapshots")\
+        .select("last_event_id, state, as_of")\
+        .eq("pet_id", pet_id)
+    if at is not None:
+        query = query.lte("as_of", at.isoformat())
+    res = await query.order("last_event_id", desc=True).limit(1).execute()
+    return res.data[0] if res.data else None
+
+
+async def fetch_events_since(
+    client, pet_id: str, after_event_id: int, at: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """after_event_id より後のイベントを記録順に取得する（at を渡すとその時点までに記録されたもの）"""
+    rows: List[Dict[str, Any]] = []
+    last_id = after_event_id
+    while True:
+        query = client.table("pet_events")\
+            .select("id, type, occurred_at, data, recorded_at")\
+            .eq("pet_id", pet_id)\
+            .gt("id", last_id)
+        if at is not None:
+            query = query.lte("recorded_at", at.isoformat())
+        res = await query.order("id").limit(EVENT_PAGE_SIZE).execute()
+        page = res.data or []
+        rows.extend(page)
+        if len(page) < EVENT_PAGE_SIZE:
+            return rows
+        last_id = page[-1]["id"]
+
+
+async def load_pet_state(client, pet_id: str, at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    スナップショット + それ以降のイベントの畳み込みでペットの状態を求める。
+
+    at を渡すと、その時点までに記録されたイベントだけを適用する（その時点で pets に保存されていた状態）。
+    ログより前の時点・存在しないペットは None。
+    戻り値: state（PET_STATE_COLUMNS）, snapshot_event_id, last_event_id, events_applied, as_of
+    """
+    snapshot = await fetch_snapshot(client, pet_id, at)
+    if snapshot is None:
+        return None
+
+    rows = await fetch_events_since(client, pet_id, snapshot["last_event_id"], at)
+    state, _ = apply_pet_events(snapshot["state"], [event_from_row(row) for row in rows])
+    return {
+        "pet_id": pet_id,
+        "state": {column: state.get(column) for column in PET_STATE_COLUMNS},
+        "snapshot_event_id": snapshot["last_event_id"],
+        "last_event_id": rows[-1]["id"] if rows else snapshot["last_event_id"],
+        "events_applied": len(rows),
+        "as_of": rows[-1]["recorded_at"] if rows else snapshot["as_of"],
+    }
@@ -0,0 +1,176 @@
+"""
+ペット行の楽観的排他制御（compare-and-swap + 上限付きリトライ）
+
+pets.version は UPDATE のたびにトリガーで +1 される（database/migrations/012_pet_version.sql）。
+書き込みは「読んだ行の version と一致する場合だけ」更新し、一致しなければ（他の書き込みが先に入った）
+行を読み直して計算し直す。書き込む値は、読み直した行にイベントを適用し直して毎回求める
+（game_logic.apply_pet_events）ので、並行した回復とダメージがお互いを上書きしない。
+
+イベントは行の更新と同じトランザクションで pet_events に追記される（DB関数 append_pet_events() /
+update_pets_cas()。database/migrations/014_pet_events.sql）。pets の行はイベントログを畳み込んだ結果で、
+app.services.pet_history でいつの時点の状態でも再構築できる。
+
+ロックは取らないので書き込み同士は待ち合わない。リトライの回数・競合の頻度は stats() で /metrics に出す。
+"""
+
+import asyncio
+import random
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+from app.services.game_logic import apply_pet_events
+
+# 競合後に読み直すまでの待ち時間（秒。ジッター付きで attempt ごとに倍）
+CAS_BACKOFF_BASE_SECONDS = 0.005
+
+
+class PetWriteConflict(Exception):
+    """リトライを使い切っても compare-and-swap が成功しなかった"""
+
+
+class PetWriteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.conflicts = 0
+        self.exhausted = 0
+        # 何回目の試行で成功したか（0 = 競合なし）
+        self.retries_histogram: Counter = Counter()
+        self.conflicts_by_writer: Counter = Counter()
+
+    def record(self, writer: str, retries: int, conflicts: int, exhausted: int = 0) -> None:
+        with self._lock:
+            self.writes += 1
+            self.conflicts += conflicts
+            self.exhausted += exhausted
+            self.retries_histogram[retries] += 1
+            if conflicts:
+                self.conflicts_by_writer[writer] += conflicts
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "writes": self.writes,
+                "conflicts": self.conflicts,
+                "exhausted": self.exhausted,
+                "conflict_rate": round(self.conflicts / (self.writes + self.conflicts), 4)
+                if self.writes + self.conflicts else 0.0,
+                "retries_histogram": {str(k): v for k, v in sorted(self.retries_histogram.items())},
+                "conflicts_by_writer": dict(self.conflicts_by_writer),
+            }
+
+
+pet_write_stats = PetWriteStats()
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, CAS_BACKOFF_BASE_SECONDS * (2 ** attempt))
+
+
+async def update_pet_cas(
+    client,
+    pet: Dict[str, Any],
+    events_for: Callable[[Dict[str, Any]], Optional[Sequence[Dict[str, Any]]]],
+    writer: str,
+    max_retries: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    events_for(pet) が返すイベントを追記し、pet に適用した結果を pet の version が変わっていなければ書き込む。
+
+    競合したら行を読み直して events_for からやり直す（最大 max_retries 回）。
+    events_for が None を返した場合・行が削除されていた場合は書き込まずに None を返す。
+    戻り値は更新後の行。リトライを使い切ったら PetWriteConflict。
+    """
+    max_retries = settings.PET_CAS_MAX_RETRIES if max_retries is None else max_retries
+    conflicts = 0
+    for attempt in range(max_retries + 1):
+        events = events_for(pet)
+        if events is None:
+            return None
+        res = await client.rpc("append_pet_events", {
+            "p_pet_id": pet["id"],
+            "p_version": pet["version"],
+            "p_state": apply_pet_events(pet, events)[1],
+            "p_events": list(events),
+        }).execute()
+        if res.data:
+            pet_write_stats.record(writer, attempt, conflicts)
+            return res.data
+
+        conflicts += 1
+        if attempt == max_retries:
+            break
+        await asyncio.sleep(_backoff(attempt))
+        fresh = await client.table("pets").select("*").eq("id", pet["id"]).execute()
+        if not fresh.data:
+            pet_write_stats.record(writer, attempt, conflicts)
+            return None
+        pet = fresh.data[0]
+
+    pet_write_stats.record(writer, max_retries, conflicts, exhausted=1)
+    raise PetWriteConflict(f"pet {pet['id']} was updated concurrently {conflicts} times")
+
+
+async def update_pets_cas(
+    client,
+    updates: List[Dict[str, Any]],
+    recompute: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+    writer: str,
+    columns: str,
+    max_retries: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    複数ペットの compare-and-swap（DB関数 update_pets_cas() で1回にまとめて書き込む）
+
+    updates の各要素は id, version と hp, status（任意で last_checked_at, last_damage_run_id）と、
+    書き込みと同じトランザクションで pet_events に追記する events。
+    競合した行は columns で読み直して recompute(fresh) で更新内容を作り直す（None なら書き込まない）。
+
+    戻り値:
+        written  : id -> 書き込めた行 {id, user_id, hp, status, version}
+        skipped  : recompute が None を返した・削除されていた id
+        exhausted: リトライを使い切った id（CRON では次回の実行に回す）
+    """
+    max_retries = settings.PET_CAS_MAX_RETRIES if max_retries is None else max_retries
+    written: Dict[str, Dict[str, Any]] = {}
+    if not updates:
+        return {"written": written, "skipped": [], "exhausted": []}
+    skipped: List[str] = []
+    attempts: Dict[str, int] = {}
+    pending = updates
+
+    for attempt in range(max_retries + 1):
+        res = await client.rpc("update_pets_cas", {"p_updates": pending}).execute()
+        for row in res.data or []:
+            written[str(row["id"])] = row
+            pet_write_stats.record(writer, attempt, attempts.get(str(row["id"]), 0))
+
+        conflicted = [str(u["id"]) for u in pending if str(u["id"]) not in written]
+        if not conflicted:
+            return {"written": written, "skipped": skipped, "exhausted": []}
+        for pet_id in conflicted:
+            attempts[pet_id] = attempts.get(pet_id, 0) + 1
+        if attempt == max_retries:
+            break
+
+        await asyncio.sleep(_backoff(attempt))
+        fresh = await client.table("pets").select(columns).in_("id", conflicted).execute()
+        fresh_by_id = {str(row["id"]): row for row in fresh.data or []}
+        pending = []
+        for pet_id in conflicted:
+            row = fresh_by_id.get(pet_id)
+            update = recompute(row) if row is not None else None
+            if update is None:
+                skipped.append(pet_id)
+                pet_write_stats.record(writer, attempt + 1, attempts[pet_id])
+            else:
+                pending.append(update)
+        if not pending:
+            return {"written": written, "skipped": skipped, "exhausted": []}
+
+    exhausted = [str(u["id"]) for u in pending if str(u["id"]) not in written]
+    for pet_id in exhausted:
+        pet_write_stats.record(writer, max_retries, attempts[pet_id], exhausted=1)
+    return {"written": written, "skipped": skipped, "exhausted": exhausted}
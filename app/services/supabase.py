@@ -1,44 +1,27 @@
-import os
-import httpx
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv  # 👈 追加: ライブラリをインポート
 
 # 👇 追加: これが実行された瞬間に .env の中身がメモリに展開されます
 load_dotenv()
-# ==========================================
-# 🛡️ HTTP/2 DISABLE FLAG (The Magic Switch)
-# ==========================================
-# これにより、httpcoreライブラリが強制的にHTTP/1.1を使用します。
-# "StreamReset" エラーを回避する最も確実な方法です。
-os.environ["HTTPCORE_DISABLE_HTTP2"] = "1"
 
 # ==========================================
-# 🔧 HTTPX CLIENT PATCH (Proxy Argument Fix)
+# 🔌 HTTP Transport
 # ==========================================
-# gotrueライブラリがhttpx.Clientに古い形式のproxy引数を渡すため、
-# 互換性レイヤーを追加して新しい形式に変換します。
-_original_httpx_client_init = httpx.Client.__init__
-
-def _patched_httpx_client_init(self, *args, **kwargs):
-    """proxy引数を新しいproxies形式に変換するパッチ"""
-    # 古い形式の proxy 引数を処理
-    if 'proxy' in kwargs:
-        proxy_value = kwargs.pop('proxy')  # 古いproxy引数を削除
-        # proxy引数が指定されている場合のみproxiesに変換
-        if proxy_value:
-            kwargs['proxies'] = proxy_value
-
-    # HTTP/2を強制的に無効化
-    kwargs['http2'] = False
-
-    # オリジナルの__init__を呼び出し
-    _original_httpx_client_init(self, *args, **kwargs)
-
-# パッチを適用
-httpx.Client.__init__ = _patched_httpx_client_init
-
-# パッチ適用後にsupabaseをインポート
-from supabase import create_client, Client
+# 以前はここでプロセス全体の httpx.Client.__init__ をパッチし、HTTP/2 を強制的に無効化していた
+# （"StreamReset" 対策・gotrue の古い proxy 引数対策）。
+# httpx 0.26 以降は proxy 引数をそのまま受け付けるため、パッチは不要。
+# HTTP/2 は app.services.transport で上流ごとにオプトインし、StreamReset 時は HTTP/1.1 に戻す。
+
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_TIMEOUT
 from app.core.config import settings
+from app.services.transport import close_async_transport, create_async_client, register_upstream
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # ==========================================
 # 🔑 Environment Variables
@@ -55,10 +38,69 @@ if not key:
 # ==========================================
 # 🚀 Client Initialization
 # ==========================================
+register_upstream("supabase", url or "")
+
+# 同期クライアント（supabase パッケージ。auth/storage/realtime まで読み込むため import が重い）は
+# ルーターでは使わないので、最初に get_client() が呼ばれたときに作る（Lambdaのコールドスタート短縮）。
 # シンプルな初期化に戻します。オプションは指定しません。
-try:
-    client: Client = create_client(url, key)
-    # print("✅ Supabase client initialized successfully!")
-except Exception as e:
-    # print(f"🚨 Failed to initialize Supabase client: {e}")
-    raise e
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "Client":
+    """同期クライアントを返す（初回呼び出し時に作成）"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from supabase import create_client
+            _client = create_client(url, key)
+        return _client
+
+
+def __getattr__(name: str):
+    # 互換性: 以前のモジュール変数 `from app.services.supabase import client`
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ==========================================
+# ⚡ Async Client (for async routers)
+# ==========================================
+# ルーターは async def で動かし、DB呼び出しの待ち時間にスレッドを占有しない。
+# 同期クライアントと同じ service_role キーで PostgREST に直接つなぐ（auth/storage は使わない）。
+class _AsyncPostgrestClient(AsyncPostgrestClient):
+    """共有トランスポート（keep-alive の接続プール）の上で動く PostgREST クライアント"""
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+        return create_async_client(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            follow_redirects=True,
+        )
+
+
+# httpx.AsyncClient の接続は作成したイベントループに紐づくため、ループごとに1つ持つ
+# （Mangum / TestClient はリクエストごとにループを作り直すことがある）
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncPostgrestClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncPostgrestClient:
+    """実行中のイベントループ用の非同期クライアントを返す（初回呼び出し時に作成）"""
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        async_client = _AsyncPostgrestClient(
+            f"{url}/rest/v1",
+            headers={"apiKey": key, "Authorization": f"Bearer {key}"},
+            timeout=DEFAULT_POSTGREST_CLIENT_TIMEOUT,
+        )
+        _async_clients[loop] = async_client
+    return async_client
+
+
+async def close_async_client() -> None:
+    """実行中のイベントループの非同期クライアントと接続プールを閉じる（シャットダウン時）"""
+    _async_clients.pop(asyncio.get_running_loop(), None)
+    await close_async_transport()
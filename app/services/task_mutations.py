@@ -0,0 +1,94 @@
+"""
+タスクの作成・完了・削除（単体 / バッチ）
+
+作成と完了は DB関数（database/migrations/011_task_mutations.sql）を1回呼び出すだけで、
+タスク・habit・ペットの更新が1トランザクションで行われる。
+- create_tasks(): タスクと対応する habit を複数行 INSERT でまとめて作る
+- complete_tasks(): タスクとペットをロックし、回復量・飢餓度の減少・care_score の更新を
+  合計してペットに1回で書き込む（同じタスクを並行に完了しても回復は1回）
+単体のエンドポイントは1件のリストとして同じ関数を使う。
+
+POST /tasks/complete は、ペットへの書き込みをまとめる設定（PET_WRITE_COALESCE_SECONDS > 0。既定は 0）の
+ときだけ claim_tasks() でタスクの完了だけを確定し、ペットへの反映は app.services.write_behind に積む。
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+# バッチAPIで1回に扱うタスク数の上限
+MAX_BATCH_SIZE = 500
+# 1回の削除で in_() に渡すID数（URL長の制限対策）
+DELETE_CHUNK_SIZE = 200
+
+
+async def create_tasks(client, user_id: str, tasks: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    タスクと habit を1トランザクションで作成し、作成したタスクの行を入力順に返す
+
+    tasks の各要素は title / description / priority / due_date（datetime か None）。
+    """
+    items = [
+        {
+            "title": t["title"],
+            "description": t.get("description"),
+            "priority": t.get("priority") or "medium",
+            "due_date": t["due_date"].isoformat() if isinstance(t.get("due_date"), datetime) else t.get("due_date"),
+        }
+        for t in tasks
+    ]
+    res = await client.rpc("create_tasks", {"p_user_id": user_id, "p_tasks": items}).execute()
+    return res.data or []
+
+
+async def complete_tasks(client, task_ids: Sequence[str],
+                         user_id: Optional[str] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    タスクを完了してペットに反映する（1回のRPC）
+
+    戻り値は complete_tasks() の JSONB:
+    results（入力順の task_id / status / healed）, tasks（task_id -> 完了したタスクの行）,
+    pet（更新後のペット。完了したタスクがなければ None）, user_id, healed（合計）
+    """
+    params: Dict[str, Any] = {"p_task_ids": list(task_ids)}
+    if user_id:
+        params["p_user_id"] = user_id
+    if now is not None:
+        params["p_now"] = now.isoformat()
+    res = await client.rpc("complete_tasks", params).execute()
+    return res.data
+
+
+async def claim_tasks(client, task_ids: Sequence[str],
+                      user_id: Optional[str] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    タスクの完了だけを確定する（1回のRPC。ペットは更新しない）
+
+    戻り値は claim_tasks() の JSONB:
+    results（入力順の task_id / status / priority）, tasks（task_id -> 完了したタスクの行）,
+    pet（生存中のペットの現在の行）, user_id
+    """
+    params: Dict[str, Any] = {"p_task_ids": list(task_ids)}
+    if user_id:
+        params["p_user_id"] = user_id
+    if now is not None:
+        params["p_now"] = now.isoformat()
+    res = await client.rpc("claim_tasks", params).execute()
+    return res.data
+
+
+async def delete_tasks(client, user_id: str, task_ids: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    ユーザーのタスクをまとめて削除し、タスクごとの結果（deleted / not_found）を入力順に返す
+
+    habit は task_id の ON DELETE CASCADE で一緒に消える。
+    """
+    unique_ids = list(dict.fromkeys(task_ids))
+    deleted = set()
+    for start in range(0, len(unique_ids), DELETE_CHUNK_SIZE):
+        chunk = unique_ids[start:start + DELETE_CHUNK_SIZE]
+        res = await client.table("tasks").delete().eq("user_id", user_id).in_("id", chunk).execute()
+        deleted.update(str(row["id"]) for row in res.data or [])
+    return [
+        {"task_id": task_id, "status": "deleted" if task_id in deleted else "not_found"}
+        for task_id in task_ids
+    ]
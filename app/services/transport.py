@@ -0,0 +1,209 @@
+"""
+上流API（Supabase / Notion）向けの共有HTTPトランスポート
+
+リクエストごとに httpx.Client を作るとTLSハンドシェイクからやり直しになるため、
+プロセス内で接続プールを共有し、keep-alive で接続を使い回す。
+
+HTTP/2 は上流ごとのオプトイン（settings.HTTP2_UPSTREAMS に "supabase,notion" のように指定）。
+HTTP/2 の接続で StreamReset を受けた場合は、そのホストを HTTP/1.1 に切り替えて1回だけ再送する
+（以前はプロセス全体の httpx.Client.__init__ をパッチして HTTP/2 を無効化していた）。
+
+アプリの上流への通信（Supabase と Notion の非同期メソッド）はすべて非同期トランスポートを共有する。
+httpx.AsyncClient の接続はイベントループに紐づくため、非同期側はループごとに1つ作る。
+同期トランスポートは NotionService の同期メソッド（スクリプトなど、イベントループの外から使う場合）
+だけのための別のプールで、初めて使われたときに作られる。
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlparse
+
+import httpx
+
+from app.core.config import settings
+
+try:
+    from h2.events import StreamReset
+except ImportError:  # HTTP/2 を使わない環境（h2 未インストール）
+    StreamReset = None
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+)
+
+
+class Http2Policy:
+    """ホストごとに HTTP/2 を使うかどうかを管理する（StreamReset を受けたホストは HTTP/1.1 に固定）"""
+
+    def __init__(self, enabled_upstreams: Set[str]):
+        self.enabled_upstreams = enabled_upstreams
+        self.hosts: Dict[str, str] = {}
+        self.downgraded: Set[str] = set()
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def register(self, upstream: str, base_url: str) -> Optional[str]:
+        host = urlparse(base_url).hostname
+        if host and upstream in self.enabled_upstreams and StreamReset is not None:
+            self.hosts[host] = upstream
+        return host
+
+    def use_http2(self, host: str) -> bool:
+        return host in self.hosts and host not in self.downgraded
+
+    def downgrade(self, host: str) -> None:
+        with self._lock:
+            self.downgraded.add(host)
+            self.fallbacks += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2_upstreams": sorted(self.hosts.values()),
+            "downgraded": sorted(self.hosts[h] for h in self.downgraded),
+            "fallbacks": self.fallbacks,
+        }
+
+
+http2_policy = Http2Policy({
+    name.strip() for name in settings.HTTP2_UPSTREAMS.split(",") if name.strip()
+})
+
+
+def register_upstream(upstream: str, base_url: str) -> Optional[str]:
+    """上流のベースURLを登録する（HTTP2_UPSTREAMS に含まれていれば HTTP/2 で接続する）"""
+    return http2_policy.register(upstream, base_url)
+
+
+def _is_stream_reset(exc: BaseException) -> bool:
+    """httpx.RemoteProtocolError の原因をたどり、h2 の StreamReset かどうかを判定する"""
+    if StreamReset is None:
+        return False
+    cause: Optional[BaseException] = exc
+    while cause is not None:
+        if any(isinstance(arg, StreamReset) for arg in cause.args):
+            return True
+        cause = cause.__cause__
+    return False
+
+
+def _can_resend(request: httpx.Request) -> bool:
+    # json= / content= で組み立てたボディは再送できる（ストリーミングボディは不可）
+    return isinstance(request.stream, httpx.ByteStream)
+
+
+class FallbackTransport(httpx.BaseTransport):
+    """HTTP/1.1 と HTTP/2 の2つの接続プールを持ち、ホストごとに使い分ける同期トランスポート"""
+
+    def __init__(self, policy: Http2Policy):
+        self.policy = policy
+        self.http1 = httpx.HTTPTransport(http2=False, limits=HTTP_LIMITS)
+        self.http2 = httpx.HTTPTransport(http2=True, limits=HTTP_LIMITS) if StreamReset is not None else None
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if self.http2 is None or not self.policy.use_http2(host):
+            return self.http1.handle_request(request)
+        try:
+            return self.http2.handle_request(request)
+        except httpx.RemoteProtocolError as e:
+            if not (_is_stream_reset(e) and _can_resend(request)):
+                raise
+            self.policy.downgrade(host)
+            return self.http1.handle_request(request)
+
+    def close(self) -> None:
+        # 共有プールなので個々のクライアントの close() では閉じない（close_transports() で閉じる）
+        pass
+
+    def shutdown(self) -> None:
+        self.http1.close()
+        if self.http2 is not None:
+            self.http2.close()
+
+
+class AsyncFallbackTransport(httpx.AsyncBaseTransport):
+    """FallbackTransport の非同期版"""
+
+    def __init__(self, policy: Http2Policy):
+        self.policy = policy
+        self.http1 = httpx.AsyncHTTPTransport(http2=False, limits=HTTP_LIMITS)
+        self.http2 = httpx.AsyncHTTPTransport(http2=True, limits=HTTP_LIMITS) if StreamReset is not None else None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if self.http2 is None or not self.policy.use_http2(host):
+            return await self.http1.handle_async_request(request)
+        try:
+            return await self.http2.handle_async_request(request)
+        except httpx.RemoteProtocolError as e:
+            if not (_is_stream_reset(e) and _can_resend(request)):
+                raise
+            self.policy.downgrade(host)
+            return await self.http1.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # 共有プールなので個々のクライアントの aclose() では閉じない（close_async_transport() で閉じる）
+        pass
+
+    async def shutdown(self) -> None:
+        await self.http1.aclose()
+        if self.http2 is not None:
+            await self.http2.aclose()
+
+
+_sync_lock = threading.Lock()
+_sync_transport: Optional[FallbackTransport] = None
+_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncFallbackTransport]" = weakref.WeakKeyDictionary()
+
+
+def get_transport() -> FallbackTransport:
+    """プロセス共有の同期トランスポート"""
+    global _sync_transport
+    with _sync_lock:
+        if _sync_transport is None:
+            _sync_transport = FallbackTransport(http2_policy)
+        return _sync_transport
+
+
+def get_async_transport() -> AsyncFallbackTransport:
+    """実行中のイベントループ用の非同期トランスポート（初回呼び出し時に作成）"""
+    loop = asyncio.get_running_loop()
+    transport = _async_transports.get(loop)
+    if transport is None:
+        transport = AsyncFallbackTransport(http2_policy)
+        _async_transports[loop] = transport
+    return transport
+
+
+def create_client(**kwargs) -> httpx.Client:
+    """共有トランスポートを使う httpx.Client を作る（close() してもプールは閉じない）"""
+    return httpx.Client(transport=get_transport(), **kwargs)
+
+
+def create_async_client(**kwargs) -> httpx.AsyncClient:
+    """共有トランスポートを使う httpx.AsyncClient を作る（aclose() してもプールは閉じない）"""
+    return httpx.AsyncClient(transport=get_async_transport(), **kwargs)
+
+
+def close_transports() -> None:
+    """同期トランスポートの接続を閉じる（シャットダウン時）"""
+    global _sync_transport
+    with _sync_lock:
+        transport, _sync_transport = _sync_transport, None
+    if transport is not None:
+        transport.shutdown()
+
+
+async def close_async_transport() -> None:
+    """実行中のイベントループの非同期トランスポートの接続を閉じる（シャットダウン時）"""
+    transport = _async_transports.pop(asyncio.get_running_loop(), None)
+    if transport is not None:
+        await transport.shutdown()
+
+
+def transport_stats() -> Dict[str, Any]:
+    return http2_policy.stats()
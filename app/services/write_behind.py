@@ -0,0 +1,273 @@
+"""
+書き込みの遅延バッファ（write-behind）
+
+1. 進化（EvolutionWriteBuffer）
+GET /pets/{user_id} で進化ステージ・パスが変わった場合、その場でUPDATEせずにバッファへ積み、
+レスポンス送信後のバックグラウンドタスクでまとめて書き込む。
+進化は born_at と care_score から毎回再計算できる派生値なので、
+フラッシュ前にプロセスが落ちて書き込みが失われても次の読み取りで同じ値が計算される。
+
+2. ペットへのイベント（PetEventBuffer）
+タスク完了・習慣完了が続けて届いた場合（10件のタスクを続けて片付けるなど）、ペットへの書き込みを
+PET_WRITE_COALESCE_SECONDS の間ペットごとに溜め、1回の UPDATE にまとめる。
+書き込む値は、最新の行にイベントを1件ずつ順に適用して求める（game_logic.apply_pet_events）ので、
+1件ずつ書き込んだ場合と同じ状態になる。書き込みは compare-and-swap（app.services.pet_writes）で、
+イベントは1件ずつ pet_events に追記される。
+溜めたイベントはシャットダウン時と、Lambda ハンドラーが返る前（app.main.handler）に必ず書き出す。
+まだ書き込んでいないイベントは、ペットの読み取り（app.routers.pets）で preview() により DB の行に重ねて返す。
+
+まとめるのは PET_WRITE_COALESCE_SECONDS > 0 を設定した場合だけ（既定の 0 ではその場で書き込む）。
+まとめている間、タスクの完了は DB に確定しているが回復はこのプロセスのメモリにしかないので、
+プロセスが落ちると（デプロイ・Lambda の凍結と破棄）回復が失われる。既定では作成・完了と同じく
+タスクの完了とペットの更新が1トランザクションで行われる（app.services.task_mutations.complete_tasks）。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.game_logic import apply_pet_events
+from app.services.pet_cache import pet_cache
+from app.services.pet_writes import update_pet_cas
+
+logger = logging.getLogger(__name__)
+
+# バッファに溜める上限件数と、最古の書き込みを待たせる最大秒数
+EVOLUTION_MAX_PENDING = 100
+EVOLUTION_MAX_AGE_SECONDS = 5.0
+
+
+class EvolutionWriteBuffer:
+    """pet_id ごとの最新の (evolution_stage, evolution_path) を保持し、まとめて書き込む"""
+
+    def __init__(self, max_pending: int = EVOLUTION_MAX_PENDING, max_age_seconds: float = EVOLUTION_MAX_AGE_SECONDS):
+        self.max_pending = max_pending
+        self.max_age_seconds = max_age_seconds
+        self._pending: Dict[str, Tuple[int, Optional[str]]] = {}
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    def add(self, pet_id: str, stage: int, path: Optional[str]) -> None:
+        with self._lock:
+            self._pending[pet_id] = (stage, path)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def is_due(self) -> bool:
+        with self._lock:
+            if not self._pending:
+                return False
+            return (len(self._pending) >= self.max_pending
+                    or time.monotonic() - self._oldest >= self.max_age_seconds)
+
+    def _drain(self) -> Dict[str, Tuple[int, Optional[str]]]:
+        with self._lock:
+            pending, self._pending, self._oldest = self._pending, {}, None
+            return pending
+
+    async def flush(self, client) -> int:
+        """
+        溜まった変更を (stage, path) の組ごとに1回のUPDATEで書き込む。
+
+        upsertだと削除済みのペットを再作成してしまうため、id の in_() で更新する。
+        stage は後退させない（lte条件）。組み合わせは最大でも 5ステージ x 3パス。
+        """
+        pending = self._drain()
+        if not pending:
+            return 0
+
+        groups: Dict[Tuple[int, Optional[str]], List[str]] = defaultdict(list)
+        for pet_id, value in pending.items():
+            groups[value].append(pet_id)
+
+        for (stage, path), pet_ids in groups.items():
+            await client.table("pets").update({
+                "evolution_stage": stage,
+                "evolution_path": path,
+            }).in_("id", pet_ids).lte("evolution_stage", stage).execute()
+
+        self.flushed_rows += len(pending)
+        self.flushes += 1
+        return len(pending)
+
+    async def flush_if_due(self, client) -> int:
+        if self.is_due():
+            return await self.flush(client)
+        return 0
+
+
+evolution_buffer = EvolutionWriteBuffer()
+
+
+class PetEventBuffer:
+    """
+    pet_id ごとにイベントを到着順に溜め、窓（coalesce_seconds）を過ぎたペットから1回の UPDATE で書き込む
+
+    coalesce_seconds が 0 のときは溜めずにその場で書き込む。
+    """
+
+    def __init__(self, coalesce_seconds: float, max_pending: int):
+        self.coalesce_seconds = coalesce_seconds
+        self.max_pending = max_pending
+        # pet_id -> {"user_id", "row"（最後に読んだ行）, "events", "first_seen"}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.events = 0
+        self.writes = 0
+        self.flushes = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.coalesce_seconds > 0
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def pending_events(self) -> int:
+        with self._lock:
+            return sum(len(entry["events"]) for entry in self._pending.values())
+
+    def preview(self, pet: Dict[str, Any], *events: Dict[str, Any]) -> Dict[str, Any]:
+        """DBから読んだ行に、まだ書き込んでいないイベントと events を適用した行（レスポンス用）"""
+        with self._lock:
+            entry = self._pending.get(str(pet["id"]))
+            pending = list(entry["events"]) if entry else []
+        if not pending and not events:
+            return pet
+        row, _ = apply_pet_events(pet, pending + list(events))
+        return row
+
+    async def submit(self, client, pet: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        イベントを受け付け、適用後のペットの行を返す。
+
+        まとめる場合はバッファに積んで（未書き込みのイベントを含めた）予測の行を返し、
+        まとめない場合はその場で compare-and-swap で書き込んで更新後の行を返す。
+        """
+        if not self.enabled:
+            written = await update_pet_cas(client, pet, lambda row: [event], writer=event["type"])
+            pet_cache.invalidate(pet["user_id"])
+            return written
+
+        row = self.preview(pet, event)
+        pet_id = str(pet["id"])
+        with self._lock:
+            self.events += 1
+            entry = self._pending.get(pet_id)
+            if entry is None:
+                self._pending[pet_id] = {
+                    "user_id": pet["user_id"],
+                    "row": pet,
+                    "events": [event],
+                    "first_seen": time.monotonic(),
+                }
+            else:
+                entry["events"].append(event)
+                entry["row"] = pet
+            full = len(self._pending) >= self.max_pending
+        pet_cache.invalidate(pet["user_id"])
+
+        if full:
+            await self.flush(client, force=True)
+        else:
+            self._schedule(client)
+        return row
+
+    def _schedule(self, client) -> None:
+        """最も古いペットの窓が閉じる時刻にフラッシュするタイマーを（なければ）仕掛ける"""
+        loop = asyncio.get_running_loop()
+        # 別のループ（終了したループ）で仕掛けたタイマーは発火しないので仕掛け直す
+        if self._timer is not None and self._timer_loop is loop:
+            return
+        self._timer_loop = loop
+        self._timer = loop.call_later(self.coalesce_seconds, lambda: loop.create_task(self._on_timer(client)))
+
+    async def _on_timer(self, client) -> None:
+        self._timer = None
+        try:
+            await self.flush(client)
+        except Exception:
+            logger.exception("Pet event flush failed")
+        if self._pending:
+            self._schedule(client)
+
+    def _take(self, force: bool) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if force:
+                taken, self._pending = self._pending, {}
+                return taken
+            cutoff = time.monotonic() - self.coalesce_seconds
+            taken = {pet_id: e for pet_id, e in self._pending.items() if e["first_seen"] <= cutoff}
+            for pet_id in taken:
+                del self._pending[pet_id]
+            return taken
+
+    def _requeue(self, pet_id: str, entry: Dict[str, Any]) -> None:
+        """書き込めなかったイベントを、後から届いたイベントより前に戻す"""
+        with self._lock:
+            newer = self._pending.get(pet_id)
+            if newer is None:
+                self._pending[pet_id] = entry
+            else:
+                newer["events"][:0] = entry["events"]
+                newer["first_seen"] = min(newer["first_seen"], entry["first_seen"])
+
+    async def _write(self, client, pet_id: str, entry: Dict[str, Any]) -> bool:
+        events = entry["events"]
+        try:
+            await update_pet_cas(client, entry["row"], lambda row: events, writer="pet_event_buffer")
+        except Exception:
+            logger.exception("Failed to write %d pet events for %s; requeued", len(events), pet_id)
+            self._requeue(pet_id, entry)
+            return False
+        pet_cache.invalidate(entry["user_id"])
+        return True
+
+    async def flush(self, client, force: bool = False) -> int:
+        """
+        窓を過ぎたペット（force=True なら全件）のイベントを書き込み、書き込んだペット数を返す。
+
+        ペット同士は独立しているので並行に書き込む。失敗したペットのイベントはバッファに戻す。
+        """
+        taken = self._take(force)
+        if not taken:
+            return 0
+        results = await asyncio.gather(*(self._write(client, pet_id, e) for pet_id, e in taken.items()))
+        written = sum(results)
+        with self._lock:
+            self.flushes += 1
+            self.writes += written
+            self.failures += len(results) - written
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "coalesce_seconds": self.coalesce_seconds,
+            "pending_pets": self.pending(),
+            "pending_events": self.pending_events(),
+            "events": self.events,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
+
+
+pet_event_buffer = PetEventBuffer(settings.PET_WRITE_COALESCE_SECONDS, settings.PET_WRITE_MAX_PENDING)
+
+
+async def flush_all(client) -> None:
+    """シャットダウン時・Lambda ハンドラーが返る前に全バッファを書き出す"""
+    await pet_event_buffer.flush(client, force=True)
+    await evolution_buffer.flush(client)
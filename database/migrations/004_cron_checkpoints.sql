@@ -0,0 +1,42 @@
+-- Migration 004: CRONのシャード実行・チェックポイント
+-- Supabase SQL Editor で実行すること
+--
+-- /tasks/cron/damage と /cron/damage は pets.id のキーセットページングで処理し、
+-- ページごとに (run_id, shard) 単位のカーソルを保存する。
+-- タイムアウト後の再実行はカーソルから再開し、同じ run_id でダメージを二重適用しない。
+
+-- ============================================================
+-- 1. cron_checkpoints テーブル
+-- ============================================================
+CREATE TABLE IF NOT EXISTS cron_checkpoints (
+  run_id          TEXT NOT NULL,
+  shard_index     INTEGER NOT NULL CHECK (shard_index >= 0),
+  shard_count     INTEGER NOT NULL CHECK (shard_count >= 1),
+  job             TEXT NOT NULL,
+  cursor          UUID,                      -- 最後に処理した pets.id（NULL = 未着手）
+  status          TEXT NOT NULL DEFAULT 'running'
+                    CHECK (status IN ('running', 'completed')),
+  processed_pets  INTEGER NOT NULL DEFAULT 0,
+  total_damage    FLOAT NOT NULL DEFAULT 0,
+  pets_killed     INTEGER NOT NULL DEFAULT 0,
+  tasks_deleted   INTEGER NOT NULL DEFAULT 0,
+  updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (run_id, shard_index, shard_count),
+  CHECK (shard_index < shard_count)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cron_checkpoints_job ON cron_checkpoints(job, updated_at);
+
+-- service_role からのみ操作する（RLS有効・ポリシーなし）
+ALTER TABLE cron_checkpoints ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================
+-- 2. pets: 最後にダメージを適用した run_id
+-- ============================================================
+ALTER TABLE pets
+  ADD COLUMN IF NOT EXISTS last_damage_run_id TEXT DEFAULT NULL;
+
+-- シャード内のキーセットページング (status, id) 用
+CREATE INDEX IF NOT EXISTS idx_pets_status_id ON pets(status, id);
+
+COMMENT ON COLUMN pets.last_damage_run_id IS '最後にCRONダメージを適用したrun_id。同じrunでの二重適用防止に使用';
@@ -0,0 +1,157 @@
+-- Migration 005: 日次ダメージのDB内計算（RPC）
+-- Supabase SQL Editor で実行すること
+--
+-- app/services/damage.py の DAMAGE_RULES / PRIORITY_MULTIPLIER / calculate_overdue_damage と
+-- バルクエンジン（compute_damage_plan）と同じルールをSQLで実装する。
+-- client.rpc("apply_daily_damage", {...}) の1回の呼び出しで全ユーザー分を計算・適用し、
+-- /tasks/cron/damage と同じ形のレポートをJSONBで返す。
+--
+-- ルールを変更する場合は Python 側と必ず同時に変更し、
+-- /tasks/cron/damage?engine=parity で結果が一致することを確認すること。
+
+-- ============================================================
+-- 1. 1タスクあたりのダメージ（calculate_overdue_damage と同じ）
+-- ============================================================
+CREATE OR REPLACE FUNCTION calculate_overdue_damage(p_days_overdue INTEGER, p_priority TEXT)
+RETURNS FLOAT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT (
+    CASE
+      WHEN p_days_overdue >= 7 THEN 20   -- 7日以上経過: 20ダメージ/日 + 自動削除
+      WHEN p_days_overdue >= 3 THEN 10   -- 3日以上経過: 10ダメージ/日
+      WHEN p_days_overdue >= 1 THEN 5    -- 1日以上経過: 5ダメージ/日
+      ELSE 0
+    END
+    *
+    CASE p_priority
+      WHEN 'low'      THEN 1.0
+      WHEN 'medium'   THEN 1.5
+      WHEN 'high'     THEN 2.0
+      WHEN 'critical' THEN 3.0
+      ELSE 1.0
+    END
+  )::FLOAT;
+$$;
+
+-- ============================================================
+-- 2. 全ユーザーの日次ダメージ計算＆適用
+-- ============================================================
+-- p_run_id : 指定すると同じ run_id で処理済みのペットを除外し、更新行に記録する
+-- p_now    : 判定基準時刻（テスト・再計算用）
+-- p_dry_run: TRUE なら書き込みを行わずレポートだけ返す
+--
+-- Python版との対応:
+-- - days_overdue は (now - due_date).days と同じく経過秒数/86400 の切り捨て
+-- - 同一ユーザーに複数の生存ペットがいる場合、id順で最初のペットだけが
+--   7日以上経過したタスクのダメージを受ける（Python版では最初のペットの処理で削除済みになるため）
+CREATE OR REPLACE FUNCTION apply_daily_damage(
+  p_run_id  TEXT DEFAULT NULL,
+  p_now     TIMESTAMPTZ DEFAULT NOW(),
+  p_dry_run BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_report JSONB;
+BEGIN
+  WITH live AS (
+    SELECT
+      p.id, p.user_id, p.name, p.hp, p.status,
+      ROW_NUMBER() OVER (PARTITION BY p.user_id ORDER BY p.id) AS pet_rank
+    FROM pets p
+    WHERE p.status IN ('ALIVE', 'CRITICAL')
+      AND (p_run_id IS NULL OR p.last_damage_run_id IS DISTINCT FROM p_run_id)
+  ),
+  overdue AS (
+    SELECT
+      t.id, t.user_id, t.priority,
+      FLOOR(EXTRACT(EPOCH FROM (p_now - t.due_date)) / 86400)::INTEGER AS days_overdue
+    FROM tasks t
+    WHERE t.completed = FALSE
+      AND t.due_date < p_now
+      AND t.user_id IN (SELECT user_id FROM live)
+  ),
+  scored AS (
+    SELECT
+      l.id AS pet_id,
+      o.id AS task_id,
+      o.days_overdue,
+      calculate_overdue_damage(o.days_overdue, o.priority) AS dmg
+    FROM live l
+    JOIN overdue o
+      ON o.user_id = l.user_id
+     AND (l.pet_rank = 1 OR o.days_overdue < 7)
+  ),
+  per_pet AS (
+    SELECT
+      l.id, l.user_id, l.name, l.hp, l.status,
+      SUM(s.dmg) AS damage,
+      COUNT(*) FILTER (WHERE s.dmg > 0) AS overdue_tasks
+    FROM live l
+    JOIN scored s ON s.pet_id = l.id
+    GROUP BY l.id, l.user_id, l.name, l.hp, l.status
+    HAVING SUM(s.dmg) > 0
+  ),
+  damaged AS (
+    SELECT
+      id, user_id, name, damage, overdue_tasks,
+      GREATEST(0, hp - damage) AS new_hp,
+      -- 死亡判定（DB制約: ALIVE/DEADのみ。CRITICALはフロントで判定）
+      CASE WHEN hp - damage <= 0 THEN 'DEAD' ELSE status END AS new_status
+    FROM per_pet
+  ),
+  purged AS (
+    SELECT DISTINCT task_id FROM scored WHERE days_overdue >= 7
+  ),
+  pet_writes AS (
+    UPDATE pets p
+    SET hp = d.new_hp,
+        status = d.new_status,
+        last_checked_at = p_now,
+        last_damage_run_id = COALESCE(p_run_id, p.last_damage_run_id)
+    FROM damaged d
+    WHERE p.id = d.id
+      AND NOT p_dry_run
+    RETURNING p.id
+  ),
+  task_deletes AS (
+    DELETE FROM tasks t
+    USING purged x
+    WHERE t.id = x.task_id
+      AND NOT p_dry_run
+    RETURNING t.id
+  )
+  SELECT jsonb_build_object(
+    'status', 'completed',
+    'engine', 'rpc',
+    'dry_run', p_dry_run,
+    'processed_pets', (SELECT COUNT(*) FROM damaged),
+    'total_damage_dealt', COALESCE((SELECT SUM(damage) FROM damaged), 0),
+    'pets_killed', (SELECT COUNT(*) FROM damaged WHERE new_status = 'DEAD'),
+    'tasks_deleted', (SELECT COUNT(*) FROM purged),
+    'pets_written', (SELECT COUNT(*) FROM pet_writes),
+    'tasks_written', (SELECT COUNT(*) FROM task_deletes),
+    'details', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'user_id', user_id,
+        'pet_name', name,
+        'damage', damage,
+        'new_hp', new_hp,
+        'status', new_status,
+        'overdue_tasks', overdue_tasks
+      ) ORDER BY id)
+      FROM damaged
+    ), '[]'::JSONB)
+  )
+  INTO v_report;
+
+  RETURN v_report;
+END;
+$$;
+
+-- service_role（バックエンド）からのみ呼び出せるようにする
+REVOKE ALL ON FUNCTION apply_daily_damage(TEXT, TIMESTAMPTZ, BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_daily_damage(TEXT, TIMESTAMPTZ, BOOLEAN) TO service_role;
@@ -0,0 +1,116 @@
+-- Migration 006: 死亡予測時刻（デスクロック）
+-- Supabase SQL Editor で実行すること
+--
+-- calculate_time_decay のHP減衰は保存された状態 (hp, hunger, mood, last_checked_at) と
+-- 経過時間だけで決まるので、HPが0になる時刻を書き込み時に計算して保存しておく。
+-- 「N時間以内に死ぬペット」は predicted_death_at のインデックス範囲スキャン1回で取得できる。
+--
+-- 計算手順は app/services/game_logic.py の hours_until_death と同じ。
+-- pets への INSERT / UPDATE（ルーター・CRON・RPCすべて）でトリガーが再計算する。
+
+-- ============================================================
+-- 1. 減衰式（_decay_values と同じ。max_hp によるクランプは符号に影響しないので省略）
+-- ============================================================
+CREATE OR REPLACE FUNCTION decayed_hp(p_hp FLOAT, p_hunger FLOAT, p_mood FLOAT, p_hours FLOAT)
+RETURNS FLOAT
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT p_hp
+    - (p_hours ^ 2) * 0.5 * (1.0 + LEAST(100.0, p_hunger + 2.0 * p_hours) / 100.0)
+    + (GREATEST(0.0, p_mood - 1.0 * p_hours) / 200.0) * p_hours;
+$$;
+
+-- ============================================================
+-- 2. HPが0になるまでの時間（時間単位）
+-- ============================================================
+-- 減衰ダメージは常に t^2 以下なので死亡は sqrt(hp) 以降。
+-- 飢餓上限・機嫌0の到達後は HP(t) = hp - t^2 となり sqrt(hp) が閉形式の解。
+-- それ以外は [sqrt(hp), 上界] の二分法。
+CREATE OR REPLACE FUNCTION hours_until_death(p_hp FLOAT, p_hunger FLOAT, p_mood FLOAT)
+RETURNS FLOAT
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  lo  FLOAT;
+  hi  FLOAT;
+  mid FLOAT;
+  c   FLOAT;
+BEGIN
+  IF p_hp <= 0 THEN
+    RETURN 0.0;
+  END IF;
+
+  lo := sqrt(p_hp);
+  IF lo >= GREATEST(GREATEST(0.0, (100.0 - p_hunger) / 2.0), GREATEST(0.0, p_mood))
+     AND decayed_hp(p_hp, p_hunger, p_mood, lo) <= 0 THEN
+    RETURN lo;
+  END IF;
+
+  c := GREATEST(p_mood, 0.0) / 200.0;
+  hi := c + sqrt(c * c + 2.0 * p_hp);
+  WHILE decayed_hp(p_hp, p_hunger, p_mood, hi) > 0 LOOP
+    hi := hi * 1.000001;
+  END LOOP;
+
+  FOR i IN 1..64 LOOP
+    EXIT WHEN hi - lo < 1e-7;
+    mid := (lo + hi) / 2.0;
+    IF decayed_hp(p_hp, p_hunger, p_mood, mid) <= 0 THEN
+      hi := mid;
+    ELSE
+      lo := mid;
+    END IF;
+  END LOOP;
+
+  RETURN hi;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION predict_death_at(
+  p_status TEXT, p_hp FLOAT, p_hunger FLOAT, p_mood FLOAT, p_last_checked_at TIMESTAMPTZ
+)
+RETURNS TIMESTAMPTZ
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT CASE
+    WHEN p_status = 'DEAD' OR p_last_checked_at IS NULL THEN NULL
+    -- マイクロ秒単位に切り上げ（game_logic.predict_death_at と同じ。この時刻の減衰で必ず DEAD になる）
+    ELSE p_last_checked_at
+      + CEIL(hours_until_death(p_hp, COALESCE(p_hunger, 0), COALESCE(p_mood, 50)) * 3600000000) * INTERVAL '1 microsecond'
+  END;
+$$;
+
+-- ============================================================
+-- 3. pets.predicted_death_at + トリガー
+-- ============================================================
+ALTER TABLE pets
+  ADD COLUMN IF NOT EXISTS predicted_death_at TIMESTAMPTZ DEFAULT NULL;
+
+CREATE OR REPLACE FUNCTION update_pets_predicted_death_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.predicted_death_at = predict_death_at(
+    NEW.status, NEW.hp, NEW.hunger, NEW.mood, NEW.last_checked_at
+  );
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_update_pets_predicted_death_at ON pets;
+CREATE TRIGGER trigger_update_pets_predicted_death_at
+  BEFORE INSERT OR UPDATE OF hp, hunger, mood, status, last_checked_at ON pets
+  FOR EACH ROW EXECUTE FUNCTION update_pets_predicted_death_at();
+
+-- 既存行のバックフィル
+UPDATE pets
+SET predicted_death_at = predict_death_at(status, hp, hunger, mood, last_checked_at);
+
+-- DEADは NULL になるので、NULL以外だけの部分インデックスで十分
+CREATE INDEX IF NOT EXISTS idx_pets_predicted_death_at
+  ON pets(predicted_death_at)
+  WHERE predicted_death_at IS NOT NULL;
+
+COMMENT ON COLUMN pets.predicted_death_at IS '現在の保存状態のまま放置した場合にHPが0になる時刻（DEADはNULL）。トリガーで自動更新';
@@ -0,0 +1,33 @@
+-- Migration 007: Notion の差分同期（last_edited_time ウォーターマーク）
+-- Supabase SQL Editor で実行すること
+--
+-- Notion のページは tasks に source = 'notion' として upsert する（notion_page_id で重複排除）。
+-- ユーザーごとに、取り込み済みの最新の last_edited_time を notion_sync_state に保存し、
+-- 次回はそれ以降に編集されたページだけを問い合わせる。
+
+-- ============================================================
+-- 1. tasks: 取り込み元の Notion ページID
+-- ============================================================
+ALTER TABLE tasks
+  ADD COLUMN IF NOT EXISTS notion_page_id TEXT DEFAULT NULL;
+
+-- upsert(on_conflict="notion_page_id") に使う一意制約（native タスクは NULL なので重複可）
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_notion_page_id ON tasks(notion_page_id);
+
+COMMENT ON COLUMN tasks.notion_page_id IS '取り込み元の Notion ページID（source = notion のタスクのみ）';
+
+-- ============================================================
+-- 2. notion_sync_state テーブル
+-- ============================================================
+CREATE TABLE IF NOT EXISTS notion_sync_state (
+  user_id                UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+  database_id            TEXT NOT NULL,
+  last_edited_watermark  TIMESTAMPTZ,            -- 取り込み済みの最新 last_edited_time（NULL = 未同期）
+  last_synced_at         TIMESTAMPTZ,
+  pages_synced           INTEGER NOT NULL DEFAULT 0,
+  updated_at             TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (user_id, database_id)
+);
+
+-- service_role からのみ操作する（RLS有効・ポリシーなし）
+ALTER TABLE notion_sync_state ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,13 @@
+-- Migration 008: Notion 一括インポート用の habits 側の重複排除キー
+-- Supabase SQL Editor で実行すること
+--
+-- Notion から取り込んだタスクには、対応する habits 行（source = 'notion', task_id = tasks.id）を1つ作る。
+-- 再インポートで重複しないよう、habits にも取り込み元の Notion ページIDを持たせて upsert する。
+
+ALTER TABLE habits
+  ADD COLUMN IF NOT EXISTS notion_page_id TEXT DEFAULT NULL;
+
+-- upsert(on_conflict="notion_page_id") に使う一意制約（native の習慣は NULL なので重複可）
+CREATE UNIQUE INDEX IF NOT EXISTS idx_habits_notion_page_id ON habits(notion_page_id);
+
+COMMENT ON COLUMN habits.notion_page_id IS '取り込み元の Notion ページID（source = notion の習慣のみ）';
@@ -0,0 +1,90 @@
+-- Migration 009: 期限切れタスクの集計をDB内で行う（GET /tasks/{user_id}/overdue）
+-- Supabase SQL Editor で実行すること
+--
+-- 以前は未完了タスクを select("*") で全件取得し、期限切れの判定・ダメージ計算を Python で行っていた。
+-- overdue_summary() は期限切れの条件・必要な列の絞り込み・ダメージの集計（経過日数帯 x 優先度）を
+-- DB 内で行い、結果だけを JSONB で返す。ダメージのルールは 005 の calculate_overdue_damage() を使う。
+
+-- ============================================================
+-- 1. 未完了タスクの (user_id, due_date) 部分インデックス
+-- ============================================================
+-- 「ユーザーの未完了タスクのうち期限が X より前」をインデックスの範囲走査だけで引けるようにする
+CREATE INDEX IF NOT EXISTS idx_tasks_user_due_open
+  ON tasks(user_id, due_date)
+  WHERE completed = FALSE;
+
+-- ============================================================
+-- 2. ユーザーの期限切れタスクの集計
+-- ============================================================
+-- p_user_id   : 対象ユーザー
+-- p_now       : 判定基準時刻（テスト・再計算用）
+-- p_task_limit: overdue_tasks に含めるタスク数の上限（ダメージの大きい順）。集計値は全件が対象
+--
+-- days_overdue は Python 版と同じく経過秒数/86400 の切り捨て。
+-- ダメージが発生するのは1日以上経過したタスクだけなので、due_date <= p_now - 1日 で絞り込む。
+CREATE OR REPLACE FUNCTION overdue_summary(
+  p_user_id    UUID,
+  p_now        TIMESTAMPTZ DEFAULT NOW(),
+  p_task_limit INTEGER DEFAULT 100
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  WITH overdue AS (
+    SELECT
+      t.id, t.title, t.due_date, t.priority,
+      FLOOR(EXTRACT(EPOCH FROM (p_now - t.due_date)) / 86400)::INTEGER AS days_overdue
+    FROM tasks t
+    WHERE t.user_id = p_user_id
+      AND t.completed = FALSE
+      AND t.due_date <= p_now - INTERVAL '1 day'
+  ),
+  scored AS (
+    SELECT
+      o.*,
+      calculate_overdue_damage(o.days_overdue, o.priority) AS dmg,
+      -- DAMAGE_RULES の閾値（1日 / 3日 / 7日）
+      CASE
+        WHEN o.days_overdue >= 7 THEN 7
+        WHEN o.days_overdue >= 3 THEN 3
+        ELSE 1
+      END AS bucket_days
+    FROM overdue o
+  ),
+  buckets AS (
+    SELECT bucket_days, priority, COUNT(*) AS tasks, SUM(dmg) AS damage
+    FROM scored
+    GROUP BY bucket_days, priority
+  )
+  SELECT jsonb_build_object(
+    'overdue_count', (SELECT COUNT(*) FROM scored),
+    'total_potential_damage', COALESCE((SELECT SUM(dmg) FROM scored), 0),
+    'damage_by_bucket', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'bucket_days', bucket_days,
+        'priority', priority,
+        'tasks', tasks,
+        'damage', damage
+      ) ORDER BY bucket_days, priority)
+      FROM buckets
+    ), '[]'::JSONB),
+    'overdue_tasks', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'id', id,
+        'title', title,
+        'due_date', due_date,
+        'days_overdue', days_overdue,
+        'priority', priority,
+        'potential_damage', dmg
+      ) ORDER BY dmg DESC, due_date)
+      FROM (
+        SELECT * FROM scored ORDER BY dmg DESC, due_date LIMIT p_task_limit
+      ) top_tasks
+    ), '[]'::JSONB)
+  );
+$$;
+
+-- service_role（バックエンド）からのみ呼び出せるようにする
+REVOKE ALL ON FUNCTION overdue_summary(UUID, TIMESTAMPTZ, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION overdue_summary(UUID, TIMESTAMPTZ, INTEGER) TO service_role;
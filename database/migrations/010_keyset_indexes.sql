@@ -0,0 +1,13 @@
+-- Migration 010: 一覧APIのキーセットページング用インデックス
+-- Supabase SQL Editor で実行すること
+--
+-- GET /tasks/{user_id} と GET /daily-habits/{user_id} は
+--   WHERE user_id = $1 AND (created_at, id) < カーソル ORDER BY created_at DESC, id DESC LIMIT n
+-- でページを取得する（app/services/pagination.py）。
+-- (user_id, created_at DESC, id DESC) のインデックスがあれば、何ページ目でも範囲走査 + LIMIT で済む。
+
+CREATE INDEX IF NOT EXISTS idx_tasks_user_created_id
+  ON tasks(user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_daily_habits_user_created_id
+  ON daily_habits(user_id, created_at DESC, id DESC);
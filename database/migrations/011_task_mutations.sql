@@ -0,0 +1,222 @@
+-- Migration 011: タスクの作成・完了を1トランザクション（1回のRPC）で行う
+-- Supabase SQL Editor で実行すること
+--
+-- 以前の POST /tasks/complete は タスク取得 → ペット取得 → ペット更新 + タスク更新 を別々のリクエストで行っており、
+-- 同じタスクを2回続けて完了すると2回回復する・タスクの更新に失敗してもペットは回復する、という問題があった。
+-- POST /tasks/ もタスク挿入 → habit 挿入 → 失敗したらタスクを手で削除、だった。
+--
+-- complete_tasks() / create_tasks() はそれぞれ1ステートメント（1トランザクション）で処理し、
+-- 単体の API（/tasks/complete, /tasks/）とバッチの API（/tasks/batch/*）の両方から使う。
+-- 回復量・飢餓度の減少量は以前の Python 実装（app/routers/tasks.py の complete_task）と同じ。
+
+-- ============================================================
+-- 1. 経過時間による減衰（game_logic._decay_values と同じ式。max_hp でクランプする）
+-- ============================================================
+CREATE OR REPLACE FUNCTION decay_pet_values(
+  p_hp FLOAT, p_hunger FLOAT, p_mood FLOAT, p_max_hp FLOAT, p_hours FLOAT,
+  OUT hp FLOAT, OUT hunger FLOAT, OUT mood FLOAT
+)
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT
+    GREATEST(0.0, LEAST(p_max_hp,
+      p_hp
+      - (p_hours ^ 2) * 0.5 * (1.0 + LEAST(100.0, p_hunger + 2.0 * p_hours) / 100.0)
+      + (GREATEST(0.0, p_mood - 1.0 * p_hours) / 200.0) * p_hours
+    )),
+    LEAST(100.0, p_hunger + 2.0 * p_hours),
+    GREATEST(0.0, p_mood - 1.0 * p_hours);
+$$;
+
+-- ============================================================
+-- 2. タスクの完了（複数可）とペットへの反映
+-- ============================================================
+-- p_task_ids: 完了するタスク（1件なら POST /tasks/complete、複数なら POST /tasks/batch/complete）
+-- p_user_id : 指定するとそのユーザーのタスクだけを対象にする（省略時は先頭のタスクの持ち主）
+-- p_now     : 完了時刻・減衰の基準時刻
+--
+-- タスクとペットを FOR UPDATE でロックしてから判定するので、同じタスクを並行に完了しても
+-- 後から来た方は already_completed になり、2回回復することはない。
+-- ペットへの書き込みは1回: 減衰を適用してから、完了したタスクの回復量・飢餓度の減少量を合計し、
+-- care_score の指数移動平均（alpha=0.1, 目標70）を完了件数分まとめて適用する
+-- （1件ずつ順に適用した結果と同じ。HP は max_hp、飢餓度は0でクランプされるため合計してよい）。
+--
+-- 戻り値:
+--   results: 入力順の [{task_id, status, healed}]
+--            status = completed | not_found | already_completed | duplicate | pet_not_found
+--   tasks  : 完了したタスクの行（task_id -> 行）
+--   pet    : 更新後のペットの行（完了したタスクがなければ NULL）
+--   user_id, healed（回復量の合計）
+CREATE OR REPLACE FUNCTION complete_tasks(
+  p_task_ids UUID[],
+  p_user_id  UUID DEFAULT NULL,
+  p_now      TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_user_id  UUID;
+  v_pet      pets%ROWTYPE;
+  v_has_pet  BOOLEAN;
+  v_items    JSONB;
+  v_results  JSONB;
+  v_count    INTEGER;
+  v_heal     FLOAT;
+  v_hunger_reduction FLOAT;
+  v_hours    FLOAT;
+  v_hp       FLOAT;
+  v_hunger   FLOAT;
+  v_mood     FLOAT;
+  v_status   TEXT;
+  v_pet_json JSONB;
+  v_tasks    JSONB;
+BEGIN
+  -- ロックの順序を揃えてデッドロックを避ける
+  PERFORM 1 FROM tasks WHERE id = ANY(p_task_ids) ORDER BY id FOR UPDATE;
+
+  v_user_id := COALESCE(p_user_id, (SELECT user_id FROM tasks WHERE id = p_task_ids[1]));
+
+  SELECT * INTO v_pet
+  FROM pets
+  WHERE user_id = v_user_id AND status = 'ALIVE'
+  ORDER BY born_at, id
+  LIMIT 1
+  FOR UPDATE;
+  v_has_pet := FOUND;
+
+  SELECT jsonb_agg(item ORDER BY (item->>'ord')::INTEGER)
+  INTO v_items
+  FROM (
+    SELECT jsonb_build_object(
+      'ord', r.ord,
+      'task_id', r.task_id,
+      'status', CASE
+        WHEN t.id IS NULL OR t.user_id IS DISTINCT FROM v_user_id THEN 'not_found'
+        WHEN ROW_NUMBER() OVER (PARTITION BY r.task_id ORDER BY r.ord) > 1 THEN 'duplicate'
+        WHEN t.completed THEN 'already_completed'
+        WHEN NOT v_has_pet THEN 'pet_not_found'
+        ELSE 'completed'
+      END,
+      'healed', CASE t.priority
+        WHEN 'low' THEN 3.0 WHEN 'medium' THEN 5.0 WHEN 'high' THEN 8.0 WHEN 'critical' THEN 12.0
+        ELSE 5.0
+      END,
+      'hunger_reduction', CASE t.priority
+        WHEN 'low' THEN 8.0 WHEN 'medium' THEN 12.0 WHEN 'high' THEN 16.0 WHEN 'critical' THEN 20.0
+        ELSE 10.0
+      END
+    ) AS item
+    FROM unnest(p_task_ids) WITH ORDINALITY AS r(task_id, ord)
+    LEFT JOIN tasks t ON t.id = r.task_id
+  ) classified;
+
+  SELECT COUNT(*), COALESCE(SUM(healed), 0), COALESCE(SUM(hunger_reduction), 0)
+  INTO v_count, v_heal, v_hunger_reduction
+  FROM jsonb_to_recordset(v_items) AS i(task_id UUID, status TEXT, healed FLOAT, hunger_reduction FLOAT)
+  WHERE i.status = 'completed';
+
+  IF v_count > 0 THEN
+    -- 減衰（calculate_time_decay と同じ。DEAD・last_checked_at なし・経過0以下は変化なし）
+    v_hp := COALESCE(v_pet.hp, 100);
+    v_hunger := COALESCE(v_pet.hunger, 0);
+    v_mood := COALESCE(v_pet.mood, 50);
+    v_status := v_pet.status;
+    v_hours := EXTRACT(EPOCH FROM (p_now - v_pet.last_checked_at)) / 3600.0;
+    IF v_hours > 0 THEN
+      SELECT d.hp, d.hunger, d.mood INTO v_hp, v_hunger, v_mood
+      FROM decay_pet_values(v_hp, v_hunger, v_mood, COALESCE(v_pet.max_hp, 100), v_hours) d;
+      IF v_hp <= 0 THEN
+        v_status := 'DEAD';
+      END IF;
+    END IF;
+
+    IF v_status = 'ALIVE' THEN
+      v_hp := LEAST(COALESCE(v_pet.max_hp, 100), v_hp + v_heal);
+    END IF;
+
+    UPDATE pets
+    SET
+      hp = v_hp,
+      status = v_status,
+      hunger = GREATEST(0.0, v_hunger - v_hunger_reduction),
+      care_score = COALESCE(care_score, 50) * (0.9 ^ v_count) + 70.0 * (1.0 - 0.9 ^ v_count),
+      last_checked_at = p_now
+    WHERE id = v_pet.id
+    RETURNING to_jsonb(pets.*) INTO v_pet_json;
+
+    WITH done AS (
+      UPDATE tasks t
+      SET completed = TRUE, completed_at = p_now
+      FROM jsonb_to_recordset(v_items) AS i(task_id UUID, status TEXT)
+      WHERE i.status = 'completed' AND t.id = i.task_id
+      RETURNING t.*
+    )
+    SELECT jsonb_object_agg(done.id::TEXT, to_jsonb(done.*)) INTO v_tasks FROM done;
+  END IF;
+
+  SELECT jsonb_agg(jsonb_build_object(
+    'task_id', i.task_id,
+    'status', i.status,
+    'healed', CASE WHEN i.status = 'completed' THEN i.healed ELSE 0 END
+  ) ORDER BY i.ord)
+  INTO v_results
+  FROM jsonb_to_recordset(v_items) AS i(ord INTEGER, task_id UUID, status TEXT, healed FLOAT);
+
+  RETURN jsonb_build_object(
+    'user_id', v_user_id,
+    'results', COALESCE(v_results, '[]'::JSONB),
+    'tasks', COALESCE(v_tasks, '{}'::JSONB),
+    'pet', v_pet_json,
+    'healed', v_heal
+  );
+END;
+$$;
+
+-- ============================================================
+-- 3. タスクの作成（複数可）と対応する habit の作成
+-- ============================================================
+-- p_tasks: [{title, description, priority, due_date}]（検証は API 側の pydantic で済ませる）
+--
+-- タスクと habit（frequency=ONCE, task_id）を1ステートメントの複数行 INSERT で作るので、
+-- どちらかが失敗すれば両方ともロールバックされる。
+-- 戻り値: 入力順のタスクの行の配列
+CREATE OR REPLACE FUNCTION create_tasks(p_user_id UUID, p_tasks JSONB)
+RETURNS JSONB
+LANGUAGE sql
+AS $$
+  WITH input AS MATERIALIZED (
+    SELECT
+      gen_random_uuid() AS id,
+      x.ord,
+      x.item->>'title' AS title,
+      x.item->>'description' AS description,
+      COALESCE(x.item->>'priority', 'medium') AS priority,
+      (x.item->>'due_date')::TIMESTAMPTZ AS due_date
+    FROM jsonb_array_elements(p_tasks) WITH ORDINALITY AS x(item, ord)
+  ),
+  new_tasks AS (
+    INSERT INTO tasks (id, user_id, title, description, priority, source, completed, due_date)
+    SELECT id, p_user_id, title, description, priority, 'native', FALSE, due_date
+    FROM input
+    ORDER BY ord
+    RETURNING *
+  ),
+  new_habits AS (
+    INSERT INTO habits (user_id, title, frequency, source, task_id)
+    SELECT p_user_id, t.title, 'ONCE', 'native', t.id
+    FROM new_tasks t
+  )
+  SELECT COALESCE(jsonb_agg(to_jsonb(t.*) ORDER BY i.ord), '[]'::JSONB)
+  FROM new_tasks t
+  JOIN input i ON i.id = t.id;
+$$;
+
+-- ============================================================
+-- 4. 権限（service_role キーのバックエンドからのみ呼び出す）
+-- ============================================================
+REVOKE ALL ON FUNCTION complete_tasks(UUID[], UUID, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION complete_tasks(UUID[], UUID, TIMESTAMPTZ) TO service_role;
+REVOKE ALL ON FUNCTION create_tasks(UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION create_tasks(UUID, JSONB) TO service_role;
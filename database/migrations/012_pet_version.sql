@@ -0,0 +1,67 @@
+-- Migration 012: pets の楽観的排他制御（version 列 + compare-and-swap）
+-- Supabase SQL Editor で実行すること
+--
+-- 習慣完了・同期・CRON ダメージは「ペットを読む → Python で計算 → 書く」を行うため、
+-- 並行した回復とダメージがお互いの HP を上書きしていた。
+-- pets.version を UPDATE のたびにトリガーで +1 し、書き込み側は「読んだときの version と一致する場合だけ」
+-- 更新する（一致しなければ読み直して計算し直す。app/services/pet_writes.py を参照）。
+-- ロックは取らないので、書き込み同士が待ち合うことはない。
+
+-- ============================================================
+-- 1. version 列
+-- ============================================================
+ALTER TABLE pets
+  ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN pets.version IS '更新のたびに+1される版番号。読んだ版と一致する場合だけ更新する（楽観的排他制御）';
+
+-- ============================================================
+-- 2. UPDATE のたびに version を進める
+-- ============================================================
+-- DB関数（apply_daily_damage / complete_tasks）や進化の書き込みも含め、すべての更新で版が進むので、
+-- 古い行をもとにした compare-and-swap は必ず失敗する
+CREATE OR REPLACE FUNCTION bump_pet_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.version := OLD.version + 1;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pets_version ON pets;
+CREATE TRIGGER trg_pets_version
+  BEFORE UPDATE ON pets
+  FOR EACH ROW
+  EXECUTE FUNCTION bump_pet_version();
+
+-- ============================================================
+-- 3. 複数ペットの compare-and-swap（CRON のバルク書き込み用）
+-- ============================================================
+-- p_updates: [{id, version, hp, status, last_checked_at, last_damage_run_id}]
+--            last_checked_at / last_damage_run_id は省略（null）なら変更しない
+-- version が一致した行だけを更新し、更新できた行の {id, user_id, hp, status, version} を返す。
+-- 返ってこなかった id は競合（または削除済み）なので、呼び出し側で読み直して再計算する。
+CREATE OR REPLACE FUNCTION update_pets_cas(p_updates JSONB)
+RETURNS JSONB
+LANGUAGE sql
+AS $$
+  WITH updated AS (
+    UPDATE pets p
+    SET
+      hp = u.hp,
+      status = u.status,
+      last_checked_at = COALESCE(u.last_checked_at, p.last_checked_at),
+      last_damage_run_id = COALESCE(u.last_damage_run_id, p.last_damage_run_id)
+    FROM jsonb_to_recordset(p_updates) AS u(
+      id UUID, version BIGINT, hp FLOAT, status TEXT, last_checked_at TIMESTAMPTZ, last_damage_run_id TEXT
+    )
+    WHERE p.id = u.id AND p.version = u.version
+    RETURNING p.id, p.user_id, p.hp, p.status, p.version
+  )
+  SELECT COALESCE(jsonb_agg(to_jsonb(updated.*)), '[]'::JSONB) FROM updated;
+$$;
+
+REVOKE ALL ON FUNCTION update_pets_cas(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION update_pets_cas(JSONB) TO service_role;
@@ -0,0 +1,78 @@
+-- Migration 013: タスクの完了だけを確定する（ペットへの反映は書き込みバッファでまとめる）
+-- Supabase SQL Editor で実行すること
+--
+-- POST /tasks/complete はタスクの完了をこの関数で1トランザクションで確定し、
+-- ペットへの回復・飢餓度・care_score の反映は app.services.write_behind の PetEventBuffer に積む
+-- （同じペットへの連続した完了を1回の UPDATE にまとめる）。
+-- タスクは FOR UPDATE でロックしてから判定するので、並行に完了しても completed になるのは1回だけで、
+-- ペットに積まれるイベントも1件だけになる。
+-- PET_WRITE_COALESCE_SECONDS=0 のときは従来どおり complete_tasks()（011）でペットまで更新する。
+--
+-- 判定は complete_tasks() と同じ（生存中のペットがいなければタスクも完了しない）。
+-- 戻り値: results（入力順の [{task_id, status, priority}]）, tasks（task_id -> 完了したタスクの行）,
+--         pet（生存中のペットの現在の行。いなければ NULL）, user_id
+CREATE OR REPLACE FUNCTION claim_tasks(
+  p_task_ids UUID[],
+  p_user_id  UUID DEFAULT NULL,
+  p_now      TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_user_id UUID;
+  v_pet     JSONB;
+  v_items   JSONB;
+  v_tasks   JSONB;
+BEGIN
+  PERFORM 1 FROM tasks WHERE id = ANY(p_task_ids) ORDER BY id FOR UPDATE;
+
+  v_user_id := COALESCE(p_user_id, (SELECT user_id FROM tasks WHERE id = p_task_ids[1]));
+
+  SELECT to_jsonb(p.*) INTO v_pet
+  FROM pets p
+  WHERE p.user_id = v_user_id AND p.status = 'ALIVE'
+  ORDER BY p.born_at, p.id
+  LIMIT 1;
+
+  SELECT jsonb_agg(item ORDER BY (item->>'ord')::INTEGER)
+  INTO v_items
+  FROM (
+    SELECT jsonb_build_object(
+      'ord', r.ord,
+      'task_id', r.task_id,
+      'priority', t.priority,
+      'status', CASE
+        WHEN t.id IS NULL OR t.user_id IS DISTINCT FROM v_user_id THEN 'not_found'
+        WHEN ROW_NUMBER() OVER (PARTITION BY r.task_id ORDER BY r.ord) > 1 THEN 'duplicate'
+        WHEN t.completed THEN 'already_completed'
+        WHEN v_pet IS NULL THEN 'pet_not_found'
+        ELSE 'completed'
+      END
+    ) AS item
+    FROM unnest(p_task_ids) WITH ORDINALITY AS r(task_id, ord)
+    LEFT JOIN tasks t ON t.id = r.task_id
+  ) classified;
+
+  WITH done AS (
+    UPDATE tasks t
+    SET completed = TRUE, completed_at = p_now
+    FROM jsonb_to_recordset(v_items) AS i(task_id UUID, status TEXT)
+    WHERE i.status = 'completed' AND t.id = i.task_id
+    RETURNING t.*
+  )
+  SELECT jsonb_object_agg(done.id::TEXT, to_jsonb(done.*)) INTO v_tasks FROM done;
+
+  RETURN jsonb_build_object(
+    'user_id', v_user_id,
+    'results', COALESCE((
+      SELECT jsonb_agg(item - 'ord' ORDER BY (item->>'ord')::INTEGER) FROM jsonb_array_elements(v_items) AS item
+    ), '[]'::JSONB),
+    'tasks', COALESCE(v_tasks, '{}'::JSONB),
+    'pet', v_pet
+  );
+END;
+$$;
+
+REVOKE ALL ON FUNCTION claim_tasks(UUID[], UUID, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION claim_tasks(UUID[], UUID, TIMESTAMPTZ) TO service_role;
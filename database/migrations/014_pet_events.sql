@@ -0,0 +1,531 @@
+-- Migration 014: ペットのイベントログ（追記のみ）とスナップショット
+-- Supabase SQL Editor で実行すること
+--
+-- これまでペットの状態はその場で上書きされるだけで、どの回復・懲罰・減衰で今の HP になったのかが残らなかった。
+-- ペットの状態を変える書き込みは、すべて同じトランザクションで pet_events にイベントを追記する:
+--   task_complete / habit_complete / daily_habit_check / overdue_damage / decay_tick / revive
+-- pets の行は、イベントを app/services/game_logic.py の reducer（apply_pet_event）で順に畳み込んだ結果を
+-- 保存したもの（読み取りは従来どおり pets を1行読むだけ）。
+--
+-- スナップショット（pet_snapshots）はペットの作成時と、イベントが50件溜まるごとに保存するので、
+-- 任意の時点の状態は「その時点以前の最新のスナップショット + それ以降のイベント」だけで再構築できる
+-- （app/services/pet_history.py, GET /pets/{pet_id}/history）。
+-- 進化（evolution_stage / evolution_path）は born_at と care_score から再計算する派生値なので対象外。
+--
+-- 既存のペットは、このマイグレーションを実行した時点の状態をスナップショットにする（ログはそこから始まる）。
+
+-- ============================================================
+-- 1. pet_events テーブル（追記のみ）
+-- ============================================================
+CREATE TABLE IF NOT EXISTS pet_events (
+  id           BIGSERIAL PRIMARY KEY,        -- 記録順（畳み込みの順序）
+  pet_id       UUID NOT NULL REFERENCES pets(id) ON DELETE CASCADE,
+  user_id      UUID NOT NULL,
+  type         TEXT NOT NULL
+                 CHECK (type IN ('task_complete', 'habit_complete', 'daily_habit_check',
+                                 'overdue_damage', 'decay_tick', 'revive', 'habit_missed')),
+  occurred_at  TIMESTAMPTZ NOT NULL,         -- イベントの時刻（reducer の基準時刻）
+  data         JSONB NOT NULL DEFAULT '{}'::JSONB,
+  recorded_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()  -- pets に反映された時刻（時点指定の再構築の基準）
+);
+
+CREATE INDEX IF NOT EXISTS idx_pet_events_pet_id ON pet_events(pet_id, id);
+
+COMMENT ON TABLE pet_events IS 'ペットの状態を変えたイベント（追記のみ）。pets の行はこれを畳み込んだ結果';
+
+-- service_role からのみ操作する（RLS有効・ポリシーなし）
+ALTER TABLE pet_events ENABLE ROW LEVEL SECURITY;
+
+-- 記録済みのイベントは書き換えない（削除はペットの削除に伴う CASCADE のみ）
+CREATE OR REPLACE FUNCTION reject_pet_event_update()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  RAISE EXCEPTION 'pet_events is append-only';
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pet_events_append_only ON pet_events;
+CREATE TRIGGER trg_pet_events_append_only
+  BEFORE UPDATE ON pet_events
+  FOR EACH ROW
+  EXECUTE FUNCTION reject_pet_event_update();
+
+-- ============================================================
+-- 2. pet_snapshots テーブル
+-- ============================================================
+CREATE TABLE IF NOT EXISTS pet_snapshots (
+  pet_id         UUID NOT NULL REFERENCES pets(id) ON DELETE CASCADE,
+  last_event_id  BIGINT NOT NULL,            -- この id までのイベントを適用した状態（0 = イベントなし）
+  state          JSONB NOT NULL,             -- pet_state() の列
+  as_of          TIMESTAMPTZ NOT NULL,       -- この状態が pets に保存された時刻
+  PRIMARY KEY (pet_id, last_event_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_pet_snapshots_as_of ON pet_snapshots(pet_id, as_of);
+
+ALTER TABLE pet_snapshots ENABLE ROW LEVEL SECURITY;
+
+-- イベントで変わる列（game_logic.PET_STATE_COLUMNS と同じ）
+-- 003 より前に作られた行は care_score が NULL のことがあるので、reducer と同じ既定値 50 として扱う
+CREATE OR REPLACE FUNCTION pet_state(p pets)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT jsonb_build_object(
+    'hp', p.hp,
+    'max_hp', p.max_hp,
+    'hunger', p.hunger,
+    'mood', p.mood,
+    'care_score', COALESCE(p.care_score, 50),
+    'infection_level', p.infection_level,
+    'status', p.status,
+    'last_checked_at', p.last_checked_at,
+    'last_damage_run_id', p.last_damage_run_id
+  );
+$$;
+
+-- ペットの作成時の状態を最初のスナップショットにする
+CREATE OR REPLACE FUNCTION snapshot_new_pet()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  INSERT INTO pet_snapshots (pet_id, last_event_id, state, as_of)
+  VALUES (NEW.id, 0, pet_state(NEW), NOW());
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pets_snapshot_new ON pets;
+CREATE TRIGGER trg_pets_snapshot_new
+  AFTER INSERT ON pets
+  FOR EACH ROW
+  EXECUTE FUNCTION snapshot_new_pet();
+
+-- 既存のペット
+INSERT INTO pet_snapshots (pet_id, last_event_id, state, as_of)
+SELECT p.id, 0, pet_state(p), NOW()
+FROM pets p
+ON CONFLICT DO NOTHING;
+
+-- ============================================================
+-- 3. スナップショットの保存（コンパクション）
+-- ============================================================
+-- 最新のスナップショット以降のイベントが p_every 件以上あるペットについて、
+-- 現在の pets の行（= 最後のイベントまでを畳み込んだ状態）をスナップショットにする。
+-- イベントを追記する関数の最後に呼ぶ（pets の行はロック済みなので、行とイベントの対応はずれない）。
+CREATE OR REPLACE FUNCTION snapshot_pets(p_pet_ids UUID[], p_every INTEGER DEFAULT 50)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+  WITH latest AS (
+    SELECT p.id, COALESCE(MAX(s.last_event_id), 0) AS last_event_id
+    FROM pets p
+    LEFT JOIN pet_snapshots s ON s.pet_id = p.id
+    WHERE p.id = ANY(p_pet_ids)
+    GROUP BY p.id
+  ),
+  due AS (
+    SELECT l.id, e.last_event_id
+    FROM latest l
+    CROSS JOIN LATERAL (
+      SELECT COUNT(*) AS pending, MAX(x.id) AS last_event_id
+      FROM (
+        SELECT id FROM pet_events
+        WHERE pet_id = l.id AND id > l.last_event_id
+        ORDER BY id
+      ) x
+    ) e
+    WHERE e.pending >= p_every
+  ),
+  saved AS (
+    INSERT INTO pet_snapshots (pet_id, last_event_id, state, as_of)
+    SELECT p.id, d.last_event_id, pet_state(p), NOW()
+    FROM due d
+    JOIN pets p ON p.id = d.id
+    ON CONFLICT DO NOTHING
+    RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM saved;
+$$;
+
+-- ============================================================
+-- 4. 1匹のペットへのイベントの追記（compare-and-swap）
+-- ============================================================
+-- p_state : イベントを適用した結果の列（app.services.pet_writes.update_pet_cas が reducer で計算する）
+-- p_events: [{type, at, ...data}]（記録順）
+-- version が一致した場合だけ pets を更新してイベントを追記し、更新後の行を返す。
+-- 一致しなければ何もせず NULL を返す（呼び出し側で読み直して計算し直す）。
+CREATE OR REPLACE FUNCTION append_pet_events(
+  p_pet_id  UUID,
+  p_version BIGINT,
+  p_state   JSONB,
+  p_events  JSONB
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_pet pets%ROWTYPE;
+  v_new pets%ROWTYPE;
+  v_row JSONB;
+BEGIN
+  SELECT * INTO v_pet FROM pets WHERE id = p_pet_id AND version = p_version FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN NULL;
+  END IF;
+
+  -- p_state にない列は現在の値のまま
+  v_new := jsonb_populate_record(v_pet, p_state);
+  UPDATE pets
+  SET
+    hp = v_new.hp,
+    max_hp = v_new.max_hp,
+    hunger = v_new.hunger,
+    mood = v_new.mood,
+    care_score = COALESCE(v_new.care_score, 50),
+    infection_level = v_new.infection_level,
+    status = v_new.status,
+    last_checked_at = v_new.last_checked_at,
+    last_damage_run_id = v_new.last_damage_run_id,
+    evolution_stage = v_new.evolution_stage,
+    evolution_path = v_new.evolution_path
+  WHERE id = p_pet_id
+  RETURNING to_jsonb(pets.*) INTO v_row;
+
+  INSERT INTO pet_events (pet_id, user_id, type, occurred_at, data)
+  SELECT p_pet_id, v_pet.user_id, e.item->>'type', (e.item->>'at')::TIMESTAMPTZ, e.item - 'type' - 'at'
+  FROM jsonb_array_elements(p_events) WITH ORDINALITY AS e(item, ord)
+  ORDER BY e.ord;
+
+  PERFORM snapshot_pets(ARRAY[p_pet_id]);
+  RETURN v_row;
+END;
+$$;
+
+-- ============================================================
+-- 5. 複数ペットの compare-and-swap（012 の置き換え。各要素の events も追記する）
+-- ============================================================
+-- p_updates: [{id, version, hp, status, last_checked_at, last_damage_run_id, events}]
+-- 戻り値は 012 と同じ（更新できた行の {id, user_id, hp, status, version}）。
+CREATE OR REPLACE FUNCTION update_pets_cas(p_updates JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_written JSONB;
+BEGIN
+  WITH updated AS (
+    UPDATE pets p
+    SET
+      hp = u.hp,
+      status = u.status,
+      care_score = COALESCE(p.care_score, 50),  -- スナップショット（pet_state）と同じ値にそろえる
+      last_checked_at = COALESCE(u.last_checked_at, p.last_checked_at),
+      last_damage_run_id = COALESCE(u.last_damage_run_id, p.last_damage_run_id)
+    FROM jsonb_to_recordset(p_updates) AS u(
+      id UUID, version BIGINT, hp FLOAT, status TEXT, last_checked_at TIMESTAMPTZ, last_damage_run_id TEXT,
+      events JSONB
+    )
+    WHERE p.id = u.id AND p.version = u.version
+    RETURNING p.id, p.user_id, p.hp, p.status, p.version, u.events
+  ),
+  logged AS (
+    INSERT INTO pet_events (pet_id, user_id, type, occurred_at, data)
+    SELECT w.id, w.user_id, e.item->>'type', (e.item->>'at')::TIMESTAMPTZ, e.item - 'type' - 'at'
+    FROM updated w
+    CROSS JOIN LATERAL jsonb_array_elements(COALESCE(w.events, '[]'::JSONB)) WITH ORDINALITY AS e(item, ord)
+    ORDER BY w.id, e.ord
+  )
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+    'id', id, 'user_id', user_id, 'hp', hp, 'status', status, 'version', version
+  )), '[]'::JSONB)
+  INTO v_written
+  FROM updated;
+
+  PERFORM snapshot_pets(ARRAY(SELECT (w->>'id')::UUID FROM jsonb_array_elements(v_written) AS w));
+  RETURN v_written;
+END;
+$$;
+
+-- ============================================================
+-- 6. タスクの完了（011 の置き換え。完了したタスクごとに task_complete を追記する）
+-- ============================================================
+-- ペットへの書き込みは 011 と同じ（回復量などを合計して1回）。
+-- task_complete を1件ずつ reducer で適用した結果と一致する。
+CREATE OR REPLACE FUNCTION complete_tasks(
+  p_task_ids UUID[],
+  p_user_id  UUID DEFAULT NULL,
+  p_now      TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_user_id  UUID;
+  v_pet      pets%ROWTYPE;
+  v_has_pet  BOOLEAN;
+  v_items    JSONB;
+  v_results  JSONB;
+  v_count    INTEGER;
+  v_heal     FLOAT;
+  v_hunger_reduction FLOAT;
+  v_hours    FLOAT;
+  v_hp       FLOAT;
+  v_hunger   FLOAT;
+  v_mood     FLOAT;
+  v_status   TEXT;
+  v_pet_json JSONB;
+  v_tasks    JSONB;
+BEGIN
+  -- ロックの順序を揃えてデッドロックを避ける
+  PERFORM 1 FROM tasks WHERE id = ANY(p_task_ids) ORDER BY id FOR UPDATE;
+
+  v_user_id := COALESCE(p_user_id, (SELECT user_id FROM tasks WHERE id = p_task_ids[1]));
+
+  SELECT * INTO v_pet
+  FROM pets
+  WHERE user_id = v_user_id AND status = 'ALIVE'
+  ORDER BY born_at, id
+  LIMIT 1
+  FOR UPDATE;
+  v_has_pet := FOUND;
+
+  SELECT jsonb_agg(item ORDER BY (item->>'ord')::INTEGER)
+  INTO v_items
+  FROM (
+    SELECT jsonb_build_object(
+      'ord', r.ord,
+      'task_id', r.task_id,
+      'priority', t.priority,
+      'status', CASE
+        WHEN t.id IS NULL OR t.user_id IS DISTINCT FROM v_user_id THEN 'not_found'
+        WHEN ROW_NUMBER() OVER (PARTITION BY r.task_id ORDER BY r.ord) > 1 THEN 'duplicate'
+        WHEN t.completed THEN 'already_completed'
+        WHEN NOT v_has_pet THEN 'pet_not_found'
+        ELSE 'completed'
+      END,
+      'healed', CASE t.priority
+        WHEN 'low' THEN 3.0 WHEN 'medium' THEN 5.0 WHEN 'high' THEN 8.0 WHEN 'critical' THEN 12.0
+        ELSE 5.0
+      END,
+      'hunger_reduction', CASE t.priority
+        WHEN 'low' THEN 8.0 WHEN 'medium' THEN 12.0 WHEN 'high' THEN 16.0 WHEN 'critical' THEN 20.0
+        ELSE 10.0
+      END
+    ) AS item
+    FROM unnest(p_task_ids) WITH ORDINALITY AS r(task_id, ord)
+    LEFT JOIN tasks t ON t.id = r.task_id
+  ) classified;
+
+  SELECT COUNT(*), COALESCE(SUM(healed), 0), COALESCE(SUM(hunger_reduction), 0)
+  INTO v_count, v_heal, v_hunger_reduction
+  FROM jsonb_to_recordset(v_items) AS i(task_id UUID, status TEXT, healed FLOAT, hunger_reduction FLOAT)
+  WHERE i.status = 'completed';
+
+  IF v_count > 0 THEN
+    -- 減衰（calculate_time_decay と同じ。DEAD・last_checked_at なし・経過0以下は変化なし）
+    v_hp := COALESCE(v_pet.hp, 100);
+    v_hunger := COALESCE(v_pet.hunger, 0);
+    v_mood := COALESCE(v_pet.mood, 50);
+    v_status := v_pet.status;
+    v_hours := EXTRACT(EPOCH FROM (p_now - v_pet.last_checked_at)) / 3600.0;
+    IF v_hours > 0 THEN
+      SELECT d.hp, d.hunger, d.mood INTO v_hp, v_hunger, v_mood
+      FROM decay_pet_values(v_hp, v_hunger, v_mood, COALESCE(v_pet.max_hp, 100), v_hours) d;
+      IF v_hp <= 0 THEN
+        v_status := 'DEAD';
+      END IF;
+    END IF;
+
+    IF v_status = 'ALIVE' THEN
+      v_hp := LEAST(COALESCE(v_pet.max_hp, 100), v_hp + v_heal);
+    END IF;
+
+    UPDATE pets
+    SET
+      hp = v_hp,
+      status = v_status,
+      hunger = GREATEST(0.0, v_hunger - v_hunger_reduction),
+      care_score = COALESCE(care_score, 50) * (0.9 ^ v_count) + 70.0 * (1.0 - 0.9 ^ v_count),
+      last_checked_at = p_now
+    WHERE id = v_pet.id
+    RETURNING to_jsonb(pets.*) INTO v_pet_json;
+
+    INSERT INTO pet_events (pet_id, user_id, type, occurred_at, data)
+    SELECT v_pet.id, v_pet.user_id, 'task_complete', p_now,
+           jsonb_strip_nulls(jsonb_build_object('priority', i.priority, 'task_id', i.task_id))
+    FROM jsonb_to_recordset(v_items) AS i(ord INTEGER, task_id UUID, status TEXT, priority TEXT)
+    WHERE i.status = 'completed'
+    ORDER BY i.ord;
+
+    PERFORM snapshot_pets(ARRAY[v_pet.id]);
+
+    WITH done AS (
+      UPDATE tasks t
+      SET completed = TRUE, completed_at = p_now
+      FROM jsonb_to_recordset(v_items) AS i(task_id UUID, status TEXT)
+      WHERE i.status = 'completed' AND t.id = i.task_id
+      RETURNING t.*
+    )
+    SELECT jsonb_object_agg(done.id::TEXT, to_jsonb(done.*)) INTO v_tasks FROM done;
+  END IF;
+
+  SELECT jsonb_agg(jsonb_build_object(
+    'task_id', i.task_id,
+    'status', i.status,
+    'healed', CASE WHEN i.status = 'completed' THEN i.healed ELSE 0 END
+  ) ORDER BY i.ord)
+  INTO v_results
+  FROM jsonb_to_recordset(v_items) AS i(ord INTEGER, task_id UUID, status TEXT, healed FLOAT);
+
+  RETURN jsonb_build_object(
+    'user_id', v_user_id,
+    'results', COALESCE(v_results, '[]'::JSONB),
+    'tasks', COALESCE(v_tasks, '{}'::JSONB),
+    'pet', v_pet_json,
+    'healed', v_heal
+  );
+END;
+$$;
+
+-- ============================================================
+-- 7. 毎日のダメージ（005 の置き換え。ダメージを受けたペットごとに overdue_damage を追記する）
+-- ============================================================
+CREATE OR REPLACE FUNCTION apply_daily_damage(
+  p_run_id  TEXT DEFAULT NULL,
+  p_now     TIMESTAMPTZ DEFAULT NOW(),
+  p_dry_run BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_report  JSONB;
+  v_pet_ids UUID[];
+BEGIN
+  WITH live AS (
+    SELECT
+      p.id, p.user_id, p.name, p.hp, p.status,
+      ROW_NUMBER() OVER (PARTITION BY p.user_id ORDER BY p.id) AS pet_rank
+    FROM pets p
+    WHERE p.status IN ('ALIVE', 'CRITICAL')
+      AND (p_run_id IS NULL OR p.last_damage_run_id IS DISTINCT FROM p_run_id)
+  ),
+  overdue AS (
+    SELECT
+      t.id, t.user_id, t.priority,
+      FLOOR(EXTRACT(EPOCH FROM (p_now - t.due_date)) / 86400)::INTEGER AS days_overdue
+    FROM tasks t
+    WHERE t.completed = FALSE
+      AND t.due_date < p_now
+      AND t.user_id IN (SELECT user_id FROM live)
+  ),
+  scored AS (
+    SELECT
+      l.id AS pet_id,
+      o.id AS task_id,
+      o.days_overdue,
+      calculate_overdue_damage(o.days_overdue, o.priority) AS dmg
+    FROM live l
+    JOIN overdue o
+      ON o.user_id = l.user_id
+     AND (l.pet_rank = 1 OR o.days_overdue < 7)
+  ),
+  per_pet AS (
+    SELECT
+      l.id, l.user_id, l.name, l.hp, l.status,
+      SUM(s.dmg) AS damage,
+      COUNT(*) FILTER (WHERE s.dmg > 0) AS overdue_tasks
+    FROM live l
+    JOIN scored s ON s.pet_id = l.id
+    GROUP BY l.id, l.user_id, l.name, l.hp, l.status
+    HAVING SUM(s.dmg) > 0
+  ),
+  damaged AS (
+    SELECT
+      id, user_id, name, damage, overdue_tasks,
+      GREATEST(0, hp - damage) AS new_hp,
+      -- 死亡判定（DB制約: ALIVE/DEADのみ。CRITICALはフロントで判定）
+      CASE WHEN hp - damage <= 0 THEN 'DEAD' ELSE status END AS new_status
+    FROM per_pet
+  ),
+  purged AS (
+    SELECT DISTINCT task_id FROM scored WHERE days_overdue >= 7
+  ),
+  pet_writes AS (
+    UPDATE pets p
+    SET hp = d.new_hp,
+        status = d.new_status,
+        care_score = COALESCE(p.care_score, 50),  -- スナップショット（pet_state）と同じ値にそろえる
+        last_checked_at = p_now,
+        last_damage_run_id = COALESCE(p_run_id, p.last_damage_run_id)
+    FROM damaged d
+    WHERE p.id = d.id
+      AND NOT p_dry_run
+    RETURNING p.id
+  ),
+  event_writes AS (
+    INSERT INTO pet_events (pet_id, user_id, type, occurred_at, data)
+    SELECT d.id, d.user_id, 'overdue_damage', p_now, jsonb_strip_nulls(jsonb_build_object(
+      'damage', d.damage,
+      'overdue_tasks', d.overdue_tasks,
+      'resets_decay', TRUE,
+      'run_id', p_run_id
+    ))
+    FROM damaged d
+    WHERE NOT p_dry_run
+  ),
+  task_deletes AS (
+    DELETE FROM tasks t
+    USING purged x
+    WHERE t.id = x.task_id
+      AND NOT p_dry_run
+    RETURNING t.id
+  )
+  SELECT jsonb_build_object(
+    'status', 'completed',
+    'engine', 'rpc',
+    'dry_run', p_dry_run,
+    'processed_pets', (SELECT COUNT(*) FROM damaged),
+    'total_damage_dealt', COALESCE((SELECT SUM(damage) FROM damaged), 0),
+    'pets_killed', (SELECT COUNT(*) FROM damaged WHERE new_status = 'DEAD'),
+    'tasks_deleted', (SELECT COUNT(*) FROM purged),
+    'pets_written', (SELECT COUNT(*) FROM pet_writes),
+    'tasks_written', (SELECT COUNT(*) FROM task_deletes),
+    'details', COALESCE((
+      SELECT jsonb_agg(jsonb_build_object(
+        'user_id', user_id,
+        'pet_name', name,
+        'damage', damage,
+        'new_hp', new_hp,
+        'status', new_status,
+        'overdue_tasks', overdue_tasks
+      ) ORDER BY id)
+      FROM damaged
+    ), '[]'::JSONB)
+  ),
+  ARRAY(SELECT id FROM pet_writes)
+  INTO v_report, v_pet_ids;
+
+  PERFORM snapshot_pets(v_pet_ids);
+  RETURN v_report;
+END;
+$$;
+
+-- ============================================================
+-- 8. 権限（service_role キーのバックエンドからのみ呼び出す）
+-- ============================================================
+REVOKE ALL ON FUNCTION snapshot_pets(UUID[], INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION snapshot_pets(UUID[], INTEGER) TO service_role;
+REVOKE ALL ON FUNCTION append_pet_events(UUID, BIGINT, JSONB, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION append_pet_events(UUID, BIGINT, JSONB, JSONB) TO service_role;
+REVOKE ALL ON FUNCTION update_pets_cas(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION update_pets_cas(JSONB) TO service_role;
+REVOKE ALL ON FUNCTION complete_tasks(UUID[], UUID, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION complete_tasks(UUID[], UUID, TIMESTAMPTZ) TO service_role;
+REVOKE ALL ON FUNCTION apply_daily_damage(TEXT, TIMESTAMPTZ, BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_daily_damage(TEXT, TIMESTAMPTZ, BOOLEAN) TO service_role;
@@ -0,0 +1,35 @@
+-- Migration 015: 日次習慣の完了履歴（日ごとのビットマップ）
+-- Supabase SQL Editor で実行すること
+--
+-- daily_habits は streak と last_completed_at しか持っておらず、チェックを取り消すと前回の完了日が失われ、
+-- ストリークも「昨日完了したか」でしか判定できなかった。
+-- completion_bits にローカル日（JST）ごとの完了を1ビットずつ持つ（app/services/habit_bitmap.py）:
+--   ビット i = completion_day - i 日目に完了（リトルエンディアン。368日 = 46 バイトまで）
+-- ストリーク・取り消し・7/30/365日の達成率・カレンダーはこの1行から計算する。
+
+-- ============================================================
+-- 1. 列の追加
+-- ============================================================
+ALTER TABLE daily_habits
+  ADD COLUMN IF NOT EXISTS completion_bits BYTEA NOT NULL DEFAULT '\x'::BYTEA,
+  ADD COLUMN IF NOT EXISTS completion_day INTEGER;
+
+COMMENT ON COLUMN daily_habits.completion_bits IS 'ビット i = completion_day - i 日目に完了（リトルエンディアン、最大46バイト）';
+COMMENT ON COLUMN daily_habits.completion_day IS 'completion_bits のビット0の日（JSTの1970-01-01からの日数）。未完了ならNULL';
+
+-- ============================================================
+-- 2. 既存の行: last_completed_at の日から streak 日分を完了として埋める
+-- ============================================================
+UPDATE daily_habits
+SET
+  completion_day = FLOOR((EXTRACT(EPOCH FROM last_completed_at) + 9 * 3600) / 86400)::INTEGER,
+  completion_bits = decode(
+    repeat('ff', LEAST(GREATEST(streak, 1), 368) / 8)
+    || CASE WHEN LEAST(GREATEST(streak, 1), 368) % 8 > 0
+         THEN lpad(to_hex((1 << (LEAST(GREATEST(streak, 1), 368) % 8)) - 1), 2, '0')
+         ELSE ''
+       END,
+    'hex'
+  )
+WHERE last_completed_at IS NOT NULL
+  AND completion_day IS NULL;
@@ -0,0 +1,185 @@
+-- Migration 016: 日次習慣の未達成の一括処理（UTCオフセットごとに、ローカル時刻の0時過ぎに実行）
+-- Supabase SQL Editor で実行すること
+--
+-- 日次習慣はチェックしなかった日があってもストリークが残り、腐敗度（infection_level）と
+-- care_score の habit_missed も適用されていなかった。また日の区切りは JST（+9）固定だった。
+-- ユーザーごとの UTC オフセットを profiles.utc_offset_minutes に持ち、
+-- POST /cron/habit-sweep（app/services/habit_sweep.py）が1時間ごとに
+-- 「ローカル日付が変わったオフセット」について前日分をこの関数で処理する:
+--   - 前日に完了していない日次習慣のストリークを0に戻す（今日すでにチェック済みなら今日からの連続日数）
+--   - 持ち主の生存中のペットに、未達成1件ごとに腐敗度 +10、care_score に habit_missed を適用
+--   - ペットごとに habit_missed イベントを1件追記する
+-- 習慣は id 順のキーセットページングで p_limit 件ずつ、ページごとに1ステートメントで書き込む。
+-- 処理済みの習慣には last_swept_day を記録するので、途中で落ちて同じページを処理し直しても二重に適用しない。
+
+-- ============================================================
+-- 1. ユーザーの UTC オフセット
+-- ============================================================
+ALTER TABLE profiles
+  ADD COLUMN IF NOT EXISTS utc_offset_minutes INTEGER NOT NULL DEFAULT 540
+    CHECK (utc_offset_minutes BETWEEN -720 AND 840);
+
+COMMENT ON COLUMN profiles.utc_offset_minutes IS '日の区切りに使うUTCオフセット（分）。デフォルトはJST（+540）';
+
+CREATE INDEX IF NOT EXISTS idx_profiles_utc_offset ON profiles(utc_offset_minutes);
+
+-- ============================================================
+-- 2. 日次習慣: 最後に未達成として処理した日
+-- ============================================================
+ALTER TABLE daily_habits
+  ADD COLUMN IF NOT EXISTS last_swept_day INTEGER;
+
+COMMENT ON COLUMN daily_habits.last_swept_day IS '最後に未達成として処理したローカル日番号。同じ日の二重適用防止に使用';
+
+-- ============================================================
+-- 3. イベントの種類に habit_missed を追加
+-- ============================================================
+-- 014 の定義には含まれているが、habit_missed を含まない版の 014 を適用済みのDB向けに付け直す
+ALTER TABLE pet_events DROP CONSTRAINT IF EXISTS pet_events_type_check;
+ALTER TABLE pet_events ADD CONSTRAINT pet_events_type_check
+  CHECK (type IN ('task_complete', 'habit_complete', 'daily_habit_check',
+                  'overdue_damage', 'decay_tick', 'revive', 'habit_missed'));
+
+-- ============================================================
+-- 4. CRON のチェックポイント: 処理した習慣の数
+-- ============================================================
+ALTER TABLE cron_checkpoints
+  ADD COLUMN IF NOT EXISTS processed_habits INTEGER NOT NULL DEFAULT 0;
+
+-- ============================================================
+-- 5. ビットマップの判定（app/services/habit_bitmap.py の is_completed と同じ）
+-- ============================================================
+-- get_bit の番号は各バイトの最下位ビットから数えるので、リトルエンディアンのビット i と一致する
+CREATE OR REPLACE FUNCTION habit_completed_on(p_bits BYTEA, p_anchor INTEGER, p_day INTEGER)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT p_anchor IS NOT NULL
+     AND p_anchor >= p_day
+     AND p_anchor - p_day < octet_length(p_bits) * 8
+     AND get_bit(p_bits, p_anchor - p_day) = 1;
+$$;
+
+-- ============================================================
+-- 6. 処理対象のオフセット
+-- ============================================================
+-- プロフィールのないユーザーの習慣はデフォルト（JST）で処理するので、540 は常に含める
+CREATE OR REPLACE FUNCTION utc_offset_buckets()
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT jsonb_agg(o ORDER BY o)
+  FROM (
+    SELECT utc_offset_minutes AS o FROM profiles
+    UNION
+    SELECT 540
+  ) x;
+$$;
+
+-- ============================================================
+-- 7. 未達成の一括処理（1ページ分）
+-- ============================================================
+-- p_offset_minutes のユーザーの日次習慣のうち、id が p_after より後ろの p_limit 件を見て、
+-- ローカル日 p_day に完了していないもの（p_day の0時より前に作られたもの）を処理する。
+-- 戻り値: scanned（見た習慣の数。p_limit 未満なら最後のページ）, cursor（最後に見た習慣の id）,
+--         missed_habits, pets_updated, user_ids（ペットを更新したユーザー）
+CREATE OR REPLACE FUNCTION sweep_missed_habits(
+  p_offset_minutes INTEGER,
+  p_day            INTEGER,
+  p_after          UUID DEFAULT NULL,
+  p_limit          INTEGER DEFAULT 1000,
+  p_now            TIMESTAMPTZ DEFAULT NOW()
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_day_start TIMESTAMPTZ := to_timestamp(p_day::BIGINT * 86400 - p_offset_minutes * 60);
+  v_report    JSONB;
+  v_pet_ids   UUID[];
+BEGIN
+  WITH page AS (
+    SELECT h.id, h.user_id, h.created_at, h.completion_bits, h.completion_day, h.last_swept_day
+    FROM daily_habits h
+    LEFT JOIN profiles pr ON pr.id = h.user_id
+    WHERE COALESCE(pr.utc_offset_minutes, 540) = p_offset_minutes
+      AND (p_after IS NULL OR h.id > p_after)
+    ORDER BY h.id
+    LIMIT p_limit
+  ),
+  missed AS (
+    SELECT
+      pg.id, pg.user_id,
+      -- p_day のビットは0なので、ビット0から連続して立っている数 = p_day より後の連続日数
+      COALESCE((
+        SELECT MIN(i)
+        FROM generate_series(0, pg.completion_day - p_day) AS i
+        WHERE CASE WHEN i < octet_length(pg.completion_bits) * 8
+                   THEN get_bit(pg.completion_bits, i) ELSE 0 END = 0
+      ), 0) AS new_streak
+    FROM page pg
+    WHERE pg.created_at < v_day_start
+      AND (pg.last_swept_day IS NULL OR pg.last_swept_day < p_day)
+      AND NOT habit_completed_on(pg.completion_bits, pg.completion_day, p_day)
+  ),
+  habit_writes AS (
+    UPDATE daily_habits h
+    SET streak = m.new_streak,
+        last_swept_day = p_day
+    FROM missed m
+    WHERE h.id = m.id
+    RETURNING h.id
+  ),
+  per_user AS (
+    SELECT user_id, COUNT(*)::INTEGER AS missed, jsonb_agg(id ORDER BY id) AS habit_ids
+    FROM missed
+    GROUP BY user_id
+  ),
+  targets AS (
+    SELECT DISTINCT ON (p.user_id) p.id, p.user_id, u.missed, u.habit_ids
+    FROM per_user u
+    JOIN pets p ON p.user_id = u.user_id AND p.status = 'ALIVE'
+    ORDER BY p.user_id, p.born_at, p.id
+  ),
+  pet_writes AS (
+    -- game_logic._reduce_habit_missed と同じ式（DAILY_HABIT_MISSED_CORRUPTION = 10, habit_missed = 30, α = 0.1）
+    UPDATE pets p
+    SET infection_level = LEAST(100, p.infection_level + t.missed * 10),
+        care_score = 30 + (COALESCE(p.care_score, 50) - 30) * power(0.9::FLOAT, t.missed)
+    FROM targets t
+    WHERE p.id = t.id
+    RETURNING p.id, p.user_id
+  ),
+  event_writes AS (
+    INSERT INTO pet_events (pet_id, user_id, type, occurred_at, data)
+    SELECT t.id, t.user_id, 'habit_missed', p_now, jsonb_build_object(
+      'missed', t.missed,
+      'day', p_day,
+      'habit_ids', t.habit_ids
+    )
+    FROM targets t
+  )
+  SELECT jsonb_build_object(
+    'scanned', (SELECT COUNT(*) FROM page),
+    'cursor', (SELECT id FROM page ORDER BY id DESC LIMIT 1),
+    'missed_habits', (SELECT COUNT(*) FROM habit_writes),
+    'pets_updated', (SELECT COUNT(*) FROM pet_writes),
+    'user_ids', COALESCE((SELECT jsonb_agg(user_id) FROM pet_writes), '[]'::JSONB)
+  ),
+  ARRAY(SELECT id FROM pet_writes)
+  INTO v_report, v_pet_ids;
+
+  PERFORM snapshot_pets(v_pet_ids);
+  RETURN v_report;
+END;
+$$;
+
+-- ============================================================
+-- 8. 権限（service_role キーのバックエンドからのみ呼び出す）
+-- ============================================================
+REVOKE ALL ON FUNCTION utc_offset_buckets() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION utc_offset_buckets() TO service_role;
+REVOKE ALL ON FUNCTION sweep_missed_habits(INTEGER, INTEGER, UUID, INTEGER, TIMESTAMPTZ) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION sweep_missed_habits(INTEGER, INTEGER, UUID, INTEGER, TIMESTAMPTZ) TO service_role;
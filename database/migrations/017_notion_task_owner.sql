@@ -0,0 +1,67 @@
+-- Migration 017: Notion から取り込んだタスクをユーザーごとに重複排除し、アプリでの完了を保つ
+-- Supabase SQL Editor で実行すること
+--
+-- 007 / 008 の一意制約は notion_page_id だけだったため、同じ Notion データベースを2人が同期すると
+-- 後から同期したユーザーの upsert が既存の行の user_id を書き換えていた（タスクが別のユーザーに移る）。
+-- また upsert は completed / completed_at も Notion の値で上書きするため、アプリで完了したタスクが
+-- Notion 側で Done でないまま再同期されると未完了に戻っていた。
+--
+-- 一意制約を (user_id, notion_page_id) にし、tasks と habits の upsert を upsert_notion_tasks() の
+-- 1回の RPC で行う。一度完了したタスクは同期で未完了に戻さない（completed_at も最初に完了した時刻のまま）。
+
+-- ============================================================
+-- 1. 一意制約をユーザーごとにする（native の行は NULL なので重複可）
+-- ============================================================
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_user_notion_page_id ON tasks(user_id, notion_page_id);
+DROP INDEX IF EXISTS idx_tasks_notion_page_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_habits_user_notion_page_id ON habits(user_id, notion_page_id);
+DROP INDEX IF EXISTS idx_habits_notion_page_id;
+
+-- webhook で notion_page_id だけから持ち主・削除対象を探すための索引
+CREATE INDEX IF NOT EXISTS idx_tasks_notion_page_id ON tasks(notion_page_id);
+
+-- ============================================================
+-- 2. tasks と、それに対応する habits の upsert
+-- ============================================================
+-- p_rows: notion_sync.page_to_task() の行の配列
+--         （user_id, notion_page_id, title, due_date, priority, source, completed, completed_at）
+-- 戻り値: 書き込んだタスクの [{id, user_id, notion_page_id}]
+CREATE OR REPLACE FUNCTION upsert_notion_tasks(p_rows JSONB)
+RETURNS JSONB
+LANGUAGE sql
+AS $$
+  WITH upserted AS (
+    INSERT INTO tasks AS t (user_id, notion_page_id, title, due_date, priority, source, completed, completed_at)
+    SELECT r.user_id, r.notion_page_id, r.title, r.due_date, r.priority, r.source, r.completed, r.completed_at
+    FROM jsonb_to_recordset(p_rows) AS r(
+      user_id UUID, notion_page_id TEXT, title TEXT, due_date TIMESTAMPTZ, priority TEXT,
+      source TEXT, completed BOOLEAN, completed_at TIMESTAMPTZ
+    )
+    ON CONFLICT (user_id, notion_page_id) DO UPDATE SET
+      title        = EXCLUDED.title,
+      due_date     = EXCLUDED.due_date,
+      priority     = EXCLUDED.priority,
+      source       = EXCLUDED.source,
+      completed    = t.completed OR EXCLUDED.completed,
+      completed_at = CASE WHEN t.completed THEN t.completed_at ELSE EXCLUDED.completed_at END
+    RETURNING t.id, t.user_id, t.notion_page_id, t.title
+  ),
+  habits_upserted AS (
+    INSERT INTO habits (user_id, notion_page_id, task_id, title, source)
+    SELECT u.user_id, u.notion_page_id, u.id, u.title, 'notion'
+    FROM upserted u
+    ON CONFLICT (user_id, notion_page_id) DO UPDATE SET
+      task_id = EXCLUDED.task_id,
+      title   = EXCLUDED.title,
+      source  = EXCLUDED.source
+  )
+  SELECT COALESCE(
+    jsonb_agg(jsonb_build_object('id', u.id, 'user_id', u.user_id, 'notion_page_id', u.notion_page_id)),
+    '[]'::JSONB
+  )
+  FROM upserted u;
+$$;
+
+REVOKE ALL ON FUNCTION upsert_notion_tasks(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION upsert_notion_tasks(JSONB) TO service_role;
@@ -23,28 +23,45 @@ export async function GET(request: Request) {
   const backendUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
   const apiKey = process.env.CRON_SECRET || 'hostage_cron_secret_2026';
 
-  try {
-    console.log('[CRON] Triggering daily damage calculation...');
+  // シャード数（バックエンドは shard=0..N-1 を並列に処理できる）
+  const shards = Math.max(1, Number(process.env.CRON_DAMAGE_SHARDS || '1'));
+  // 時間予算切れ（status: "partial"）の場合に同じシャードを呼び直す上限
+  const maxAttempts = 5;
 
-    // バックエンドのダメージAPIを呼び出し
-    const response = await fetch(`${backendUrl}/tasks/cron/damage`, {
-      method: 'GET',
-      headers: {
-        'X-API-KEY': apiKey,
-        'Content-Type': 'application/json',
-      },
-    });
-
-    if (!response.ok) {
-      const errorText = await response.text();
-      console.error('[CRON] Backend error:', response.status, errorText);
-      return NextResponse.json(
-        { error: 'Backend request failed', status: response.status, detail: errorText },
-        { status: 500 }
+  const runShard = async (shard: number) => {
+    let data: { status?: string } = {};
+    for (let attempt = 0; attempt < maxAttempts; attempt++) {
+      const response = await fetch(
+        `${backendUrl}/tasks/cron/damage?shard=${shard}&shards=${shards}`,
+        {
+          method: 'GET',
+          headers: {
+            'X-API-KEY': apiKey,
+            'Content-Type': 'application/json',
+          },
+        }
       );
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`shard ${shard}: ${response.status} ${errorText}`);
+      }
+
+      data = await response.json();
+      // チェックポイントから再開されるので、completed になるまで呼び直す
+      if (data.status !== 'partial') break;
     }
+    return data;
+  };
+
+  try {
+    console.log(`[CRON] Triggering daily damage calculation (${shards} shard(s))...`);
 
-    const data = await response.json();
+    // バックエンドのダメージAPIをシャードごとに並列で呼び出し
+    const results = await Promise.all(
+      Array.from({ length: shards }, (_, shard) => runShard(shard))
+    );
+    const data = shards === 1 ? results[0] : results;
     console.log('[CRON] Daily damage applied:', data);
 
     return NextResponse.json({
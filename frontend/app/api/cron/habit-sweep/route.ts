@@ -0,0 +1,65 @@
+import { NextResponse } from 'next/server';
+
+/**
+ * Vercel Cron用プロキシエンドポイント（日次習慣の未達成の一括処理）
+ * 
+ * ユーザーのUTCオフセットごとに、ローカル時刻で日付が変わった後の最初の実行で前日分が処理される。
+ * 
+ * Schedule: 毎時 5分
+ */
+export async function GET(request: Request) {
+  // Vercel Cronからの呼び出しか確認（オプション）
+  const authHeader = request.headers.get('Authorization');
+  const cronSecret = process.env.CRON_SECRET;
+
+  if (cronSecret && authHeader !== `Bearer ${cronSecret}`) {
+    console.warn('[CRON] Authorization header mismatch or missing');
+  }
+
+  const backendUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+  const apiKey = process.env.CRON_SECRET || 'hostage_cron_secret_2026';
+
+  // 時間予算切れ（status: "partial"）の場合に呼び直す上限
+  const maxAttempts = 5;
+
+  try {
+    console.log('[CRON] Triggering missed habit sweep...');
+
+    let data: { status?: string } = {};
+    for (let attempt = 0; attempt < maxAttempts; attempt++) {
+      const response = await fetch(`${backendUrl}/cron/habit-sweep`, {
+        method: 'POST',
+        headers: {
+          'X-API-KEY': apiKey,
+          'Content-Type': 'application/json',
+        },
+      });
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`${response.status} ${errorText}`);
+      }
+
+      data = await response.json();
+      // チェックポイントから再開されるので、completed になるまで呼び直す
+      if (data.status !== 'partial') break;
+    }
+    console.log('[CRON] Missed habit sweep applied:', data);
+
+    return NextResponse.json({
+      success: true,
+      message: 'Missed habit sweep completed',
+      timestamp: new Date().toISOString(),
+      result: data,
+    });
+  } catch (error) {
+    console.error('[CRON] Failed to trigger habit sweep:', error);
+    return NextResponse.json(
+      {
+        error: 'Failed to trigger missed habit sweep',
+        detail: error instanceof Error ? error.message : 'Unknown error'
+      },
+      { status: 500 }
+    );
+  }
+}
@@ -125,7 +125,7 @@ export default function TaskManager({ userId, onTaskComplete }: TaskManagerProps
 
     // バックグラウンドでAPI呼び出し
     try {
-      await completeTask(taskId);
+      await completeTask(taskId, userId);
       // 成功: ペットの状態を静かに更新
       onTaskComplete();
     } catch (e) {
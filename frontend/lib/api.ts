@@ -86,7 +86,10 @@ export type CreateTaskRequest = {
 
 export type TaskListResponse = {
   tasks: Task[];
-  total: number;
+  // count=none を指定した場合は null
+  total: number | null;
+  // 次のページのカーソル（最後のページなら null）
+  next_cursor: string | null;
 };
 
 export type TaskCompleteResponse = {
@@ -127,6 +130,45 @@ export async function fetchPetStatus(userId: string): Promise<Pet | null> {
   }
 }
 
+export type PetForecast = {
+  pet: Pet;
+  generated_at: string;
+  step_minutes: number;
+  // 列指向: offset_hours[i] 時間後の値が hp[i] など
+  curve: {
+    offset_hours: number[];
+    hp: number[];
+    hunger: number[];
+    mood: number[];
+    status: string[];
+  };
+  predicted_death_at: string | null;
+  next_evolution_stage: number | null;
+  next_evolution_at: string | null;
+};
+
+// 放置した場合のHP推移をまとめて取得する。
+// 描画はこの曲線から行い、タスク完了などのアクション後にだけ再取得する（ポーリング不要）
+export async function fetchPetForecast(
+  userId: string,
+  hours: number = 48,
+  stepMinutes: number = 60
+): Promise<PetForecast | null> {
+  const res = await fetch(
+    `${API_BASE}/pets/${userId}/forecast?hours=${hours}&step_minutes=${stepMinutes}`,
+    { cache: "no-store" }
+  );
+
+  if (res.status === 404) return null;
+
+  if (!res.ok) {
+    const errorData = await res.json().catch(() => ({}));
+    throw new APIError(res.status, errorData.detail || `Failed to fetch pet forecast (${res.status})`);
+  }
+
+  return res.json();
+}
+
 export async function completeHabit(habitId: string) {
   const res = await fetch(`${API_BASE}/habits/complete`, {
     method: "POST",
@@ -197,12 +239,19 @@ export async function createTask(taskData: CreateTaskRequest): Promise<Task> {
  */
 export async function fetchTasks(
   userId: string,
-  completed?: boolean
+  completed?: boolean,
+  cursor?: string
 ): Promise<TaskListResponse> {
-  let url = `${API_BASE}/tasks/${userId}`;
+  const params = new URLSearchParams();
   if (completed !== undefined) {
-    url += `?completed=${completed}`;
+    params.set("completed", String(completed));
+  }
+  // 前のページの next_cursor を渡すと続きを取得する
+  if (cursor) {
+    params.set("cursor", cursor);
   }
+  const query = params.toString();
+  const url = `${API_BASE}/tasks/${userId}${query ? `?${query}` : ""}`;
   const res = await fetch(url, { cache: "no-store" });
   if (!res.ok) {
     const errorData = await res.json().catch(() => ({}));
@@ -214,11 +263,12 @@ export async function fetchTasks(
 /**
  * タスクを完了する（ペットのHPも回復）
  */
-export async function completeTask(taskId: string): Promise<TaskCompleteResponse> {
+export async function completeTask(taskId: string, userId?: string): Promise<TaskCompleteResponse> {
   const res = await fetch(`${API_BASE}/tasks/complete`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ task_id: taskId }),
+    // user_id を渡すとサーバー側でタスクとペットを並行に取得する
+    body: JSON.stringify({ task_id: taskId, user_id: userId }),
   });
   if (!res.ok) {
     const errorData = await res.json().catch(() => ({}));
@@ -259,7 +309,8 @@ export type CreateDailyHabitRequest = {
 
 export type DailyHabitListResponse = {
   habits: DailyHabit[];
-  total: number;
+  total: number | null;
+  next_cursor: string | null;
 };
 
 export type DailyHabitCheckResponse = {
@@ -4,6 +4,7 @@ import { HttpApi, HttpMethod, CorsHttpMethod } from 'aws-cdk-lib/aws-apigatewayv
 import { HttpLambdaIntegration } from 'aws-cdk-lib/aws-apigatewayv2-integrations';
 import * as ecr_assets from 'aws-cdk-lib/aws-ecr-assets';
 import * as ssm from 'aws-cdk-lib/aws-ssm';
+import * as iam from 'aws-cdk-lib/aws-iam';
 import { Construct } from 'constructs';
 import { HostageSecretsStack } from './secrets-stack';
 
@@ -54,6 +55,13 @@ export class HostageLambdaStack extends cdk.Stack {
     secretsStack.notionToken.grantRead(fn);
     secretsStack.cronSecret.grantRead(fn);
 
+    // 起動時に3つのシークレットを1回の BatchGetSecretValue で取得する（app/core/secrets.py）
+    // このアクションはリソースを指定できないため '*' に付与する（値の読み取りは上の grantRead が必要）
+    fn.addToRolePolicy(new iam.PolicyStatement({
+      actions: ['secretsmanager:BatchGetSecretValue'],
+      resources: ['*'],
+    }));
+
     // API Gateway HTTP API
     // アカウント同時実行上限(10)自体がbilling DoS対策として機能する。
     // reservedConcurrentExecutions が設定できないアカウント制約の代替として許容する。
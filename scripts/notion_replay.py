@@ -0,0 +1,223 @@
+"""
+ローカル検証用の Notion スタンドイン（API スタブ + webhook リプレイ）
+
+POST /webhooks/notion からの反映（署名検証 → ページごとのまとめ → 取得 → upsert）を
+Notion なしで負荷試験するためのスクリプト。
+1. GET /v1/pages/{id} と POST /v1/databases/{id}/query に答える Notion API のスタブを起動する
+2. 記録した webhook（NOTION_WEBHOOK_RECORD_PATH の JSONL）または生成したイベントを、
+   NOTION_WEBHOOK_SECRET で署名してアプリに送る
+3. 送信のレイテンシと、スタブへのページ取得回数（まとめられたかどうか）を表示する
+
+使い方:
+    python scripts/notion_replay.py --port 4567 --secret whsec --generate 2000 --pages 50 \\
+        --database-id 0123456789abcdef0123456789abcdef --target http://127.0.0.1:8000/webhooks/notion
+
+    NOTION_API_BASE_URL=http://127.0.0.1:4567/v1 NOTION_WEBHOOK_SECRET=whsec uvicorn app.main:app
+
+記録したイベントを再生する場合は --generate の代わりに --events webhooks.jsonl を指定する。
+スタブのページは、イベントを送る直前にそのページの last_edited_time を進めて（page.deleted ならアーカイブして）作る。
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+UPDATE_EVENT = "page.properties_updated"
+DELETE_EVENT = "page.deleted"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class PageStore:
+    """スタブが返すページ（イベントに合わせて更新する）"""
+
+    def __init__(self):
+        self.pages = {}
+        self.fetches = Counter()
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def touch(self, page_id: str, database_id: str, deleted: bool) -> None:
+        with self._lock:
+            page = self.pages.get(page_id)
+            if page is None:
+                page = {
+                    "object": "page",
+                    "id": page_id,
+                    "parent": {"type": "database_id", "database_id": database_id},
+                    "archived": False,
+                    "properties": {
+                        "Name": {"type": "title", "title": [{"plain_text": f"Replayed {page_id[:8]}"}]},
+                        "Status": {"type": "status", "status": {"name": "Not started"}},
+                        "Priority": {"type": "select", "select": {"name": random.choice(["Low", "Medium", "High"])}},
+                        "Due Date": {"type": "date", "date": {"start": _now_iso()}},
+                    },
+                }
+                self.pages[page_id] = page
+            page["last_edited_time"] = _now_iso()
+            page["archived"] = deleted
+            if not deleted and random.random() < 0.2:
+                page["properties"]["Status"]["status"]["name"] = "Done"
+
+    def get(self, page_id: str):
+        with self._lock:
+            self.fetches[page_id] += 1
+            return self.pages.get(page_id)
+
+    def query(self, database_id: str, body: dict) -> dict:
+        with self._lock:
+            self.queries += 1
+            rows = sorted(
+                (p for p in self.pages.values()
+                 if not p["archived"] and p["parent"]["database_id"].replace("-", "") == database_id.replace("-", "")),
+                key=lambda p: (p["last_edited_time"], p["id"]),
+            )
+        start = int(body.get("start_cursor") or 0)
+        end = min(len(rows), start + int(body.get("page_size", 100)))
+        has_more = end < len(rows)
+        return {"object": "list", "results": rows[start:end], "has_more": has_more,
+                "next_cursor": str(end) if has_more else None}
+
+
+def _make_handler(store: PageStore):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if len(parts) == 3 and parts[:2] == ["v1", "pages"]:
+                page = store.get(parts[2])
+                if page is None:
+                    return self._reply(404, {"object": "error", "status": 404, "code": "object_not_found"})
+                return self._reply(200, page)
+            return self._reply(404, {"object": "error", "status": 404, "code": "invalid_request_url"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if len(parts) == 4 and parts[:2] == ["v1", "databases"] and parts[3] == "query":
+                return self._reply(200, store.query(parts[2], body))
+            return self._reply(404, {"object": "error", "status": 404, "code": "invalid_request_url"})
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _generate_events(count: int, pages: int, database_id: str, delete_ratio: float):
+    page_ids = [str(uuid.uuid4()) for _ in range(pages)]
+    for _ in range(count):
+        yield {
+            "id": str(uuid.uuid4()),
+            "type": DELETE_EVENT if random.random() < delete_ratio else UPDATE_EVENT,
+            "entity": {"id": random.choice(page_ids), "type": "page"},
+            "data": {"parent": {"id": database_id, "type": "database"}},
+        }
+
+
+def _load_events(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4567, help="Notion API スタブのポート")
+    parser.add_argument("--target", default="http://127.0.0.1:8000/webhooks/notion", help="webhook の送信先")
+    parser.add_argument("--secret", required=True, help="署名に使う NOTION_WEBHOOK_SECRET")
+    parser.add_argument("--events", help="記録した webhook の JSONL")
+    parser.add_argument("--generate", type=int, default=0, help="生成するイベント数（--events の代わり）")
+    parser.add_argument("--pages", type=int, default=50, help="生成するイベントが対象とするページ数")
+    parser.add_argument("--database-id", default="0123456789abcdef0123456789abcdef")
+    parser.add_argument("--delete-ratio", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="1秒あたりの送信数の上限（0 は無制限）")
+    parser.add_argument("--linger", type=float, default=5.0, help="送信後にスタブを動かし続ける秒数（反映待ち）")
+    args = parser.parse_args()
+
+    if args.events:
+        events = _load_events(args.events)
+    elif args.generate:
+        events = list(_generate_events(args.generate, args.pages, args.database_id, args.delete_ratio))
+    else:
+        parser.error("--events か --generate のどちらかを指定する")
+
+    store = PageStore()
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(store))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Notion API stub on http://{args.host}:{args.port}/v1, replaying {len(events)} events to {args.target}")
+
+    http = httpx.Client(timeout=30.0, limits=httpx.Limits(max_connections=args.concurrency))
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+
+    def send(event: dict) -> None:
+        parent = (event.get("data") or {}).get("parent") or {}
+        entity = event.get("entity") or {}
+        if entity.get("type") == "page":
+            store.touch(entity["id"], parent.get("id", args.database_id), event.get("type") == DELETE_EVENT)
+        event = dict(event, timestamp=_now_iso())
+        body = json.dumps(event).encode()
+        signature = "sha256=" + hmac.new(args.secret.encode(), body, hashlib.sha256).hexdigest()
+        start = time.perf_counter()
+        try:
+            response = http.post(args.target, content=body, headers={
+                "Content-Type": "application/json", "X-Notion-Signature": signature,
+            })
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, event in enumerate(events):
+            if interval:
+                time.sleep(max(0.0, started + i * interval - time.perf_counter()))
+            pool.submit(send, event)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"sent {len(events)} events in {elapsed:.2f}s ({len(events) / elapsed:.0f}/s), statuses {dict(statuses)}")
+    if latencies:
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print(f"latency p50 {quantiles[49] * 1000:.1f}ms  p95 {quantiles[94] * 1000:.1f}ms  "
+              f"p99 {quantiles[98] * 1000:.1f}ms  max {latencies[-1] * 1000:.1f}ms")
+
+    time.sleep(args.linger)
+    distinct = len({(e.get("entity") or {}).get("id") for e in events})
+    print(f"page fetches: {sum(store.fetches.values())} for {len(events)} events on {distinct} pages"
+          f" (max {max(store.fetches.values(), default=0)} per page), database queries: {store.queries}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+ローカル検証用の Secrets Manager スタブ（GetSecretValue / BatchGetSecretValue のみ）
+
+app.core.secrets の一括取得・キャッシュ・フォールバックをAWSなしで確認するためのサーバー。
+SECRETS_MANAGER_ENDPOINT_URL をこのサーバーに向け、*_ARN にシークレット名を設定して起動する。
+
+使い方:
+    python scripts/secrets_manager_stub.py --port 4566 \\
+        --secret hostage/supabase-key=eyJ... --secret hostage/cron=secret
+
+    SECRETS_MANAGER_ENDPOINT_URL=http://127.0.0.1:4566 \\
+    AWS_ACCESS_KEY_ID=dummy AWS_SECRET_ACCESS_KEY=dummy \\
+    SUPABASE_SERVICE_ROLE_KEY_ARN=hostage/supabase-key CRON_SECRET_ARN=hostage/cron \\
+    uvicorn app.main:app
+
+--deny-batch を付けると BatchGetSecretValue を AccessDenied にする（GetSecretValue へのフォールバック確認用）。
+受け付けたリクエストは1行ずつ標準出力に出す。
+"""
+
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARN_PREFIX = "arn:aws:secretsmanager:ap-northeast-1:000000000000:secret:"
+
+
+def _make_handler(secrets, deny_batch: bool):
+    def lookup(secret_id: str):
+        name = secret_id[len(ARN_PREFIX):] if secret_id.startswith(ARN_PREFIX) else secret_id
+        if name not in secrets:
+            return None
+        return {"ARN": ARN_PREFIX + name, "Name": name, "SecretString": secrets[name], "VersionId": "v1"}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-amz-json-1.1")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _error(self, error_type: str, message: str) -> None:
+            self._reply(400, {"__type": error_type, "Message": message})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            action = self.headers.get("X-Amz-Target", "").split(".")[-1]
+            print(f"{action} {json.dumps(body)}", flush=True)
+
+            if action == "GetSecretValue":
+                secret = lookup(body.get("SecretId", ""))
+                if secret is None:
+                    return self._error("ResourceNotFoundException", "Secrets Manager can't find the specified secret.")
+                return self._reply(200, secret)
+
+            if action == "BatchGetSecretValue":
+                if deny_batch:
+                    return self._error("AccessDeniedException", "not authorized to perform: secretsmanager:BatchGetSecretValue")
+                values, errors = [], []
+                for secret_id in body.get("SecretIdList", []):
+                    secret = lookup(secret_id)
+                    if secret is None:
+                        errors.append({"SecretId": secret_id, "ErrorCode": "ResourceNotFoundException",
+                                       "Message": "Secrets Manager can't find the specified secret."})
+                    else:
+                        values.append(secret)
+                return self._reply(200, {"SecretValues": values, "Errors": errors})
+
+            return self._error("UnknownOperationException", action)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4566)
+    parser.add_argument("--secret", action="append", default=[], metavar="NAME=VALUE")
+    parser.add_argument("--deny-batch", action="store_true")
+    args = parser.parse_args()
+
+    secrets = dict(item.split("=", 1) for item in args.secret)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(secrets, args.deny_batch))
+    print(f"Secrets Manager stub on http://{args.host}:{args.port} ({len(secrets)} secrets)", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+テスト共通の設定
+
+app.core.config は必須の値（SUPABASE_URL など）が空だと起動を拒否するので、
+app を import する前にダミーの値を入れておく（テストは Supabase に接続しない）。
+"""
+
+import os
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test-service-role-key")
+os.environ.setdefault("CRON_SECRET", "test-cron-secret")
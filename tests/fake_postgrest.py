@@ -0,0 +1,201 @@
+"""
+テスト用のメモリ上の PostgREST クライアント
+
+get_async_client() が返す AsyncPostgrestClient のうち、サービス層が使う部分だけを真似る:
+table(name) のクエリビルダー（select / eq / neq / gt / gte / lt / lte / in_ / or_ / order / limit / range、
+insert / upsert / update / delete）と rpc(name, params)。どちらも .execute() を await すると
+.data（と select(count=...) のときは .count）を持つ結果を返す。
+
+rpc は rpcs に登録した関数（params を受け取り data を返す。async でもよい）を呼ぶ。
+呼び出しは calls に (name, params) で記録する。
+"""
+
+import inspect
+import re
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _coerce(value: Any, raw: str) -> Any:
+    """フィルタ文字列の値を列の値と比較できる型にそろえる"""
+    if isinstance(value, bool):
+        return raw == "true"
+    if isinstance(value, (int, float)):
+        return type(value)(raw)
+    return raw
+
+
+def _or_condition(expr: str) -> Callable[[Dict[str, Any]], bool]:
+    """or_("a.is.null,a.neq.x,b.in.(x,y),c.lt.\"v\"") 形式（is / eq / neq / lt / in だけ。値の "..." は外す）"""
+    terms = []
+    for term in re.findall(r"[^,(]+(?:\([^)]*\))?", expr):
+        column, op, raw = term.split(".", 2)
+        if raw.startswith('"') and raw.endswith('"'):
+            raw = raw[1:-1]
+        terms.append((column, op, raw))
+
+    def check(row: Dict[str, Any]) -> bool:
+        for column, op, raw in terms:
+            value = row.get(column)
+            if op == "is" and raw == "null" and value is None:
+                return True
+            if op == "eq" and value is not None and value == _coerce(value, raw):
+                return True
+            if op == "neq" and value is not None and value != _coerce(value, raw):
+                return True
+            if op == "lt" and value is not None and value < _coerce(value, raw):
+                return True
+            if op == "in" and value in raw.strip("()").split(","):
+                return True
+        return False
+
+    return check
+
+
+class FakeQuery:
+    def __init__(self, client: "FakePostgrest", table: str):
+        self.client = client
+        self.table = table
+        self.action = "select"
+        self.payload: Any = None
+        self.on_conflict: Optional[str] = None
+        self.count: Optional[str] = None
+        self.head = False
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.order_by: List[tuple] = []
+        self.offset = 0
+        self.limit_rows: Optional[int] = None
+
+    # --- 操作 ---
+    def select(self, columns: str = "*", count: Optional[str] = None, head: bool = False) -> "FakeQuery":
+        self.count, self.head = count, head
+        return self
+
+    def insert(self, rows: Any) -> "FakeQuery":
+        self.action, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = "id") -> "FakeQuery":
+        self.action, self.payload, self.on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, data: Dict[str, Any]) -> "FakeQuery":
+        self.action, self.payload = "update", data
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self.action = "delete"
+        return self
+
+    # --- フィルタ ---
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        self.filters.append(lambda row: row.get(column) is not None and row[column] <= value)
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "FakeQuery":
+        allowed = set(values)
+        self.filters.append(lambda row: row.get(column) in allowed)
+        return self
+
+    def or_(self, expr: str) -> "FakeQuery":
+        self.filters.append(_or_condition(expr))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self.order_by.append((column, desc))
+        return self
+
+    def limit(self, n: int) -> "FakeQuery":
+        self.limit_rows = n
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self.offset, self.limit_rows = start, end - start + 1
+        return self
+
+    # --- 実行 ---
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(check(row) for check in self.filters)
+
+    async def execute(self) -> SimpleNamespace:
+        rows = self.client.tables.setdefault(self.table, [])
+        if self.action == "insert":
+            new = [dict(r) for r in (self.payload if isinstance(self.payload, list) else [self.payload])]
+            rows.extend(new)
+            return SimpleNamespace(data=[dict(r) for r in new], count=None)
+        if self.action == "upsert":
+            keys = self.on_conflict.split(",")
+            out = []
+            for item in self.payload if isinstance(self.payload, list) else [self.payload]:
+                existing = next((r for r in rows if all(r.get(k) == item.get(k) for k in keys)), None)
+                if existing is None:
+                    existing = dict(item)
+                    rows.append(existing)
+                else:
+                    existing.update(item)
+                out.append(dict(existing))
+            return SimpleNamespace(data=out, count=None)
+        if self.action == "update":
+            out = []
+            for row in rows:
+                if self._matches(row):
+                    row.update(self.payload)
+                    out.append(dict(row))
+            return SimpleNamespace(data=out, count=None)
+        if self.action == "delete":
+            out = [dict(r) for r in rows if self._matches(r)]
+            rows[:] = [r for r in rows if not self._matches(r)]
+            return SimpleNamespace(data=out, count=None)
+
+        matched = [dict(r) for r in rows if self._matches(r)]
+        for column, desc in reversed(self.order_by):
+            matched.sort(key=lambda r: r.get(column), reverse=desc)
+        total = len(matched)
+        end = None if self.limit_rows is None else self.offset + self.limit_rows
+        data = [] if self.head else matched[self.offset:end]
+        return SimpleNamespace(data=data, count=total if self.count else None)
+
+
+class FakeRpc:
+    def __init__(self, client: "FakePostgrest", name: str, params: Dict[str, Any]):
+        self.client, self.name, self.params = client, name, params
+
+    async def execute(self) -> SimpleNamespace:
+        self.client.calls.append((self.name, self.params))
+        data = self.client.rpcs[self.name](self.params)
+        if inspect.isawaitable(data):
+            data = await data
+        return SimpleNamespace(data=data, count=None)
+
+
+class FakePostgrest:
+    def __init__(self, tables: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.tables: Dict[str, List[Dict[str, Any]]] = tables or {}
+        self.rpcs: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        self.calls: List[tuple] = []
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> FakeRpc:
+        return FakeRpc(self, name, params)
@@ -0,0 +1,126 @@
+"""
+シャード実行（app.services.checkpoints.run_sharded）と日次ダメージの書き込み
+
+compare-and-swap のリトライを使い切ったペットがあった場合に、カーソルがそのペットの手前で止まり、
+そのペットのタスクも消されずに残って、次の呼び出しで同じダメージを受けられることを確かめる。
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fake_postgrest import FakePostgrest
+
+from app.services.checkpoints import CHECKPOINT_TABLE
+from app.services.damage import DAILY_DAMAGE_JOB, run_daily_damage
+
+NOW = datetime(2026, 1, 10, 0, 0, tzinfo=timezone.utc)
+RUN_ID = f"{DAILY_DAMAGE_JOB}-20260110"
+
+
+def _uuid(n: int) -> str:
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+PET_A, PET_B, PET_C = _uuid(1), _uuid(2), _uuid(3)
+
+
+def cas_rpc(client: FakePostgrest, losing: set = frozenset()):
+    """DB関数 update_pets_cas() の代わり（losing に含まれるペットは毎回競合する）"""
+    def update_pets_cas(params):
+        written = []
+        for update in params["p_updates"]:
+            row = next(p for p in client.tables["pets"] if p["id"] == update["id"])
+            if update["id"] in losing or row["version"] != update["version"]:
+                continue
+            row.update(
+                hp=update["hp"], status=update["status"], version=row["version"] + 1,
+                last_damage_run_id=update.get("last_damage_run_id", row["last_damage_run_id"]),
+            )
+            written.append({k: row[k] for k in ("id", "user_id", "hp", "status", "version")})
+        return written
+
+    return update_pets_cas
+
+
+def make_client(losing: set) -> FakePostgrest:
+    """ユーザーごとに1匹のペットと8日前のタスク（losing に含まれるペットは毎回競合する）"""
+    client = FakePostgrest({
+        "pets": [
+            {"id": pet_id, "user_id": f"user-{pet_id[-1]}", "name": pet_id, "hp": 100.0,
+             "status": "ALIVE", "version": 0, "last_damage_run_id": None}
+            for pet_id in (PET_A, PET_B, PET_C)
+        ],
+        "tasks": [
+            # ユーザーごとに8日前の high（40 ダメージ + 削除）
+            {"id": f"task-{pet_id[-1]}", "user_id": f"user-{pet_id[-1]}", "priority": "high",
+             "due_date": (NOW - timedelta(days=8)).isoformat(), "completed": False}
+            for pet_id in (PET_A, PET_B, PET_C)
+        ],
+    })
+    client.rpcs["update_pets_cas"] = cas_rpc(client, losing)
+    return client
+
+
+def run(client):
+    return asyncio.run(run_daily_damage(client, NOW, run_id=RUN_ID, time_budget_seconds=5.0))
+
+
+def test_exhausted_pet_holds_cursor_and_keeps_its_tasks(monkeypatch):
+    monkeypatch.setattr("app.services.pet_writes.CAS_BACKOFF_BASE_SECONDS", 0.0)
+    losing = {PET_B}
+    client = make_client(losing)
+
+    report = run(client)
+
+    assert report["status"] == "partial"
+    assert report["exhausted_pets"] == [PET_B]
+    assert report["processed_pets"] == 2
+    assert report["tasks_deleted"] == 2
+    # カーソルは書き込めなかったペットの手前（PET_A）で止まる
+    checkpoint = client.tables[CHECKPOINT_TABLE][0]
+    assert checkpoint["cursor"] == PET_A
+    assert checkpoint["status"] == "running"
+    assert {t["id"] for t in client.tables["tasks"]} == {"task-2"}
+    pets = {p["id"]: p for p in client.tables["pets"]}
+    assert pets[PET_B]["hp"] == 100.0 and pets[PET_B]["last_damage_run_id"] is None
+
+    # 競合がおさまった後の呼び出しで PET_B だけが処理される（A と C は二重にダメージを受けない）
+    losing.clear()
+    report = run(client)
+
+    assert report["status"] == "completed"
+    assert report["exhausted_pets"] == []
+    assert report["processed_pets"] == 1
+    assert client.tables["tasks"] == []
+    assert {p["id"]: p["hp"] for p in client.tables["pets"]} == {PET_A: 60.0, PET_B: 60.0, PET_C: 60.0}
+    assert client.tables[CHECKPOINT_TABLE][0]["status"] == "completed"
+
+
+
+def test_first_pet_rule_holds_across_shards():
+    # 同じユーザーの2匹が別々のシャードに入る（shards=2 の境界は 80000000-...）
+    first, second = _uuid(1), "c0000000-0000-0000-0000-000000000001"
+    client = FakePostgrest({
+        "pets": [
+            {"id": pet_id, "user_id": "user-1", "name": pet_id, "hp": 100.0,
+             "status": "ALIVE", "version": 0, "last_damage_run_id": None}
+            for pet_id in (first, second)
+        ],
+        "tasks": [
+            {"id": "task-old", "user_id": "user-1", "priority": "high",
+             "due_date": (NOW - timedelta(days=8)).isoformat(), "completed": False},
+            {"id": "task-new", "user_id": "user-1", "priority": "low",
+             "due_date": (NOW - timedelta(days=1, hours=1)).isoformat(), "completed": False},
+        ],
+    })
+    client.rpcs["update_pets_cas"] = cas_rpc(client)
+
+    # 2匹目のシャードが先に走っても、7日以上のタスクは最初のペットだけに効く
+    for shard in (1, 0):
+        report = asyncio.run(run_daily_damage(
+            client, NOW, run_id=RUN_ID, shard_index=shard, shard_count=2, time_budget_seconds=5.0,
+        ))
+        assert report["status"] == "completed"
+
+    assert {p["id"]: p["hp"] for p in client.tables["pets"]} == {first: 55.0, second: 95.0}
+    assert [t["id"] for t in client.tables["tasks"]] == ["task-new"]
@@ -0,0 +1,33 @@
+"""
+Lambda のコールドスタート予算（import app.main）
+
+新しいプロセスで app.main を import し、CI の "Cold start budget" ステップと同じ予算
+（時間・モジュール数・import 時に読み込んではいけないパッケージ）に収まることを確かめる。
+計測は scripts/import_profile.py に任せる（CI と同じ判定になるように）。
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# .github/workflows/ci.yml の "Cold start budget" と同じ値
+MAX_SECONDS = 2.5
+MAX_MODULES = 600
+FORBIDDEN = ["boto3", "supabase"]
+
+
+def test_import_app_main_within_cold_start_budget():
+    cmd = [
+        sys.executable, str(ROOT / "scripts" / "import_profile.py"),
+        "--max-seconds", str(MAX_SECONDS),
+        "--max-modules", str(MAX_MODULES),
+    ]
+    for package in FORBIDDEN:
+        cmd += ["--forbid", package]
+
+    proc = subprocess.run(cmd, cwd=ROOT, env=dict(os.environ), capture_output=True, text=True, timeout=120)
+
+    assert proc.returncode == 0, proc.stdout + proc.stderr
@@ -0,0 +1,209 @@
+"""
+日次ダメージの Python バルクエンジンと DB関数 apply_daily_damage() の一致確認
+
+同じ小さなデータセット（ペットとタスク）に対して、
+- app.services.damage.compute_damage_plan（engine="python"）
+- database/migrations/005 と 014 の apply_daily_damage()（engine="rpc"）
+が同じ HP・status・削除タスクになることを確かめる。
+
+SQL 側は TEST_DATABASE_URL（使い捨ての PostgreSQL。Supabase の本番・開発DBは指定しないこと）と
+psycopg2 がある場合だけ実行する。REQUIRE_TEST_DATABASE=1 のとき（CI）は、どちらかがなければスキップせず失敗させる。
+マイグレーションはテストごとの schema に流し、終わったら消す。
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from glob import glob
+from pathlib import Path
+
+import pytest
+
+from app.services.damage import compare_damage_reports, compute_damage_plan
+
+NOW = datetime(2026, 1, 10, 0, 0, tzinfo=timezone.utc)
+RUN_ID = "parity-test"
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "database" / "migrations"
+
+
+def _uuid(n: int) -> str:
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+U1, U2, U3, U4, U5 = (_uuid(100 + i) for i in range(1, 6))
+
+# (id, user_id, name, hp, status, care_score)
+PETS = [
+    (_uuid(1), U1, "first", 40.0, "ALIVE", 50.0),
+    (_uuid(2), U1, "second", 100.0, "ALIVE", None),   # 同じユーザーの2匹目（7日以上のタスクは効かない）
+    (_uuid(3), U2, "null-care", 30.0, "ALIVE", None),  # 014 より前の行（care_score が NULL）
+    (_uuid(4), U3, "dead", 0.0, "DEAD", 50.0),
+    (_uuid(5), U4, "purged", 100.0, "ALIVE", 50.0),
+    (_uuid(6), U5, "safe", 70.0, "ALIVE", 50.0),
+]
+
+# (id, user_id, priority, due_date, completed)
+TASKS = [
+    (_uuid(11), U1, "high", NOW - timedelta(days=8), False),        # 1匹目だけ 40 ダメージ + 削除
+    (_uuid(12), U1, "medium", NOW - timedelta(days=3, hours=12), False),  # 2匹とも 15 ダメージ
+    (_uuid(13), U2, "low", NOW - timedelta(days=1, hours=5), False),     # 5 ダメージ
+    (_uuid(14), U2, "critical", NOW - timedelta(hours=2), False),        # 1日未満: ダメージなし
+    (_uuid(15), U2, "medium", NOW + timedelta(days=1), False),           # 期限前
+    (_uuid(16), U2, "high", NOW - timedelta(days=5), True),              # 完了済み
+    (_uuid(17), U3, "high", NOW - timedelta(days=9), False),             # 死亡済みペット: 削除もしない
+    (_uuid(18), U4, "low", NOW - timedelta(days=10), False),             # 20 ダメージ + 削除
+    (_uuid(19), U5, "medium", NOW + timedelta(days=2), False),
+    (_uuid(20), U5, "critical", NOW - timedelta(days=4), True),
+]
+
+# pet_id -> (hp, status)
+EXPECTED_PETS = {
+    _uuid(1): (0.0, "DEAD"),
+    _uuid(2): (85.0, "ALIVE"),
+    _uuid(3): (25.0, "ALIVE"),
+    _uuid(4): (0.0, "DEAD"),
+    _uuid(5): (80.0, "ALIVE"),
+    _uuid(6): (70.0, "ALIVE"),
+}
+EXPECTED_DELETED = {_uuid(11), _uuid(18)}
+
+
+def run_python_engine():
+    """fetch_live_pets / fetch_overdue_tasks と同じ絞り込みをしてから compute_damage_plan を適用する"""
+    live = sorted(
+        (
+            {"id": pet_id, "user_id": user_id, "name": name, "hp": hp, "status": status, "version": 0}
+            for pet_id, user_id, name, hp, status, _ in PETS
+            if status in ("ALIVE", "CRITICAL")
+        ),
+        key=lambda p: p["id"],
+    )
+    tasks_by_user = {}
+    for task_id, user_id, priority, due_date, completed in TASKS:
+        if not completed and due_date < NOW:
+            tasks_by_user.setdefault(user_id, []).append(
+                {"id": task_id, "user_id": user_id, "priority": priority, "due_date": due_date.isoformat()}
+            )
+
+    plan = compute_damage_plan(live, tasks_by_user, NOW, run_id=RUN_ID)
+    pets = {pet_id: (hp, status) for pet_id, _, _, hp, status, _ in PETS}
+    for update in plan["pet_updates"]:
+        pets[update["id"]] = (float(update["hp"]), update["status"])
+    return plan["report"], pets, set(plan["delete_ids"])
+
+
+def test_python_engine_matches_expected():
+    report, pets, deleted = run_python_engine()
+
+    assert pets == EXPECTED_PETS
+    assert deleted == EXPECTED_DELETED
+    assert report["processed_pets"] == 4
+    assert report["pets_killed"] == 1
+    assert report["tasks_deleted"] == 2
+
+
+# ---------------------------------------------------------------------------
+# SQL（apply_daily_damage）
+# ---------------------------------------------------------------------------
+
+# Supabase の auth スキーマ・ロールの最小限の代わり（既にあれば触らない）
+AUTH_BOOTSTRAP = """
+CREATE SCHEMA IF NOT EXISTS auth;
+CREATE TABLE IF NOT EXISTS auth.users (id UUID PRIMARY KEY);
+DO $$ BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace
+    WHERE n.nspname = 'auth' AND p.proname = 'uid'
+  ) THEN
+    CREATE FUNCTION auth.uid() RETURNS UUID LANGUAGE sql AS 'SELECT NULL::UUID';
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN CREATE ROLE anon; END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN CREATE ROLE authenticated; END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'service_role') THEN CREATE ROLE service_role; END IF;
+END $$;
+"""
+
+USER_IDS = sorted({user_id for _, user_id, *_ in PETS})
+
+
+def migration_files(upto: str):
+    """000 から upto までのマイグレーション（001 / 002 は 000 に統合済みなので流さない）"""
+    files = sorted(glob(str(MIGRATIONS_DIR / "*.sql")))
+    return [
+        f for f in files
+        if Path(f).name[:3] <= upto and Path(f).name[:3] not in ("001", "002")
+    ]
+
+
+@pytest.fixture(params=["005", "014"])
+def damage_db(request):
+    """upto までのマイグレーションを流した schema にデータセットを入れた接続"""
+    unavailable = pytest.fail if os.getenv("REQUIRE_TEST_DATABASE") else pytest.skip
+    try:
+        import psycopg2
+    except ImportError:
+        unavailable("psycopg2 is not installed")
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        unavailable("TEST_DATABASE_URL is not set")
+
+    schema = f"damage_parity_{request.param}"
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(AUTH_BOOTSTRAP)
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}; SET search_path TO {schema}")
+    for path in migration_files(request.param):
+        cur.execute(Path(path).read_text(encoding="utf-8"))
+
+    for user_id in USER_IDS:
+        cur.execute("INSERT INTO auth.users (id) VALUES (%s) ON CONFLICT DO NOTHING", (user_id,))
+    for pet_id, user_id, name, hp, status, care_score in PETS:
+        cur.execute(
+            "INSERT INTO pets (id, user_id, name, hp, status, care_score) VALUES (%s, %s, %s, %s, %s, %s)",
+            (pet_id, user_id, name, hp, status, care_score),
+        )
+    for task_id, user_id, priority, due_date, completed in TASKS:
+        cur.execute(
+            "INSERT INTO tasks (id, user_id, title, priority, due_date, completed) VALUES (%s, %s, %s, %s, %s, %s)",
+            (task_id, user_id, task_id, priority, due_date, completed),
+        )
+
+    try:
+        yield request.param, cur
+    finally:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cur.execute("DELETE FROM auth.users WHERE id = ANY(%s::UUID[])", (USER_IDS,))
+        conn.close()
+
+
+def test_sql_engine_matches_python_engine(damage_db):
+    upto, cur = damage_db
+    python_report, _, _ = run_python_engine()
+
+    cur.execute("SELECT apply_daily_damage(%s, %s, FALSE)", (RUN_ID, NOW))
+    sql_report = cur.fetchone()[0]
+
+    cur.execute("SELECT id::TEXT, hp, status, care_score FROM pets")
+    rows = {pet_id: (hp, status, care_score) for pet_id, hp, status, care_score in cur.fetchall()}
+    cur.execute("SELECT id::TEXT FROM tasks")
+    remaining = {task_id for (task_id,) in cur.fetchall()}
+
+    assert {pet_id: (hp, status) for pet_id, (hp, status, _) in rows.items()} == EXPECTED_PETS
+    assert {task_id for task_id, *_ in TASKS} - remaining == EXPECTED_DELETED
+    assert compare_damage_reports(python_report, sql_report) == []
+
+    # ダメージは care_score を変えない。014 以降は NULL の行（014 より前の行）を、
+    # スナップショット（pet_state）と同じ既定値 50 にそろえる
+    damaged = {_uuid(1), _uuid(2), _uuid(3), _uuid(5)}
+    expected_care = {
+        pet_id: 50.0 if care is None and upto >= "014" and pet_id in damaged else care
+        for pet_id, *_, care in PETS
+    }
+    assert {pet_id: rows[pet_id][2] for pet_id, *_ in PETS} == expected_care
+
+    if upto >= "014":
+        # ダメージを受けたペットごとに overdue_damage が1件ずつ追記される
+        cur.execute("SELECT pet_id::TEXT, type, data->>'run_id' FROM pet_events ORDER BY pet_id")
+        assert cur.fetchall() == [
+            (detail_pet, "overdue_damage", RUN_ID) for detail_pet in sorted(damaged)
+        ]
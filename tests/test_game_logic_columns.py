@@ -0,0 +1,101 @@
+"""
+game_logic の列指向API とスカラー版の一致確認
+
+calculate_time_decay_columns / calculate_evolution_columns / update_care_score_columns と
+score_population が、行ごとに calculate_time_decay / calculate_evolution / update_care_score を
+適用した結果と（浮動小数点の値まで）完全に一致することを確かめる。
+"""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+from app.services.game_logic import (
+    CARE_EVENT_VALUES,
+    calculate_evolution,
+    calculate_evolution_columns,
+    calculate_time_decay,
+    calculate_time_decay_columns,
+    pets_to_columns,
+    score_population,
+    update_care_score,
+    update_care_score_columns,
+)
+
+NOW = datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+
+
+def make_pets(n: int, seed: int = 4):
+    rng = random.Random(seed)
+    pets = []
+    for i in range(n):
+        last_checked = NOW - timedelta(microseconds=rng.randrange(-3_600_000_000, 200 * 3_600_000_000))
+        born_at = NOW - timedelta(microseconds=rng.randrange(0, 20 * 86_400_000_000))
+        pet = {
+            "id": str(i),
+            "status": rng.choice(["ALIVE", "ALIVE", "ALIVE", "DEAD"]),
+            "hp": rng.uniform(0, 100),
+            "max_hp": rng.choice([100.0, 120.0]),
+            "hunger": rng.uniform(0, 100),
+            "mood": rng.uniform(0, 100),
+            "care_score": rng.uniform(0, 100),
+            "evolution_stage": rng.randrange(0, 5),
+            "evolution_path": rng.choice([None, "light", "dark"]),
+            "last_checked_at": last_checked.isoformat().replace("+00:00", rng.choice(["Z", "+00:00"])),
+            "born_at": born_at.isoformat(),
+        }
+        # タイムスタンプなし・パース不能の行も混ぜる
+        if i % 17 == 0:
+            pet["last_checked_at"] = None
+        if i % 23 == 0:
+            pet["born_at"] = "not-a-date"
+        pets.append(pet)
+    return pets
+
+
+def test_time_decay_columns_match_scalar():
+    pets = make_pets(500)
+    cols = pets_to_columns(pets)
+    out = calculate_time_decay_columns(
+        cols["status"], cols["hp"], cols["max_hp"], cols["hunger"], cols["mood"], cols["last_checked_at"], now=NOW,
+    )
+    for i, pet in enumerate(pets):
+        expected = calculate_time_decay(pet, now=NOW)
+        assert out["status"][i] == expected["status"]
+        assert out["hp"][i] == float(expected["hp"])
+        assert out["hunger"][i] == float(expected["hunger"])
+        assert out["mood"][i] == float(expected["mood"])
+
+
+def test_evolution_columns_match_scalar():
+    pets = make_pets(500)
+    cols = pets_to_columns(pets)
+    out = calculate_evolution_columns(
+        cols["born_at"], cols["care_score"], cols["evolution_stage"], cols["evolution_path"], now=NOW,
+    )
+    for i, pet in enumerate(pets):
+        expected = calculate_evolution(pet, now=NOW)
+        assert out["evolution_stage"][i] == expected["evolution_stage"]
+        assert out["evolution_path"][i] == expected["evolution_path"]
+
+
+def test_care_score_columns_match_scalar():
+    rng = random.Random(7)
+    scores = [rng.uniform(0, 100) for _ in range(200)]
+    events = [rng.choice(list(CARE_EVENT_VALUES) + ["unknown"]) for _ in scores]
+
+    assert list(update_care_score_columns(scores, events)) == [
+        update_care_score(score, event) for score, event in zip(scores, events)
+    ]
+    assert list(update_care_score_columns(scores, "task_complete")) == [
+        update_care_score(score, "task_complete") for score in scores
+    ]
+
+
+def test_score_population_matches_scalar_pipeline():
+    pets = make_pets(300, seed=11)
+    out = score_population(pets, now=NOW)
+    for i, pet in enumerate(pets):
+        expected = calculate_evolution(calculate_time_decay(pet, now=NOW), now=NOW)
+        assert (out["status"][i], out["hp"][i], out["evolution_stage"][i], out["evolution_path"][i]) == (
+            expected["status"], float(expected["hp"]), expected["evolution_stage"], expected["evolution_path"],
+        )
@@ -0,0 +1,104 @@
+"""
+日次習慣の完了ビットマップ（app.services.habit_bitmap）
+
+ローカル日番号の境界（UTC オフセット）、ビット列のずらし・記録・取り消し、ストリーク・達成率・
+カレンダーを、日付の集合で素直に数えた結果と比べて確かめる。
+"""
+
+import random
+from datetime import datetime, timezone
+
+from app.services.habit_bitmap import (
+    HISTORY_DAYS,
+    calendar,
+    clear_day,
+    completion_rate,
+    current_streak,
+    day_start,
+    day_to_date,
+    decode_bits,
+    encode_bits,
+    is_completed,
+    last_completed_day,
+    local_day,
+    set_day,
+)
+
+TODAY = local_day(datetime(2026, 1, 10, 12, 0, tzinfo=timezone.utc))
+
+
+def test_local_day_uses_utc_offset_for_day_boundary():
+    late_utc = datetime(2026, 1, 9, 15, 30, tzinfo=timezone.utc)  # JST 1/10 00:30
+
+    assert day_to_date(local_day(late_utc)).isoformat() == "2026-01-10"
+    assert day_to_date(local_day(late_utc, utc_offset_minutes=0)).isoformat() == "2026-01-09"
+    assert day_to_date(local_day(late_utc, utc_offset_minutes=-300)).isoformat() == "2026-01-09"
+    # tzinfo なしは UTC とみなす
+    assert local_day(late_utc.replace(tzinfo=None), 0) == local_day(late_utc, 0)
+    assert day_start(local_day(late_utc)) == datetime(2026, 1, 9, 15, 0, tzinfo=timezone.utc)
+
+
+def test_encode_decode_round_trip():
+    bits = (1 << 0) | (1 << 9) | (1 << (HISTORY_DAYS - 1))
+
+    encoded = encode_bits(bits)
+
+    assert encoded.startswith("\\x")
+    assert decode_bits(encoded) == bits
+    assert decode_bits(bytes.fromhex(encoded[2:])) == bits
+    assert decode_bits(None) == 0 and encode_bits(0) == "\\x"
+    # 保持期間より古いビットは捨てる
+    assert decode_bits(encode_bits(1 << HISTORY_DAYS)) == 0
+
+
+def record(days):
+    bits, anchor = 0, None
+    for day in days:
+        bits, anchor = set_day(bits, anchor, day)
+    return bits, anchor
+
+
+def test_set_and_clear_in_any_order_match_a_set_of_days():
+    rng = random.Random(24)
+    days = rng.sample(range(TODAY - 60, TODAY + 1), 25)
+    bits, anchor = record(days)
+
+    assert anchor == max(days)
+    for day in range(TODAY - 70, TODAY + 2):
+        assert is_completed(bits, anchor, day) == (day in days)
+    assert last_completed_day(bits, anchor) == max(days)
+
+    removed = days[:5]
+    for day in removed:
+        bits, anchor = clear_day(bits, anchor, day)
+    kept = set(days) - set(removed)
+    assert {d for d in range(TODAY - 70, TODAY + 1) if is_completed(bits, anchor, d)} == kept
+
+
+def test_days_older_than_history_are_dropped():
+    bits, anchor = record([TODAY - HISTORY_DAYS, TODAY])
+
+    assert not is_completed(bits, anchor, TODAY - HISTORY_DAYS)
+    # anchor より保持期間以上古い日は記録しない
+    assert set_day(bits, anchor, TODAY - HISTORY_DAYS) == (bits, anchor)
+
+
+def test_streak_counts_back_from_today_or_yesterday():
+    bits, anchor = record([TODAY - 5, TODAY - 3, TODAY - 2, TODAY - 1])
+
+    # 今日はまだ: 昨日からの連続
+    assert current_streak(bits, anchor, TODAY) == 3
+    bits, anchor = set_day(bits, anchor, TODAY)
+    assert current_streak(bits, anchor, TODAY) == 4
+    # 2日空くと途切れる
+    assert current_streak(bits, anchor, TODAY + 2) == 0
+    assert current_streak(0, None, TODAY) == 0
+
+
+def test_completion_rate_and_calendar():
+    done = {TODAY, TODAY - 1, TODAY - 4, TODAY - 20}
+    bits, anchor = record(sorted(done))
+
+    assert completion_rate(bits, anchor, TODAY, 7) == round(3 / 7, 4)
+    assert completion_rate(bits, anchor, TODAY, 30) == round(4 / 30, 4)
+    assert calendar(bits, anchor, TODAY, 7) == [TODAY - 6 + i in done for i in range(7)]
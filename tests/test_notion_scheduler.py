@@ -0,0 +1,100 @@
+"""
+Notion API のレート制限スケジューラ（app.services.notion_scheduler）
+
+トークンバケットの払い出し・キーごとのラウンドロビン・429 の Retry-After による一時停止を確かめる。
+払い出しは _dispatch(now) に時刻を渡して確かめる（実際に待たない）。
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from app.services.notion_scheduler import NotionScheduler, _Ticket, parse_retry_after
+
+
+def make_scheduler(**overrides) -> NotionScheduler:
+    options = dict(rate_per_second=2.0, burst=3, max_retries=2, backoff_base_seconds=0.001, backoff_max_seconds=0.01)
+    options.update(overrides)
+    return NotionScheduler(**options)
+
+
+def enqueue(scheduler: NotionScheduler, *keys: str):
+    tickets = [_Ticket(key, 0.0) for key in keys]
+    for ticket in tickets:
+        scheduler._enqueue(ticket)
+    return tickets
+
+
+def test_token_bucket_refills_at_rate_and_round_robins_keys():
+    scheduler = make_scheduler()
+    start = scheduler._refilled_at
+    tickets = enqueue(scheduler, "bulk", "bulk", "bulk", "bulk", "other")
+
+    # バースト分（3件）はすぐに渡る。大量に待っている "bulk" の間に "other" が入る
+    delay = scheduler._dispatch(start)
+    assert [t.key for t in tickets if t.granted] == ["bulk", "bulk", "other"]
+    assert delay == 0.5  # 1トークン / 2 rps
+
+    assert scheduler._dispatch(start + 0.25) == 0.25
+    assert sum(t.granted for t in tickets) == 3
+    assert scheduler._dispatch(start + 0.5) == 0.5
+    assert sum(t.granted for t in tickets) == 4
+    assert scheduler._dispatch(start + 1.0) is None
+    assert all(t.granted for t in tickets)
+    assert scheduler.stats()["max_queue_depth"] == 5
+
+
+def test_throttle_pauses_the_whole_bucket_for_retry_after():
+    scheduler = make_scheduler()
+    response = httpx.Response(429, headers={"Retry-After": "2"})
+
+    scheduler._throttle(response, attempt=0)
+    (ticket,) = enqueue(scheduler, "user-1")
+    delay = scheduler._dispatch(time.monotonic())
+
+    assert not ticket.granted
+    assert 1.9 < delay <= 2.0
+    assert scheduler.throttled == 1
+    # 止まっている間は払い出さず、Retry-After を過ぎたら渡す
+    assert scheduler._dispatch(scheduler._paused_until - 0.01) is not None
+    assert not ticket.granted
+    assert scheduler._dispatch(scheduler._paused_until) is None
+    assert ticket.granted
+
+
+def test_parse_retry_after():
+    now = datetime(2026, 1, 10, 0, 0, tzinfo=timezone.utc)
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after("Sat, 10 Jan 2026 00:00:30 GMT", now=now) == 30.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_asend_waits_out_429_then_returns_response():
+    scheduler = make_scheduler(rate_per_second=100.0)
+    responses = [httpx.Response(429, headers={"Retry-After": "0.05"}), httpx.Response(200)]
+
+    async def send():
+        return responses.pop(0)
+
+    started = time.monotonic()
+    response = asyncio.run(scheduler.asend(send, key="user-1"))
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.05
+    assert (scheduler.requests, scheduler.throttled, scheduler.retries) == (2, 1, 1)
+
+
+def test_asend_returns_last_response_after_max_retries():
+    scheduler = make_scheduler(rate_per_second=100.0, max_retries=1)
+
+    async def send():
+        return httpx.Response(503)
+
+    response = asyncio.run(scheduler.asend(send))
+
+    assert response.status_code == 503
+    assert (scheduler.requests, scheduler.retries, scheduler.exhausted) == (2, 1, 1)
@@ -0,0 +1,101 @@
+"""
+Notion webhook のキュー（app.services.notion_webhook.NotionWebhookQueue）
+
+tasks から消すのは page.deleted か、アーカイブ・ゴミ箱に入ったと確認できたページだけで、
+取得できなかったページは消さずにキューに戻し、上限回数を超えたら諦めることを確かめる。
+"""
+
+import asyncio
+
+from fake_postgrest import FakePostgrest
+
+from app.services.notion_webhook import WEBHOOK_MAX_FETCH_ATTEMPTS, NotionWebhookQueue
+
+DATABASE_ID = "db-1"
+
+
+class FakeNotion:
+    def __init__(self, pages):
+        self.pages = pages
+        self.fetched = []
+
+    async def aget_page(self, page_id, user_id=None):
+        self.fetched.append(page_id)
+        return self.pages.get(page_id)
+
+
+def page(page_id, **extra):
+    return {
+        "id": page_id,
+        "parent": {"type": "database_id", "database_id": DATABASE_ID},
+        "last_edited_time": "2026-01-10T00:00:00.000Z",
+        "properties": {"Name": {"type": "title", "title": [{"plain_text": page_id}]}},
+        **extra,
+    }
+
+
+def event(page_id, type_="page.properties_updated", timestamp="2026-01-10T00:00:00Z"):
+    return {"type": type_, "timestamp": timestamp, "entity": {"type": "page", "id": page_id}}
+
+
+def make_client():
+    client = FakePostgrest({
+        "tasks": [
+            {"id": f"task-{p}", "user_id": "user-1", "notion_page_id": p, "completed": False}
+            for p in ("gone", "archived", "missing")
+        ],
+        "notion_sync_state": [{"user_id": "user-1", "database_id": DATABASE_ID}],
+    })
+    client.rpcs["upsert_notion_tasks"] = lambda params: [
+        {"id": f"task-{r['notion_page_id']}", "user_id": r["user_id"], "notion_page_id": r["notion_page_id"]}
+        for r in params["p_rows"]
+    ]
+    return client
+
+
+def test_only_confirmed_deletions_remove_tasks():
+    client = make_client()
+    notion = FakeNotion({"archived": page("archived", archived=True), "new": page("new")})
+    queue = NotionWebhookQueue(coalesce_seconds=0.0)
+    queue.add(event("gone", "page.deleted"))
+    for page_id in ("archived", "missing", "new"):
+        queue.add(event(page_id))
+
+    result = asyncio.run(queue.flush(client, notion))
+
+    assert result["deleted"] == 2
+    assert result["upserted"] == 1
+    assert result["requeued"] == 1
+    # 取得できなかったページのタスクは残り、キューに戻る
+    assert [t["notion_page_id"] for t in client.tables["tasks"]] == ["missing"]
+    assert queue.pending() == 1
+    assert client.calls[0][1]["p_rows"][0]["notion_page_id"] == "new"
+
+
+def test_unfetchable_page_is_dropped_after_max_attempts():
+    client = make_client()
+    notion = FakeNotion({})
+    queue = NotionWebhookQueue(coalesce_seconds=0.0)
+    queue.add(event("missing"))
+
+    for _ in range(WEBHOOK_MAX_FETCH_ATTEMPTS - 1):
+        assert asyncio.run(queue.flush(client, notion))["requeued"] == 1
+    result = asyncio.run(queue.flush(client, notion))
+
+    assert result == {"pages": 1, "upserted": 0, "deleted": 0, "unrouted": 0, "requeued": 0, "dropped": 1}
+    assert notion.fetched == ["missing"] * WEBHOOK_MAX_FETCH_ATTEMPTS
+    assert queue.pending() == 0
+    assert len(client.tables["tasks"]) == 3
+
+
+def test_flush_when_due_stops_after_requeue():
+    client = make_client()
+    notion = FakeNotion({})
+    queue = NotionWebhookQueue(coalesce_seconds=0.0)
+    queue.add(event("missing"))
+
+    asyncio.run(queue.flush_when_due(client, notion))
+
+    # 取得し直すのは次の webhook（かシャットダウン時）
+    assert notion.fetched == ["missing"]
+    assert queue.pending() == 1
@@ -0,0 +1,65 @@
+"""
+一覧APIのキーセットページング（app.services.pagination）
+
+カーソルの符号化・復号と、カーソルをたどると (created_at, id) の降順で全行を重複・欠落なく返すことを確かめる。
+"""
+
+import asyncio
+import base64
+
+import pytest
+from fake_postgrest import FakePostgrest
+
+from app.services.pagination import decode_cursor, encode_cursor, fetch_keyset_page, projection
+
+
+def test_cursor_round_trips_and_is_url_safe():
+    row = {"created_at": "2026-01-10T09:00:00.123456+09:00", "id": "9f1c0c3e-0000-4000-8000-00000000ffff"}
+
+    cursor = encode_cursor(row)
+
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor) == (row["created_at"], row["id"])
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"{}").decode(),
+    base64.urlsafe_b64encode(b'["2026-01-10", 5]').decode(),
+    base64.urlsafe_b64encode(b'["a", "b", "c"]').decode(),
+])
+def test_decode_cursor_rejects_malformed_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_projection_always_includes_keyset_columns():
+    assert projection(None, ["title"]) == "*"
+    assert projection("title, id", ["title", "id"]) == "title,id,created_at"
+    with pytest.raises(ValueError):
+        projection("title,secret", ["title"])
+
+
+def test_walking_cursors_returns_every_row_once_in_keyset_order():
+    # created_at が同じ行をまたいでページが切れても、id で順番が決まる
+    rows = [
+        {"id": f"task-{i:02d}", "user_id": "user-1", "created_at": f"2026-01-{10 - i // 3:02d}T00:00:00+00:00"}
+        for i in range(10)
+    ] + [{"id": "other", "user_id": "user-2", "created_at": "2026-01-10T00:00:00+00:00"}]
+    client = FakePostgrest({"tasks": rows})
+
+    pages, cursor = [], None
+    while True:
+        page = asyncio.run(fetch_keyset_page(
+            client, "tasks", lambda q: q.eq("user_id", "user-1"), limit=3, cursor=cursor, count="exact",
+        ))
+        pages.append(page)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    returned = [row["id"] for page in pages for row in page["rows"]]
+    expected = sorted((r for r in rows if r["user_id"] == "user-1"), key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    assert returned == [r["id"] for r in expected]
+    assert [len(page["rows"]) for page in pages] == [3, 3, 3, 1]
+    assert {page["total"] for page in pages} == {10}
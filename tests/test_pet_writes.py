@@ -0,0 +1,121 @@
+"""
+ペット行の compare-and-swap（app.services.pet_writes）
+
+競合したら行を読み直してイベントを適用し直すこと、リトライを使い切ったら
+update_pet_cas は PetWriteConflict、update_pets_cas は exhausted に入れることを確かめる。
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fake_postgrest import FakePostgrest
+
+from app.services import pet_writes
+from app.services.pet_writes import PetWriteConflict, PetWriteStats, update_pet_cas, update_pets_cas
+
+NOW = datetime(2026, 1, 10, 0, 0, tzinfo=timezone.utc)
+DAMAGE = [{"type": "overdue_damage", "at": NOW.isoformat(), "damage": 10.0}]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pet_writes, "CAS_BACKOFF_BASE_SECONDS", 0.0)
+    monkeypatch.setattr(pet_writes, "pet_write_stats", PetWriteStats())
+
+
+def make_client(losing: int = 0) -> FakePostgrest:
+    """
+    pets に1匹（別の書き込みが先に入って version=1, hp=80）
+
+    append_pet_events / update_pets_cas は version が一致すれば書き込む。
+    losing 回目までの呼び出しは、その直前に別の書き込みが入ったことにして競合させる。
+    """
+    client = FakePostgrest({
+        "pets": [{"id": "pet-1", "user_id": "user-1", "hp": 80.0, "status": "ALIVE", "version": 1}],
+    })
+    state = {"calls": 0}
+
+    def write(pet_id, version, changes):
+        row = next((p for p in client.tables["pets"] if p["id"] == pet_id), None)
+        state["calls"] += 1
+        if row is not None and state["calls"] <= losing:
+            row["version"] += 1
+        if row is None or row["version"] != version:
+            return None
+        row.update(changes, version=row["version"] + 1)
+        return dict(row)
+
+    client.rpcs["append_pet_events"] = lambda p: write(p["p_pet_id"], p["p_version"], p["p_state"])
+    client.rpcs["update_pets_cas"] = lambda p: [
+        row for row in (
+            write(u["id"], u["version"], {"hp": u["hp"], "status": u["status"]}) for u in p["p_updates"]
+        ) if row is not None
+    ]
+    return client
+
+
+def test_update_pet_cas_reapplies_events_to_the_fresh_row():
+    client = make_client()
+    stale = {"id": "pet-1", "user_id": "user-1", "hp": 100.0, "status": "ALIVE", "version": 0}
+
+    row = asyncio.run(update_pet_cas(client, stale, lambda pet: DAMAGE, writer="test"))
+
+    # 読み直した hp=80 にダメージを適用する（古い hp=100 からの 90 で上書きしない）
+    assert row["hp"] == 70.0 and row["version"] == 2
+    assert [name for name, _ in client.calls] == ["append_pet_events", "append_pet_events"]
+    stats = pet_writes.pet_write_stats.stats()
+    assert stats["conflicts"] == 1 and stats["retries_histogram"] == {"1": 1}
+
+
+def test_update_pet_cas_raises_after_max_retries():
+    client = make_client(losing=10)
+    pet = dict(client.tables["pets"][0])
+
+    with pytest.raises(PetWriteConflict):
+        asyncio.run(update_pet_cas(client, pet, lambda p: DAMAGE, writer="test", max_retries=2))
+
+    assert len(client.calls) == 3
+    assert client.tables["pets"][0]["hp"] == 80.0
+    assert pet_writes.pet_write_stats.stats()["exhausted"] == 1
+
+
+def test_update_pet_cas_skips_deleted_pet_and_none_events():
+    client = make_client()
+    gone = {"id": "pet-gone", "hp": 100.0, "status": "ALIVE", "version": 0}
+
+    assert asyncio.run(update_pet_cas(client, gone, lambda p: DAMAGE, writer="test")) is None
+    assert asyncio.run(update_pet_cas(client, dict(client.tables["pets"][0]), lambda p: None, writer="test")) is None
+    assert client.tables["pets"][0]["version"] == 1
+
+
+def damage_update(pet):
+    return {"id": pet["id"], "version": pet["version"], "hp": pet["hp"] - 10.0, "status": "ALIVE"}
+
+
+def test_update_pets_cas_recomputes_conflicts():
+    client = make_client()
+    stale = {"id": "pet-1", "hp": 100.0, "version": 0}
+
+    result = asyncio.run(update_pets_cas(
+        client, [damage_update(stale)], damage_update, writer="test", columns="*",
+    ))
+
+    assert result["written"]["pet-1"]["hp"] == 70.0
+    assert result["skipped"] == [] and result["exhausted"] == []
+
+
+def test_update_pets_cas_reports_exhausted_and_skipped():
+    client = make_client(losing=10)
+    pet = dict(client.tables["pets"][0])
+
+    exhausted = asyncio.run(update_pets_cas(
+        client, [damage_update(pet)], damage_update, writer="test", columns="*", max_retries=2,
+    ))
+    skipped = asyncio.run(update_pets_cas(
+        client, [damage_update(pet)], lambda fresh: None, writer="test", columns="*",
+    ))
+
+    assert exhausted == {"written": {}, "skipped": [], "exhausted": ["pet-1"]}
+    assert skipped == {"written": {}, "skipped": ["pet-1"], "exhausted": []}
+    assert client.tables["pets"][0]["hp"] == 80.0
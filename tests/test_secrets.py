@@ -0,0 +1,141 @@
+"""
+Secrets Manager のキャッシュ（app.core.secrets）
+
+/tmp のキャッシュファイルは、自分が所有しパーミッションが 0600 の通常ファイルのときだけ読むこと、
+TTL 内はキャッシュだけで解決し、TTL 切れはキャッシュの値を返しつつ取り直すこと、
+BatchGetSecretValue が使えない・一部取れない場合に GetSecretValue で補うことを確かめる。
+"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.core import secrets
+
+ARN = "arn:aws:secretsmanager:ap-northeast-1:000000000000:secret:supabase"
+OTHER_ARN = "arn:aws:secretsmanager:ap-northeast-1:000000000000:secret:notion"
+
+
+def write_cache(path, values, fetched_at=None, mode=0o600):
+    path.write_text(json.dumps({"fetched_at": fetched_at or 0, "values": values}), encoding="utf-8")
+    os.chmod(path, mode)
+
+
+def test_read_cache_accepts_own_0600_file(tmp_path):
+    path = tmp_path / "secrets.json"
+    secrets._write_cache(str(path), {ARN: "value"})
+
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert secrets._read_cache(str(path))["values"] == {ARN: "value"}
+
+
+def test_read_cache_ignores_loose_permissions(tmp_path):
+    path = tmp_path / "secrets.json"
+    write_cache(path, {ARN: "planted"}, mode=0o644)
+
+    assert secrets._read_cache(str(path)) is None
+
+
+def test_read_cache_ignores_files_owned_by_someone_else(tmp_path, monkeypatch):
+    path = tmp_path / "secrets.json"
+    write_cache(path, {ARN: "planted"})
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(path).st_uid + 1)
+
+    assert secrets._read_cache(str(path)) is None
+
+
+def test_read_cache_ignores_symlinks_and_fifos(tmp_path):
+    target = tmp_path / "target.json"
+    write_cache(target, {ARN: "planted"})
+    link = tmp_path / "link.json"
+    link.symlink_to(target)
+    fifo = tmp_path / "fifo.json"
+    os.mkfifo(fifo)
+
+    assert secrets._read_cache(str(link)) is None
+    # FIFO を開いても書き手を待って止まらない
+    assert secrets._read_cache(str(fifo)) is None
+
+
+class FakeSecretsClient:
+    """batch_get_secret_value / get_secret_value だけの Secrets Manager クライアント"""
+
+    def __init__(self, values, batch_denied=False, batch_missing=()):
+        self.values = values
+        self.batch_denied = batch_denied
+        self.batch_missing = set(batch_missing)
+        self.calls = []
+
+    def batch_get_secret_value(self, SecretIdList):
+        self.calls.append(("batch", tuple(SecretIdList)))
+        if self.batch_denied:
+            raise ClientError({"Error": {"Code": "AccessDeniedException"}}, "BatchGetSecretValue")
+        return {"SecretValues": [
+            {"ARN": arn, "SecretString": self.values[arn]} for arn in SecretIdList if arn not in self.batch_missing
+        ]}
+
+    def get_secret_value(self, SecretId):
+        self.calls.append(("get", SecretId))
+        if SecretId not in self.values:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException"}}, "GetSecretValue")
+        return {"SecretString": self.values[SecretId]}
+
+
+@pytest.fixture
+def fake_client(monkeypatch, tmp_path):
+    monkeypatch.setenv("SECRETS_CACHE_PATH", str(tmp_path / "secrets.json"))
+    monkeypatch.setenv("SECRETS_CACHE_TTL_SECONDS", "300")
+    client = FakeSecretsClient({ARN: "fresh-supabase", OTHER_ARN: "fresh-notion"})
+    monkeypatch.setattr(secrets, "secrets_client", lambda: client)
+    return client
+
+
+def test_fetch_falls_back_to_get_secret_value(fake_client):
+    fake_client.batch_denied = True
+
+    assert secrets.fetch_secrets([ARN, OTHER_ARN]) == {ARN: "fresh-supabase", OTHER_ARN: "fresh-notion"}
+    assert sorted(kind for kind, _ in fake_client.calls) == ["batch", "get", "get"]
+
+
+def test_fetch_gets_only_what_the_batch_missed(fake_client):
+    fake_client.batch_missing = {OTHER_ARN}
+
+    assert secrets.fetch_secrets([ARN, OTHER_ARN])[OTHER_ARN] == "fresh-notion"
+    assert fake_client.calls == [("batch", (OTHER_ARN, ARN)), ("get", OTHER_ARN)]
+
+    fake_client.values.pop(OTHER_ARN)
+    with pytest.raises(RuntimeError):
+        secrets.fetch_secrets([ARN, OTHER_ARN])
+
+
+def test_resolve_uses_fresh_cache_without_network(fake_client, tmp_path):
+    write_cache(tmp_path / "secrets.json", {ARN: "cached"}, fetched_at=time.time())
+
+    assert secrets.resolve_secrets([ARN]) == {ARN: "cached"}
+    assert fake_client.calls == []
+
+
+def test_resolve_fetches_and_writes_cache_when_an_arn_is_missing(fake_client, tmp_path):
+    write_cache(tmp_path / "secrets.json", {ARN: "cached"}, fetched_at=time.time())
+
+    assert secrets.resolve_secrets([ARN, OTHER_ARN]) == {ARN: "fresh-supabase", OTHER_ARN: "fresh-notion"}
+    assert secrets._read_cache(str(tmp_path / "secrets.json"))["values"][OTHER_ARN] == "fresh-notion"
+
+
+def test_resolve_returns_stale_cache_and_refreshes_in_background(fake_client, tmp_path):
+    write_cache(tmp_path / "secrets.json", {ARN: "stale"}, fetched_at=time.time() - 3600)
+    refreshed = threading.Event()
+    received = {}
+
+    def on_refresh(values):
+        received.update(values)
+        refreshed.set()
+
+    assert secrets.resolve_secrets([ARN], on_refresh=on_refresh) == {ARN: "stale"}
+    assert refreshed.wait(5)
+    assert received == {ARN: "fresh-supabase"}
+    assert secrets._read_cache(str(tmp_path / "secrets.json"))["values"] == {ARN: "fresh-supabase"}
@@ -0,0 +1,73 @@
+"""
+ペットへのイベントの書き込みバッファ（app.services.write_behind.PetEventBuffer）
+
+書き込みに失敗したペットのイベントがバッファに戻り、書き込み中に届いたイベントより前に並ぶこと、
+次の flush でまとめて書き込まれることを確かめる。
+"""
+
+import asyncio
+from datetime import datetime, timezone
+
+from app.services import write_behind
+from app.services.write_behind import PetEventBuffer
+
+NOW = datetime(2026, 1, 10, 0, 0, tzinfo=timezone.utc)
+PET = {"id": "pet-1", "user_id": "user-1", "hp": 100.0, "status": "ALIVE", "version": 0}
+
+
+def damage(n: int):
+    return {"type": "overdue_damage", "at": NOW.isoformat(), "damage": float(n)}
+
+
+def test_failed_write_is_requeued_before_newer_events(monkeypatch):
+    buffer = PetEventBuffer(coalesce_seconds=60.0, max_pending=100)
+    writes = []
+
+    async def flaky_update_pet_cas(client, pet, events_for, writer, max_retries=None):
+        events = list(events_for(pet))
+        if not writes:
+            writes.append(None)
+            # 書き込み中に次のイベントが届いてから失敗する
+            await buffer.submit(None, PET, damage(3))
+            raise RuntimeError("connection reset")
+        writes.append(events)
+        return pet
+
+    monkeypatch.setattr(write_behind, "update_pet_cas", flaky_update_pet_cas)
+
+    async def scenario():
+        row = await buffer.submit(None, PET, damage(1))
+        assert row["hp"] == 99.0
+        row = await buffer.submit(None, PET, damage(2))
+        assert row["hp"] == 97.0
+
+        assert await buffer.flush(None, force=True) == 0
+        assert buffer.failures == 1
+        assert buffer.pending_events() == 3
+        # まだ書き込めていないイベントも読み取りに反映される
+        assert buffer.preview(PET)["hp"] == 94.0
+
+        assert await buffer.flush(None, force=True) == 1
+
+    asyncio.run(scenario())
+
+    assert [e["damage"] for e in writes[1]] == [1.0, 2.0, 3.0]
+    assert buffer.pending() == 0
+    assert buffer.stats()["writes"] == 1
+
+
+def test_disabled_buffer_writes_immediately(monkeypatch):
+    buffer = PetEventBuffer(coalesce_seconds=0.0, max_pending=100)
+    calls = []
+
+    async def fake_update_pet_cas(client, pet, events_for, writer, max_retries=None):
+        calls.append((writer, events_for(pet)))
+        return {**pet, "hp": 95.0}
+
+    monkeypatch.setattr(write_behind, "update_pet_cas", fake_update_pet_cas)
+
+    row = asyncio.run(buffer.submit(None, PET, damage(5)))
+
+    assert row["hp"] == 95.0
+    assert calls == [("overdue_damage", [damage(5)])]
+    assert buffer.pending() == 0